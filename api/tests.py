@@ -1,3 +1,196 @@
-from django.test import TestCase
+import json
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from benchmarks.registry import VERSIONS, FakeRegistry
+from core.jobs import claim_scan, run_scan
+from core.models import ScanRequest
+from scanners.cache import get_metadata_cache
+
+
+PACKAGE_JSON = json.dumps({'dependencies': {'left-pad': '*', 'right-pad': '^1.0.0'}})
+PACKAGE_LOCK = json.dumps({
+    'lockfileVersion': 3,
+    'packages': {
+        '': {'name': 'app'},
+        'node_modules/left-pad': {'version': '1.0.0'},
+        'node_modules/right-pad': {'version': '1.1.0'},
+        'node_modules/right-pad/node_modules/left-pad': {'version': '2.0.0'},
+    },
+})
+
+
+class RegistryTestCase(TestCase):
+    """Tests against a local stand-in npm registry"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.registry = FakeRegistry().start()
+        cls.addClassCleanup(cls.registry.stop)
+        settings = override_settings(
+            NPM_REGISTRY_URL=cls.registry.url,
+            NPM_DOWNLOADS_URL=cls.registry.downloads_url,
+            SCANNER_HTTP={'CACHE': False},
+            SCAN_ASYNC_WORKERS=0,
+        )
+        settings.enable()
+        cls.addClassCleanup(settings.disable)
+
+    def setUp(self):
+        get_metadata_cache().clear()
+
+    def scan(self, content, **data):
+        return self.client.post('/api/scan/file/', dict(data, content=content), content_type='application/json')
+
+
+class ScanFileViewTests(RegistryTestCase):
+    def test_scan(self):
+        response = self.scan(PACKAGE_JSON)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['packages_scanned'], 2)
+        self.assertEqual(
+            sorted((r['package'], r['version']) for r in data['results']),
+            [('left-pad', VERSIONS[-1]), ('right-pad', '1.2.0')],
+        )
+        self.assertEqual(data['summary']['incomplete_packages'], 0)
+        self.assertEqual(data['metrics']['stages']['parse']['calls'], 1)
+
+        report = self.client.get(data['report_url'] + '/').json()
+        self.assertEqual(report['status'], 'completed')
+        self.assertEqual(report['total_packages'], 2)
+
+    def test_lockfile_versions_are_reported_separately(self):
+        data = self.scan(PACKAGE_LOCK, filename='package-lock.json').json()
+        expected = [('left-pad', '1.0.0'), ('left-pad', '2.0.0'), ('right-pad', '1.1.0')]
+        self.assertEqual(sorted((r['package'], r['version']) for r in data['results']), expected)
+
+        report = self.client.get(data['report_url'] + '/').json()
+        self.assertEqual(sorted((r['package'], r['version']) for r in report['results']), expected)
+
+    def test_locked_version_missing_from_the_registry(self):
+        lock = json.loads(PACKAGE_LOCK)
+        lock['packages']['node_modules/left-pad']['version'] = '0.9.0'
+        for lean in (False, True):
+            with self.subTest(lean=lean), override_settings(NPM_LEAN_METADATA=lean):
+                data = self.scan(json.dumps(lock), filename='package-lock.json').json()
+                results = {(r['package'], r['version']): r for r in data['results']}
+                self.assertTrue(results['left-pad', '0.9.0']['incomplete'])
+                self.assertIn('0.9.0', results['left-pad', '0.9.0']['error'])
+                self.assertFalse(results['left-pad', '2.0.0']['incomplete'])
+                self.assertEqual(data['summary']['incomplete_packages'], 1)
+                self.assertNotIn('deduplicated', data)
+
+    def test_uploaded_file(self):
+        response = self.client.post('/api/scan/file/', {
+            'file': SimpleUploadedFile('package-lock.json', PACKAGE_LOCK.encode()),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['packages_scanned'], 3)
+
+    def test_repeat_submissions_reuse_the_scan(self):
+        first = self.scan(PACKAGE_JSON).json()
+        requests = self.registry.requests
+
+        # Same dependencies, different formatting
+        reformatted = json.dumps(json.loads(PACKAGE_JSON), indent=4)
+        repeat = self.scan(reformatted).json()
+        self.assertTrue(repeat['deduplicated'])
+        self.assertEqual(repeat['duplicate_of'], first['scan_id'])
+        self.assertEqual(repeat['overall_risk_score'], first['overall_risk_score'])
+        self.assertEqual(self.registry.requests, requests)
+
+        response = self.scan(PACKAGE_JSON, **{'async': True})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'completed')
+        report = self.client.get(response.json()['report_url'] + '/').json()
+        self.assertEqual(report['status'], 'completed')
+        self.assertEqual(report['total_packages'], 2)
+
+        self.assertNotIn('deduplicated', self.scan(PACKAGE_JSON, transitive=True).json())
+
+    def test_async_scan(self):
+        response = self.scan(PACKAGE_LOCK, filename='package-lock.json', **{'async': True})
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data['status'], 'queued')
+        self.assertEqual(self.client.get(data['report_url'] + '/').json()['status'], 'pending')
+
+        run_scan(claim_scan(data['scan_id']))
+        report = self.client.get(data['report_url'] + '/').json()
+        self.assertEqual(report['status'], 'completed')
+        self.assertEqual(report['total_packages'], 3)
+        self.assertEqual(ScanRequest.objects.get(id=data['scan_id']).file_content, '')
+
+    def test_incremental_rescan(self):
+        base = self.scan(PACKAGE_LOCK, filename='package-lock.json').json()
+        lock = json.loads(PACKAGE_LOCK)
+        lock['packages']['node_modules/right-pad']['version'] = '1.2.0'
+        rescan = self.scan(json.dumps(lock), filename='package-lock.json', base_scan_id=base['scan_id']).json()
+
+        self.assertEqual(rescan['diff']['unchanged'], 1)
+        self.assertEqual([change['package'] for change in rescan['diff']['changed']], ['right-pad'])
+        self.assertEqual(rescan['packages_scanned'], 3)
+        self.assertEqual(rescan['overall_risk_score'], base['overall_risk_score'])
+
+    def test_invalid_requests(self):
+        cases = [
+            ({'content': ''}, 400),
+            ({'content': PACKAGE_JSON, 'ecosystem': 'cobol'}, 400),
+            ({'content': PACKAGE_JSON, 'filename': 'Makefile'}, 400),
+            ({'content': PACKAGE_JSON, 'base_scan_id': 'not-a-uuid'}, 404),
+            ({'content': PACKAGE_JSON, 'base_scan_id': '00000000-0000-0000-0000-000000000000'}, 404),
+        ]
+        for data, expected in cases:
+            with self.subTest(data=data):
+                response = self.client.post('/api/scan/file/', data, content_type='application/json')
+                self.assertEqual(response.status_code, expected)
+                self.assertIn('error', response.json())
+
+
+class CheckPackagesViewTests(RegistryTestCase):
+    def check(self, packages, **data):
+        return self.client.post('/api/check/packages/', dict(data, packages=packages),
+                                content_type='application/json')
+
+    def test_completed_scans_answer_checks(self):
+        self.scan(PACKAGE_JSON)
+        requests = self.registry.requests
+
+        data = self.check(['left-pad', {'name': 'right-pad', 'version': '1.2.0'}]).json()
+        self.assertEqual([r['source'] for r in data['results']], ['snapshot', 'snapshot'])
+        self.assertEqual(data['results'][0]['resolved_version'], VERSIONS[-1])
+        self.assertEqual(data['snapshot_hits'], 2)
+        self.assertEqual(self.registry.requests, requests)
+
+    def test_missing_packages_are_fetched_once(self):
+        data = self.check(['left-pad', 'left-pad', {'name': 'left-pad', 'version': '1.0.0'}]).json()
+        self.assertEqual(data['fetched'], 3)
+        self.assertEqual([r['resolved_version'] for r in data['results']], [VERSIONS[-1], VERSIONS[-1], '1.0.0'])
+
+        data = self.check(['left-pad']).json()
+        self.assertEqual(data['snapshot_hits'], 1)
+
+    def test_unsupported_ecosystem(self):
+        data = self.check([{'name': 'flask', 'ecosystem': 'cobol'}]).json()
+        self.assertTrue(data['results'][0]['incomplete'])
+        self.assertIn('Unsupported ecosystem', data['results'][0]['error'])
+
+    @override_settings(SCAN_CHECK_MAX_PACKAGES=2)
+    def test_invalid_requests(self):
+        for packages in (None, [], 'left-pad', ['a', 'b', 'c'], [{'version': '1.0.0'}], [42]):
+            with self.subTest(packages=packages):
+                response = self.check(packages)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class ExportViewTests(TestCase):
+    def test_invalid_requests(self):
+        for query in ('', '?format=xml&ecosystem=npm', '?scan_id=nope', '?since=yesterday'):
+            with self.subTest(query=query):
+                response = self.client.get('/api/export/' + query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
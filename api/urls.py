@@ -4,5 +4,13 @@ from . import views
 urlpatterns = [
     path('scan/file/', views.ScanFileView.as_view(), name='scan-file'),
     path('check/package/', views.CheckPackageView.as_view(), name='check-package'),
+    path('check/packages/', views.CheckPackagesView.as_view(), name='check-packages'),
     path('reports/<uuid:scan_id>/', views.ScanReportView.as_view(), name='scan-report'),
+    # ScanResult.report_path: the whole report, streamed
+    path('reports/<uuid:scan_id>.json', views.ScanReportView.as_view(), {'stream': True},
+         name='scan-report-file'),
+    path('export/', views.ExportView.as_view(), name='export'),
+    path('scan/dedup/stats/', views.DedupStatsView.as_view(), name='dedup-stats'),
+    path('cache/stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
@@ -1,14 +1,40 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-from django.utils import timezone
 import json
-
-from core.models import ScanRequest, ScanResult, Package, PackageScanResult
-from core.service import RiskCalculator
+from uuid import UUID
+
+from core.dedup import (
+    clone_scan, dedup_stats, direct_results, find_previous_scan, get_dedup_window, manifest_hash,
+)
+from core.export import CONTENT_TYPES, EXPORT_FORMATS, export_queryset, export_stream, parse_bound
+from core.models import ScanRequest, ScanResult, PackageScanResult
+from core.jobs import enqueue_scan
+from core.pipeline import ScanPipeline
+from core.reports import get_page_size, iter_report, report_page
+from core.service import RiskCalculator, risk_level
+from core.snapshot import check_packages, parse_check_items
 from scanners import ScannerFactory
+from scanners.cache import get_metadata_cache
+from scanners.metrics import ScanMetrics, render_prometheus, span
+from scanners.registry_http import get_http_stats
+
+
+def _is_true(value) -> bool:
+    """Interpret a boolean flag sent as JSON or form data"""
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
 
+def _read_upload(upload) -> str:
+    """Whole text of an uploaded file, even after its chunks were read"""
+    upload.seek(0)
+    return upload.read().decode('utf-8')
 
 
 class ScanFileView(APIView):
@@ -17,94 +43,87 @@ class ScanFileView(APIView):
 
     def post(self, request):
         try:
-            # Get data from request
+            # Get data from request; large lockfiles can be uploaded as "file"
+            upload = request.FILES.get('file')
             file_content = request.data.get('content', '')
-            filename = request.data.get('filename', 'package.json')
+            filename = request.data.get('filename') or (upload.name if upload else 'package.json')
             ecosystem = request.data.get('ecosystem')
+            concurrency = request.data.get('concurrency')
+            transitive = _is_true(request.data.get('transitive'))
+            # Rescan only what changed since an earlier scan of the same manifest
+            base_scan_id = request.data.get('base_scan_id')
 
             if not ecosystem:
                 ecosystem = ScannerFactory.detect_ecosystem(filename)
 
-            if not file_content:
+            if not file_content and upload is None:
                 return Response(
                     {'error': 'No file content provided'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            base_scan = None
+            if base_scan_id:
+                try:
+                    base_scan = ScanRequest.objects.get(id=base_scan_id)
+                except (ScanRequest.DoesNotExist, DjangoValidationError):
+                    return Response(
+                        {'error': 'Base scan not found'},
+                        status=status.HTTP_404_NOT_FOUND
+                    )
+
+            options = {'concurrency': concurrency, 'transitive': transitive}
+            is_async = _is_true(request.data.get('async'))
+            # Also fails fast on ecosystems we cannot scan
+            scanner = ScannerFactory.get_scanner(ecosystem)
+            metrics = ScanMetrics()
+            dependencies = None
+            if is_async:
+                # The worker parses the file itself; this pass only streams it for the hash
+                dedup = self._check_duplicate(
+                    scanner.iter_dependencies(upload.chunks() if upload is not None else file_content),
+                    ecosystem, options,
+                )
+            else:
+                # Parsed once, for the dedup hash and for the scan itself
+                with metrics.activate(), span('parse'):
+                    dependencies = scanner.parse_dependencies(
+                        upload.chunks() if upload is not None else file_content
+                    )
+                dedup = self._check_duplicate(dependencies, ecosystem, options)
+            if dedup.get('dedup_result') == 'hit':
+                return self._reuse(request, filename, ecosystem, dedup, is_async)
+
+            if is_async:
+                if upload is not None:
+                    # Queued scans keep their file in the database until they run
+                    file_content = _read_upload(upload)
+                if base_scan is not None:
+                    options['base_scan_id'] = str(base_scan.id)
+                return self._enqueue(request, filename, ecosystem, file_content, options, dedup)
+
             # Create scan request record
             scan_request = ScanRequest.objects.create(
                 user=request.user if request.user.is_authenticated else None,
                 source='web' if request.user.is_authenticated else 'cli',
                 target=filename,
-                status='processing'
+                ecosystem=ecosystem,
+                status='processing',
+                **dedup
             )
 
-            # Get appropriate scanner
-            scanner = ScannerFactory.get_scanner(ecosystem)
-            dependencies = scanner.parse_dependencies(file_content)
-
-            # Scan each package
-            results = []
-            risk_calculator = RiskCalculator()
-
-            for dep in dependencies[:10]:  # Limit for testing
-                package_info = scanner.get_package_info(dep['name'], dep.get('version_constraint'))
-                risk_score = risk_calculator.calculate_package_risk(package_info)
-
-                # Save or get package from database
-                package, _ = Package.objects.get_or_create(
-                    name=dep['name'],
-                    ecosystem=ecosystem,
-                    defaults={
-                        'version': package_info.get('version'),
-                        'description': package_info.get('description', ''),
-                        'author': package_info.get('author', ''),
-                        'last_updated': timezone.now(),  # Placeholder
-                    }
-                )
-
-                results.append({
-                    'package': dep['name'],
-                    'version': package_info.get('version', 'unknown'),
-                    'version_constraint': dep.get('version_constraint', ''),
-                    'type': dep.get('type', 'dependency'),
-                    'risk_score': float(risk_score),
-                    'has_vulnerabilities': package_info.get('has_vulnerabilities', False),
-                    'is_deprecated': package_info.get('is_deprecated', False),
-                    'details': {
-                        k: v for k, v in package_info.items()
-                        if k not in ['error'] and not isinstance(v, (dict, list))
-                    }
-                })
-
-            # Calculate overall risk
-            overall_risk = sum(r['risk_score'] for r in results) / len(results) if results else 0
-
-            # Create scan result
-            scan_result = ScanResult.objects.create(
-                scan_request=scan_request,
-                overall_risk_score=overall_risk,
-                report_path=f"/api/reports/{scan_request.id}.json"
+            # Fetch, score and store every dependency
+            pipeline = ScanPipeline(
+                scan_request, ecosystem, concurrency=concurrency, transitive=transitive, metrics=metrics
             )
+            if base_scan is not None:
+                scan = pipeline.run_incremental(file_content, base_scan, dependencies)
+            else:
+                scan = pipeline.run(file_content, dependencies)
+            results = scan['results']
+            overall_risk = scan['overall_risk']
 
-            # Save individual package results
-            for result in results:
-                package = Package.objects.get(name=result['package'], ecosystem=ecosystem)
-                PackageScanResult.objects.create(
-                    scan_result=scan_result,
-                    package=package,
-                    risk_score=result['risk_score'],
-                    vulnerabilities_found=1 if result['has_vulnerabilities'] else 0,
-                    is_deprecated=result['is_deprecated'],
-                    raw_data=result['details']
-                )
-
-            # Update scan request status
-            scan_request.status = 'completed'
-            scan_request.completed_at = timezone.now()
-            scan_request.save()
-
-            return Response({
+            response_data = {
                 'status': 'success',
                 'scan_id': str(scan_request.id),
                 'ecosystem': ecosystem,
@@ -113,7 +132,17 @@ class ScanFileView(APIView):
                 'results': results,
                 'summary': self._generate_summary(results),
                 'report_url': f"/api/reports/{scan_request.id}"
-            })
+            }
+            if scan['dependency_graph'] is not None:
+                response_data['dependency_graph'] = scan['dependency_graph']
+                response_data['aggregate_risk'] = scan['dependency_graph']['aggregate']
+            if base_scan is not None:
+                response_data['base_scan_id'] = str(base_scan.id)
+                response_data['diff'] = scan['diff']
+            response_data['metrics'] = scan['scan_result'].metrics
+            response_data['scoring_policy'] = scan['scan_result'].scoring_policy
+
+            return Response(response_data)
 
         except ValueError as e:
             return Response(
@@ -126,18 +155,102 @@ class ScanFileView(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _check_duplicate(self, dependencies, ecosystem, options):
+        """Dedup fields for a new scan request: its content hash and any fresh earlier scan"""
+        if not get_dedup_window():
+            return {}
+        try:
+            content_hash = manifest_hash(dependencies, ecosystem, options)
+        except ValueError:
+            # Unparseable content is left to the scan itself
+            return {}
+
+        previous, fresh = find_previous_scan(content_hash)
+        if previous is None:
+            return {'content_hash': content_hash, 'dedup_result': 'miss'}
+        if not fresh:
+            return {'content_hash': content_hash, 'dedup_result': 'expired'}
+        return {'content_hash': content_hash, 'dedup_result': 'hit', 'duplicate_of': previous}
+
+    def _reuse(self, request, filename, ecosystem, dedup, is_async=False):
+        """Answer a repeat submission by cloning the earlier scan's results
+
+        An async submission gets the same 202 answer as a queued scan, with
+        status "completed": its report is ready at report_url straight away.
+        """
+        scan_request = ScanRequest.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            source='web' if request.user.is_authenticated else 'cli',
+            target=filename,
+            ecosystem=ecosystem,
+            status='processing',
+            **dedup
+        )
+        scan_result = clone_scan(dedup['duplicate_of'], scan_request)
+        if is_async:
+            return Response({
+                'status': 'completed',
+                'scan_id': str(scan_request.id),
+                'ecosystem': ecosystem,
+                'report_url': f"/api/reports/{scan_request.id}",
+                'deduplicated': True,
+                'duplicate_of': str(dedup['duplicate_of'].id),
+            }, status=status.HTTP_202_ACCEPTED)
+        results = direct_results(scan_result)
+        overall_risk = scan_result.overall_risk_score
+
+        response_data = {
+            'status': 'success',
+            'scan_id': str(scan_request.id),
+            'ecosystem': ecosystem,
+            'packages_scanned': len(results),
+            'overall_risk_score': float(overall_risk) if overall_risk is not None else 0.0,
+            'results': results,
+            'summary': self._generate_summary(results),
+            'report_url': f"/api/reports/{scan_request.id}",
+            'deduplicated': True,
+            'duplicate_of': str(dedup['duplicate_of'].id),
+        }
+        if scan_result.dependency_graph is not None:
+            response_data['dependency_graph'] = scan_result.dependency_graph
+            response_data['aggregate_risk'] = scan_result.dependency_graph.get('aggregate')
+        return Response(response_data)
+
+    def _enqueue(self, request, filename, ecosystem, file_content, options, dedup):
+        """Queue the scan for a background worker and return straight away"""
+        scan_request = ScanRequest.objects.create(
+            user=request.user if request.user.is_authenticated else None,
+            source='web' if request.user.is_authenticated else 'cli',
+            target=filename,
+            ecosystem=ecosystem,
+            file_content=file_content,
+            options=options,
+            status='pending',
+            **dedup
+        )
+        enqueue_scan(scan_request)
+
+        return Response({
+            'status': 'queued',
+            'scan_id': str(scan_request.id),
+            'ecosystem': ecosystem,
+            'report_url': f"/api/reports/{scan_request.id}"
+        }, status=status.HTTP_202_ACCEPTED)
+
     def _generate_summary(self, results):
         """Generate a simple summary"""
         total = len(results)
         risky = sum(1 for r in results if r['risk_score'] > 70)
         vulnerabilities = sum(1 for r in results if r['has_vulnerabilities'])
         deprecated = sum(1 for r in results if r['is_deprecated'])
+        incomplete = sum(1 for r in results if r.get('incomplete'))
 
         return {
             'total_packages': total,
             'risky_packages': risky,
             'packages_with_vulnerabilities': vulnerabilities,
             'deprecated_packages': deprecated,
+            'incomplete_packages': incomplete,
         }
 
 
@@ -173,15 +286,8 @@ class CheckPackageView(APIView):
                 }
             }
 
-            # Add risk level
-            if risk_score >= 80:
-                response_data['risk_level'] = 'CRITICAL'
-            elif risk_score >= 60:
-                response_data['risk_level'] = 'HIGH'
-            elif risk_score >= 40:
-                response_data['risk_level'] = 'MEDIUM'
-            else:
-                response_data['risk_level'] = 'LOW'
+            response_data['risk_level'] = risk_level(risk_score)
+            response_data['scoring_policy'] = risk_calculator.version
 
             return Response(response_data)
 
@@ -197,38 +303,219 @@ class CheckPackageView(APIView):
             )
 
 
-class ScanReportView(APIView):
-    """Get scan report by ID"""
+class CheckPackagesView(APIView):
+    """Check many packages at once, answered from the risk snapshot where it is fresh
+
+    POST {"packages": [{"ecosystem": "npm", "name": "react", "version": "18.2.0"}, ...]}
+    (or plain names). Only packages missing from the snapshot, or stale in it,
+    go to the registries; see core.snapshot.
+    """
     permission_classes = [AllowAny]
 
-    def get(self, request, scan_id):
+    def post(self, request):
         try:
-            scan_result = ScanResult.objects.get(scan_request__id=scan_id)
-            package_results = PackageScanResult.objects.filter(
-                scan_result=scan_result
-            ).select_related('package')
-
-            results = []
-            for pr in package_results:
-                results.append({
-                    'package': pr.package.name,
-                    'ecosystem': pr.package.ecosystem,
-                    'risk_score': float(pr.risk_score),
-                    'vulnerabilities_found': pr.vulnerabilities_found,
-                    'is_deprecated': pr.is_deprecated,
-                    'is_unmaintained': pr.is_unmaintained,
-                })
+            keys = parse_check_items(
+                request.data.get('packages'), request.data.get('ecosystem') or 'npm'
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response({
-                'scan_id': scan_id,
-                'overall_risk_score': float(scan_result.overall_risk_score),
-                'created_at': scan_result.created_at,
-                'results': results,
-                'total_packages': len(results)
-            })
+        try:
+            results = check_packages(keys, concurrency=request.data.get('concurrency'))
+        except Exception as e:
+            return Response(
+                {'error': f'Error checking packages: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response({
+            'results': results,
+            'snapshot_hits': sum(1 for r in results if r['source'] == 'snapshot' and not r['stale']),
+            'fetched': sum(1 for r in results if r['source'] == 'registry'),
+        })
 
-        except ScanResult.DoesNotExist:
+
+class ScanReportView(APIView):
+    """Get scan report by ID
+
+    Results come riskiest first, a page at a time (?limit=, then ?cursor= with
+    the previous page's next_cursor), or all of them streamed with ?stream=1.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, scan_id, stream=False):
+        try:
+            scan_request = ScanRequest.objects.get(id=scan_id)
+        except ScanRequest.DoesNotExist:
             return Response(
                 {'error': 'Scan result not found'},
                 status=status.HTTP_404_NOT_FOUND
-            )
\ No newline at end of file
+            )
+
+        response_data = {
+            'scan_id': scan_id,
+            'status': scan_request.status,
+            'progress': scan_request.progress,
+            'packages_total': scan_request.packages_total,
+            'packages_scanned': scan_request.packages_scanned,
+        }
+        if scan_request.status == 'failed':
+            response_data['error'] = scan_request.error
+
+        # Running scans already have partial results
+        scan_result = ScanResult.objects.filter(scan_request=scan_request).first()
+        if scan_result is None:
+            response_data.update({
+                'overall_risk_score': None,
+                'results': [],
+                'total_packages': 0,
+                'next_cursor': None,
+            })
+            return Response(response_data)
+
+        overall_risk = scan_result.overall_risk_score
+        response_data.update({
+            'overall_risk_score': float(overall_risk) if overall_risk is not None else None,
+            'created_at': scan_result.created_at,
+            'scoring_policy': scan_result.scoring_policy,
+        })
+        if scan_result.dependency_graph is not None:
+            response_data['dependency_graph'] = scan_result.dependency_graph
+            response_data['aggregate_risk'] = scan_result.dependency_graph.get('aggregate')
+        if scan_result.metrics is not None:
+            response_data['metrics'] = scan_result.metrics
+        response_data['incomplete_packages'] = PackageScanResult.objects.filter(
+            scan_result=scan_result
+        ).exclude(error='').count()
+
+        if stream or _is_true(request.GET.get('stream')):
+            return self._stream(response_data, scan_result)
+
+        try:
+            limit = get_page_size(request.GET.get('limit'))
+            results, next_cursor = report_page(scan_result, request.GET.get('cursor'), limit)
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        response_data.update({
+            'results': results,
+            'total_packages': PackageScanResult.objects.filter(scan_result=scan_result).count(),
+            'next_cursor': next_cursor,
+        })
+        return Response(response_data)
+
+    def _stream(self, response_data, scan_result):
+        """The whole report as one JSON document, written a chunk of rows at a time"""
+        def chunks():
+            head = json.dumps(response_data, cls=DjangoJSONEncoder)
+            yield head[:-1] + ', "results": ['
+            total = 0
+            for result in iter_report(scan_result):
+                yield (', ' if total else '') + json.dumps(result)
+                total += 1
+            yield f'], "total_packages": {total}}}'
+
+        return StreamingHttpResponse(chunks(), content_type='application/json')
+
+
+class ExportView(APIView):
+    """Package results as NDJSON or CSV for a scan (?scan_id=), a date range
+    (?since=, ?until=) and/or an ecosystem (?ecosystem=), gzipped with ?gzip=1
+    """
+    permission_classes = [AllowAny]
+
+    def perform_content_negotiation(self, request, force=False):
+        # ?format= names the export format, not a DRF renderer; errors still render as JSON
+        return super().perform_content_negotiation(request, force=True)
+
+    def get(self, request):
+        export_format = request.GET.get('format', 'ndjson')
+        scan_id = request.GET.get('scan_id')
+        ecosystem = request.GET.get('ecosystem')
+        compress = _is_true(request.GET.get('gzip'))
+
+        try:
+            if export_format not in EXPORT_FORMATS:
+                raise ValueError(f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+            if scan_id:
+                UUID(scan_id)
+            since = parse_bound(request.GET.get('since'))
+            until = parse_bound(request.GET.get('until'))
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if not (scan_id or since or until or ecosystem):
+            return Response(
+                {'error': 'Give scan_id, since, until or ecosystem'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rows = export_queryset(scan_id=scan_id, since=since, until=until, ecosystem=ecosystem)
+        filename = f"scan-results-{scan_id or 'export'}.{export_format}"
+        if compress:
+            filename += '.gz'
+        response = StreamingHttpResponse(
+            export_stream(rows, export_format, compress),
+            content_type='application/gzip' if compress else CONTENT_TYPES[export_format],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class DedupStatsView(APIView):
+    """Hit rates of scan deduplication over the last ?hours= (default 24)"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        try:
+            hours = int(request.GET.get('hours', 24))
+        except ValueError:
+            return Response(
+                {'error': 'hours must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(dedup_stats(hours))
+
+
+class CacheStatsView(APIView):
+    """Registry metadata cache hit/miss counters and HTTP revalidation savings"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        stats = get_metadata_cache().stats()
+        stats['http'] = get_http_stats()
+        return Response(stats)
+
+
+class MetricsView(APIView):
+    """Stage timings, registry latency and cache counters in the Prometheus text format"""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        cache_stats = get_metadata_cache().stats()
+        http_stats = get_http_stats()
+        counters = {
+            f'package_scanner_metadata_cache_{name}_total': cache_stats[name]
+            for name in ('hits', 'stale_hits', 'misses', 'refreshes', 'refresh_errors', 'coalesced',
+                         'lease_waits')
+        }
+        counters['package_scanner_metadata_cache_evictions_total'] = cache_stats['evictions']
+        counters.update({
+            f'package_scanner_http_{name}_total': http_stats[name]
+            for name in ('requests', 'conditional_requests', 'not_modified', 'bytes_downloaded',
+                         'bytes_saved')
+        })
+        gauges = {
+            'package_scanner_metadata_cache_entries': cache_stats['entries'],
+            'package_scanner_scans_pending': ScanRequest.objects.filter(status='pending').count(),
+            'package_scanner_scans_processing': ScanRequest.objects.filter(status='processing').count(),
+        }
+        return HttpResponse(
+            render_prometheus(counters, gauges),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
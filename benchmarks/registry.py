@@ -0,0 +1,196 @@
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import unquote
+
+
+DOWNLOADS_PATH = '/downloads/point/last-week'
+VERSIONS = ('1.0.0', '1.1.0', '1.2.0', '2.0.0')
+PUBLISHED = '2024-01-01T00:00:00.000Z'
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients drop idle pooled connections; that is not worth a traceback
+        pass
+
+
+class FakeRegistry:
+    """A local stand-in for the npm registry and downloads API
+
+    Every package exists, with the versions in VERSIONS. Each response is
+    delayed by latency seconds (plus up to jitter more), packuments carry
+    payload_bytes of padding, and error_rate of the requests fail with a
+    503. With a capacity, requests beyond that many in flight get a 429
+    with Retry-After, like a registry shedding load. Randomness comes from
+    seed, so runs are reproducible.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, payload_bytes: int = 0,
+                 error_rate: float = 0.0, seed: int = 0, capacity: int = 0, retry_after: float = 0.1,
+                 host: str = '127.0.0.1', port: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.payload_bytes = payload_bytes
+        self.error_rate = error_rate
+        self.capacity = capacity
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self.throttled = 0
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._server = _Server((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    @property
+    def downloads_url(self) -> str:
+        return self.url + DOWNLOADS_PATH
+
+    def start(self) -> 'FakeRegistry':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _draw(self):
+        """(delay, fail) for one request"""
+        with self._random_lock:
+            self.requests += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def _enter(self) -> bool:
+        """Count a request in; False when it is over capacity"""
+        with self._random_lock:
+            if self.capacity and self.in_flight >= self.capacity:
+                self.throttled += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def _leave(self):
+        with self._random_lock:
+            self.in_flight -= 1
+
+    def packument(self, name: str) -> dict:
+        return {
+            'name': name,
+            'dist-tags': {'latest': VERSIONS[-1]},
+            'modified': PUBLISHED,
+            'description': f'Benchmark package {name}',
+            'author': {'name': 'bench'},
+            'versions': {version: self.manifest(name, version) for version in VERSIONS},
+            'time': dict({version: PUBLISHED for version in VERSIONS}, modified=PUBLISHED),
+            'readme': 'x' * self.payload_bytes,
+        }
+
+    def manifest(self, name: str, version: str) -> dict:
+        return {'name': name, 'version': version, 'license': 'MIT', 'dependencies': {}}
+
+    def downloads(self, names: str) -> dict:
+        names = names.split(',')
+        if len(names) == 1:
+            return {'downloads': 50000, 'package': names[0]}
+        return {name: {'downloads': 50000, 'package': name} for name in names}
+
+    def _handler_class(self):
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body go out as separate writes; Nagle plus delayed
+            # ACKs would add ~40 ms to every response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                if not registry._enter():
+                    return self._send(429, {'error': 'Too Many Requests'},
+                                      {'Retry-After': str(registry.retry_after)})
+                try:
+                    self._respond()
+                finally:
+                    registry._leave()
+
+            def _respond(self):
+                delay, fail = registry._draw()
+                if delay:
+                    time.sleep(delay)
+                if fail:
+                    return self._send(503, {'error': 'Service Unavailable'})
+
+                path = unquote(self.path.split('?', 1)[0])
+                if path.startswith(DOWNLOADS_PATH + '/'):
+                    return self._send(200, registry.downloads(path[len(DOWNLOADS_PATH) + 1:]))
+
+                name, _, version = path.lstrip('/').partition('/')
+                if name.startswith('@') and version:
+                    # Scoped names keep their slash: /@scope/name[/version]
+                    scope_name, _, version = version.partition('/')
+                    name = f'{name}/{scope_name}'
+                if not version:
+                    return self._send(200, registry.packument(name))
+                if version in VERSIONS:
+                    return self._send(200, registry.manifest(name, version))
+                return self._send(404, {'error': 'version not found'})
+
+            def _send(self, status: int, body: dict, headers: Optional[dict] = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description='Serve a fake npm registry for benchmarks')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds, at most')
+    parser.add_argument('--payload-bytes', type=int, default=0, help='Padding in every packument')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with 503')
+    parser.add_argument('--capacity', type=int, default=0,
+                        help='Requests in flight before answering 429 (0 for unlimited)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    registry = FakeRegistry(args.latency, args.jitter, args.payload_bytes, args.error_rate, args.seed,
+                            capacity=args.capacity, port=args.port)
+    print(f'Registry at {registry.url}, downloads API at {registry.downloads_url}')
+    registry._server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import time
+from typing import Dict, List, Sequence
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from scanners.cache import get_metadata_cache
+from scanners.fetcher import PackageFetcher
+from scanners.npm_scanner import NPMPackageScanner
+
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+TARGETS = ('view', 'scanner')
+
+
+def generate_manifest(size: int) -> str:
+    """package.json text with size dependencies, half exact and half ranges"""
+    dependencies = {
+        f'bench-pkg-{i:05d}': ('1.1.0' if i % 2 else '^1.0.0') for i in range(size)
+    }
+    return json.dumps({'name': f'bench-{size}', 'version': '1.0.0', 'dependencies': dependencies})
+
+
+def percentile(samples: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * len(ordered))) - 1))]
+
+
+def latency_summary(samples: Sequence[float]) -> Dict:
+    return {
+        'p50': round(percentile(samples, 50), 6),
+        'p99': round(percentile(samples, 99), 6),
+        'mean': round(statistics.fmean(samples), 6) if samples else 0.0,
+        'max': round(max(samples), 6) if samples else 0.0,
+    }
+
+
+def reset_peak_rss():
+    """Start a new peak RSS measurement where the kernel allows it (Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size since reset_peak_rss, or over the process lifetime"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak if platform.system() == 'Darwin' else peak * 1024
+
+
+def reset_caches():
+    """Every iteration starts cold so it goes to the registry"""
+    get_metadata_cache().clear()
+
+
+def run_view(manifest: str, concurrency: int) -> Dict:
+    """One POST /api/scan/file/ through the full request stack"""
+    client = Client()
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = client.post(
+            '/api/scan/file/',
+            {'content': manifest, 'filename': 'package.json', 'concurrency': concurrency},
+            content_type='application/json',
+        )
+        elapsed = time.perf_counter() - started
+    if response.status_code != 200:
+        raise RuntimeError(f'Scan failed with {response.status_code}: {response.content[:500]!r}')
+    data = response.json()
+    return {
+        'seconds': elapsed,
+        'queries': len(queries),
+        'packages': data['packages_scanned'],
+        'errors': sum(1 for r in data['results'] if r['incomplete']),
+        'package_latencies': [],
+    }
+
+
+def run_scanner(manifest: str, concurrency: int) -> Dict:
+    """Parse and fetch with NPMPackageScanner alone, timing every package lookup"""
+    scanner = NPMPackageScanner()
+    latencies = []
+    get_package_info = scanner.get_package_info
+
+    def timed_get_package_info(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return get_package_info(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    scanner.get_package_info = timed_get_package_info
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        dependencies = scanner.parse_dependencies(manifest)
+        package_infos = PackageFetcher(scanner, max_workers=concurrency).fetch(dependencies)
+        elapsed = time.perf_counter() - started
+    return {
+        'seconds': elapsed,
+        'queries': len(queries),
+        'packages': len(package_infos),
+        'errors': sum(1 for info in package_infos if 'error' in info),
+        'package_latencies': latencies,
+    }
+
+
+def run_case(target: str, size: int, iterations: int, concurrency: int, registry) -> Dict:
+    manifest = generate_manifest(size)
+    runs = []
+    reset_peak_rss()
+    requests_before, errors_before, throttled_before = (
+        registry.requests, registry.errors, registry.throttled
+    )
+    for _ in range(iterations):
+        reset_caches()
+        if target == 'view':
+            runs.append(run_view(manifest, concurrency))
+        else:
+            runs.append(run_scanner(manifest, concurrency))
+
+    seconds = [run['seconds'] for run in runs]
+    package_latencies = [latency for run in runs for latency in run['package_latencies']]
+    total_packages = sum(run['packages'] for run in runs)
+    result = {
+        'target': target,
+        'dependencies': size,
+        'iterations': iterations,
+        'seconds': latency_summary(seconds),
+        'throughput_packages_per_second': round(total_packages / sum(seconds), 2) if sum(seconds) else 0.0,
+        'queries': max(run['queries'] for run in runs),
+        'package_errors': sum(run['errors'] for run in runs),
+        'registry_requests': registry.requests - requests_before,
+        'registry_errors': registry.errors - errors_before,
+        'registry_throttled': registry.throttled - throttled_before,
+        'peak_rss_bytes': peak_rss_bytes(),
+    }
+    if package_latencies:
+        result['package_latency'] = latency_summary(package_latencies)
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+
+def run_suite(registry, sizes: Sequence[int] = DEFAULT_SIZES, targets: Sequence[str] = TARGETS,
+              iterations: int = 3, concurrency: int = 8, progress=None) -> Dict:
+    """Run every (target, size) case against a started FakeRegistry"""
+    results: List[Dict] = []
+    for size in sizes:
+        for target in targets:
+            result = run_case(target, size, iterations, concurrency, registry)
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'registry': {
+            'latency': registry.latency,
+            'jitter': registry.jitter,
+            'payload_bytes': registry.payload_bytes,
+            'error_rate': registry.error_rate,
+            'capacity': registry.capacity,
+        },
+        'concurrency': concurrency,
+        'results': results,
+    }
@@ -0,0 +1,216 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+from core import service
+from core.service import RiskCalculator, risk_level
+from scanners import ScannerFactory
+from scanners.cache import get_metadata_cache
+from scanners.fetcher import PackageFetcher
+from scanners.registry_http import get_http_stats
+
+from .config import configure_django, load_config
+from .utils import find_manifests, format_table, read_chunks
+
+
+# Least to most severe, for --fail-on
+RISK_LEVELS = tuple(level for _, level in sorted(service.RISK_LEVELS))
+
+# One scanner per ecosystem and process; building one opens its caches
+_scanners = {}
+
+
+def _get_scanner(ecosystem: str):
+    if ecosystem not in _scanners:
+        _scanners[ecosystem] = ScannerFactory.get_scanner(ecosystem)
+    return _scanners[ecosystem]
+
+
+def parse_manifest(path: str, ecosystem: str) -> Dict:
+    """Dependencies of one manifest, or the reason it could not be read"""
+    manifest = {'path': path, 'ecosystem': ecosystem, 'dependencies': [], 'error': None}
+    try:
+        scanner = _get_scanner(ecosystem)
+        manifest['dependencies'] = scanner.parse_dependencies(read_chunks(path))
+    except (OSError, ValueError) as e:
+        manifest['error'] = str(e)
+    return manifest
+
+
+def parse_manifests(manifests: List, config: Dict) -> List[Dict]:
+    """Parse every manifest, spread over a process pool when there are several"""
+    workers = min(config['parse_workers'] or os.cpu_count() or 1, len(manifests))
+    if workers <= 1:
+        return [parse_manifest(path, ecosystem) for path, ecosystem in manifests]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_django,
+                             initargs=(config,)) as pool:
+        return list(pool.map(
+            parse_manifest,
+            [path for path, _ in manifests],
+            [ecosystem for _, ecosystem in manifests],
+            chunksize=max(1, len(manifests) // (workers * 4)),
+        ))
+
+
+def unique_dependencies(manifests: List[Dict]) -> Dict[str, List[Dict]]:
+    """Each (name, version) once per ecosystem, however many manifests list it"""
+    by_ecosystem = {}
+    for manifest in manifests:
+        if not manifest['dependencies']:
+            # Also skips manifests of ecosystems without a scanner
+            continue
+        dependencies = by_ecosystem.setdefault(manifest['ecosystem'], {})
+        for dep in manifest['dependencies']:
+            dependencies.setdefault((dep['name'], dep.get('version')), dep)
+    return {ecosystem: list(deps.values()) for ecosystem, deps in by_ecosystem.items()}
+
+
+def score_dependencies(ecosystem: str, dependencies: List[Dict], concurrency: int,
+                       offline: bool = False) -> Dict:
+    """Results keyed by (name, version), from the registry or, offline, the cache alone"""
+    scanner = _get_scanner(ecosystem)
+    if offline:
+        package_infos = [
+            scanner.get_cached_package_info(dep['name'], dep.get('version'))
+            or {'name': dep['name'], 'error': 'Not in the local cache'}
+            for dep in dependencies
+        ]
+    else:
+        package_infos = PackageFetcher(scanner, max_workers=concurrency).fetch(dependencies)
+
+    available = [info for info in package_infos if 'error' not in info]
+    risk_scores = iter(RiskCalculator().score_batch(available))
+
+    results = {}
+    for dep, package_info in zip(dependencies, package_infos):
+        result = {
+            'package': dep['name'],
+            'ecosystem': ecosystem,
+            'version_constraint': dep.get('version'),
+            'version': package_info.get('version'),
+            'risk_score': None,
+            'risk_level': None,
+            'vulnerabilities': package_info.get('vulnerabilities', []),
+            'is_deprecated': package_info.get('is_deprecated', False),
+            'error': package_info.get('error'),
+        }
+        if result['error'] is None:
+            result['risk_score'] = float(next(risk_scores))
+            result['risk_level'] = risk_level(result['risk_score'])
+        results[(dep['name'], dep.get('version'))] = result
+    return results
+
+
+def scan(root: str, config: Dict, offline: bool = False) -> Dict:
+    """Scan every manifest below root, fetching each distinct dependency once"""
+    started = time.monotonic()
+    manifests = parse_manifests(find_manifests(root, config['exclude']), config)
+    parsed_at = time.monotonic()
+
+    results = {}
+    for ecosystem, dependencies in unique_dependencies(manifests).items():
+        for key, result in score_dependencies(
+            ecosystem, dependencies, config['concurrency'], offline
+        ).items():
+            results[(ecosystem,) + key] = result
+    finished = time.monotonic()
+
+    manifest_reports = []
+    for manifest in manifests:
+        scores = [
+            results[(manifest['ecosystem'], dep['name'], dep.get('version'))]['risk_score']
+            for dep in manifest['dependencies']
+        ]
+        scores = [score for score in scores if score is not None]
+        manifest_reports.append({
+            'path': os.path.relpath(manifest['path'], root) if os.path.isdir(root) else manifest['path'],
+            'ecosystem': manifest['ecosystem'],
+            'dependencies': len(manifest['dependencies']),
+            'overall_risk_score': sum(scores) / len(scores) if scores else None,
+            'error': manifest['error'],
+        })
+
+    packages = sorted(results.values(), key=lambda r: (r['risk_score'] is None, -(r['risk_score'] or 0)))
+    return {
+        'root': root,
+        'offline': offline,
+        'manifests': manifest_reports,
+        'packages': packages,
+        'summary': {
+            'manifests': len(manifests),
+            'dependencies': sum(len(manifest['dependencies']) for manifest in manifests),
+            'unique_packages': len(packages),
+            'unavailable_packages': sum(1 for r in packages if r['error']),
+            'risky_packages': sum(1 for r in packages if (r['risk_score'] or 0) > 70),
+            'packages_with_vulnerabilities': sum(1 for r in packages if r['vulnerabilities']),
+            'deprecated_packages': sum(1 for r in packages if r['is_deprecated']),
+            'parse_seconds': round(parsed_at - started, 3),
+            'fetch_seconds': round(finished - parsed_at, 3),
+        },
+        'cache': {
+            'metadata': get_metadata_cache().stats(),
+            'http': get_http_stats(),
+        },
+    }
+
+
+def scan_command(args) -> int:
+    """`package-scanner scan`: print a report, exit 1 when --fail-on is reached"""
+    config = load_config(args.config)
+    if args.cache_dir:
+        config['cache_dir'] = args.cache_dir
+    if args.workers:
+        config['parse_workers'] = args.workers
+    if args.concurrency:
+        config['concurrency'] = args.concurrency
+    config['exclude'] = list(config['exclude']) + list(args.exclude or [])
+    configure_django(config)
+
+    report = scan(args.path, config, offline=args.offline)
+
+    if args.format == 'json':
+        output = json.dumps(report, indent=2, default=str)
+    else:
+        output = _format_report(report, args.top)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        sys.stdout.write(output + '\n')
+
+    if args.fail_on:
+        threshold = RISK_LEVELS.index(args.fail_on)
+        if any(r['risk_level'] and RISK_LEVELS.index(r['risk_level']) >= threshold
+               for r in report['packages']):
+            return 1
+    return 0
+
+
+def _format_report(report: Dict, top: int) -> str:
+    summary = report['summary']
+    packages = report['packages'][:top] if top else report['packages']
+    sections = [
+        format_table(report['manifests'], [
+            ('path', 'Manifest'), ('ecosystem', 'Ecosystem'), ('dependencies', 'Deps'),
+            ('overall_risk_score', 'Risk'), ('error', 'Error'),
+        ]),
+        format_table(packages, [
+            ('package', 'Package'), ('version', 'Version'), ('risk_score', 'Risk'),
+            ('risk_level', 'Level'), ('vulnerabilities', 'Vulnerabilities'), ('error', 'Error'),
+        ]),
+        (
+            f"{summary['manifests']} manifests, {summary['dependencies']} dependencies, "
+            f"{summary['unique_packages']} unique packages "
+            f"({summary['unavailable_packages']} unavailable), "
+            f"{summary['risky_packages']} risky, "
+            f"{summary['packages_with_vulnerabilities']} with vulnerabilities, "
+            f"{summary['deprecated_packages']} deprecated"
+        ),
+    ]
+    if top and len(report['packages']) > top:
+        sections.insert(2, f"... {len(report['packages']) - top} more packages (--top 0 shows all)")
+    return '\n\n'.join(sections)
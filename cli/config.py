@@ -0,0 +1,83 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def default_cache_dir() -> Path:
+    """Where the CLI keeps registry metadata between runs"""
+    if os.environ.get('PACKAGE_SCANNER_CACHE_DIR'):
+        return Path(os.environ['PACKAGE_SCANNER_CACHE_DIR'])
+    base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'package-scanner'
+
+
+def default_config_path() -> Path:
+    base = os.environ.get('XDG_CONFIG_HOME') or Path.home() / '.config'
+    return Path(base) / 'package-scanner' / 'config.json'
+
+
+DEFAULT_CONFIG = {
+    'cache_dir': None,
+    # Processes parsing manifests; None uses one per CPU
+    'parse_workers': None,
+    # Threads fetching registry metadata
+    'concurrency': 16,
+    # Cached metadata is fresh for metadata_ttl seconds, then served while it
+    # is refreshed for stale_ttl more; --offline serves it until it is pruned
+    'metadata_ttl': 6 * 3600,
+    'stale_ttl': 30 * 86400,
+    'max_entries': 500000,
+    # Defaults to vulnerability_index.json.gz in the cache directory
+    'vuln_index': None,
+    # Directory names never walked into
+    'exclude': ['node_modules', '.git', '.hg', '.svn', '.venv', 'venv', '__pycache__', '.tox'],
+}
+
+
+def load_config(path: Optional[str] = None) -> Dict:
+    """Defaults overridden by a JSON config file, if there is one"""
+    config = dict(DEFAULT_CONFIG)
+    config_path = Path(path) if path else default_config_path()
+    if config_path.exists():
+        with open(config_path) as f:
+            overrides = json.load(f)
+        unknown = set(overrides) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Unknown config keys in {config_path}: {', '.join(sorted(unknown))}")
+        config.update(overrides)
+    elif path:
+        raise ValueError(f"Config file not found: {path}")
+
+    config['cache_dir'] = str(config['cache_dir'] or default_cache_dir())
+    return config
+
+
+def configure_django(config: Dict):
+    """Point the scanners at the CLI's cache directory instead of a web project"""
+    from django.conf import settings
+
+    if settings.configured:
+        return
+
+    cache_dir = Path(config['cache_dir'])
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    concurrency = max(1, int(config['concurrency']))
+    settings.configure(
+        SCAN_CONCURRENCY=concurrency,
+        SCAN_MAX_CONCURRENCY=concurrency,
+        SCANNER_CACHE={
+            'BACKEND': 'sqlite',
+            'PATH': cache_dir / 'metadata.sqlite3',
+            'MAX_ENTRIES': config['max_entries'],
+            'TTL': config['metadata_ttl'],
+            'STALE_TTL': config['stale_ttl'],
+        },
+        SCANNER_DOWNLOADS_TTL=config['metadata_ttl'],
+        SCANNER_HTTP={
+            'CACHE': True,
+            'CACHE_PATH': cache_dir / 'http_cache.sqlite3',
+            'POOL_MAXSIZE': concurrency,
+        },
+        VULN_INDEX_PATH=config['vuln_index'] or cache_dir / 'vulnerability_index.json.gz',
+    )
@@ -0,0 +1,48 @@
+import argparse
+import sys
+from typing import List, Optional
+
+from .commands import RISK_LEVELS, scan_command
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='package-scanner',
+        description='Scan dependency manifests for risky packages',
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan = subparsers.add_parser(
+        'scan', help='Scan every manifest in a directory (or a single manifest file)'
+    )
+    scan.add_argument('path', help='Repository directory or manifest file')
+    scan.add_argument('--offline', action='store_true',
+                      help='Only use registry metadata cached by earlier runs')
+    scan.add_argument('--format', choices=['table', 'json'], default='table')
+    scan.add_argument('--output', help='Write the report to this file instead of stdout')
+    scan.add_argument('--top', type=int, default=20,
+                      help='Packages listed in the table report, riskiest first (0 for all)')
+    scan.add_argument('--fail-on', choices=RISK_LEVELS,
+                      help='Exit with status 1 if any package reaches this risk level')
+    scan.add_argument('--workers', type=int, help='Processes parsing manifests')
+    scan.add_argument('--concurrency', type=int, help='Threads fetching registry metadata')
+    scan.add_argument('--cache-dir', help='Directory for the metadata cache')
+    scan.add_argument('--exclude', action='append', metavar='DIR',
+                      help='Directory name to skip (repeatable)')
+    scan.add_argument('--config', help='JSON config file')
+    scan.set_defaults(handler=scan_command)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        return args.handler(args)
+    except ValueError as e:
+        parser.exit(2, f'package-scanner: error: {e}\n')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,51 @@
+import os
+from functools import partial
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from scanners import ScannerFactory
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def find_manifests(root: str, exclude: Iterable[str] = ()) -> List[Tuple[str, str]]:
+    """(path, ecosystem) of every known manifest below root, in a stable order"""
+    exclude = set(exclude)
+    if os.path.isfile(root):
+        return [(root, ScannerFactory.detect_ecosystem(os.path.basename(root)))]
+
+    manifests = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames if name not in exclude)
+        for filename in sorted(filenames):
+            if ScannerFactory.is_manifest(filename):
+                manifests.append((
+                    os.path.join(dirpath, filename), ScannerFactory.detect_ecosystem(filename)
+                ))
+    return manifests
+
+
+def read_chunks(path: str) -> Iterator[bytes]:
+    """A file's contents in chunks, so large lockfiles are never read whole"""
+    with open(path, 'rb') as f:
+        yield from iter(partial(f.read, CHUNK_SIZE), b'')
+
+
+def format_table(rows: List[Dict], columns: List[Tuple[str, str]]) -> str:
+    """Plain text table of rows, with (key, heading) columns"""
+    cells = [[heading for _, heading in columns]]
+    cells.extend([_cell(row.get(key)) for key, _ in columns] for row in rows)
+    widths = [max(len(line[i]) for line in cells) for i in range(len(columns))]
+    lines = ['  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip() for line in cells]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f'{value:.1f}'
+    if isinstance(value, (list, tuple)):
+        return ', '.join(str(item) for item in value)
+    return str(value)
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import zlib
+from datetime import timedelta
+from typing import Dict, Iterable, List
+
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import PackageScanResult, RawDataBlob
+from .writer import single_writer
+
+
+# Seconds between refreshes of a reused blob's created_at; well under prune_blobs' min_age
+BLOB_REUSE_REFRESH = 600
+
+
+def canonical_json(data: Dict) -> bytes:
+    """The one encoding of data that is hashed and stored: sorted keys, no whitespace"""
+    return json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def store_blobs(items: List[Dict]) -> List[str]:
+    """Store each item's content once and return the digests, in order
+
+    Content that is already stored is neither compressed nor sent again.
+    """
+    payloads = {}
+    digests = []
+    for data in items:
+        payload = canonical_json(data)
+        digest = hashlib.sha256(payload).hexdigest()
+        payloads.setdefault(digest, payload)
+        digests.append(digest)
+
+    existing = set(
+        RawDataBlob.objects.filter(digest__in=list(payloads)).values_list('digest', flat=True)
+    )
+    if existing:
+        # Reused blobs count as just stored, so prune_blobs leaves them alone
+        # until the results referring to them are written
+        now = timezone.now()
+        RawDataBlob.objects.filter(
+            digest__in=existing, created_at__lt=now - timedelta(seconds=BLOB_REUSE_REFRESH)
+        ).update(created_at=now)
+    new_blobs = []
+    for digest, payload in payloads.items():
+        if digest in existing:
+            continue
+        compressed = zlib.compress(payload)
+        new_blobs.append(RawDataBlob(
+            digest=digest, data=compressed, size=len(payload), stored_size=len(compressed),
+        ))
+    # A concurrent writer may have stored the same content meanwhile
+    RawDataBlob.objects.bulk_create(new_blobs, ignore_conflicts=True, batch_size=500)
+    return digests
+
+
+def load_blobs(digests: Iterable[str]) -> Dict[str, Dict]:
+    """Decoded content of every digest, one query and one decompression per distinct blob"""
+    wanted = {digest for digest in digests if digest}
+    if not wanted:
+        return {}
+    return {
+        digest: json.loads(zlib.decompress(bytes(data)))
+        for digest, data in RawDataBlob.objects.filter(digest__in=wanted).values_list('digest', 'data')
+    }
+
+
+def attach_raw_data(rows: List[Dict]) -> List[Dict]:
+    """Fill in raw_data of result rows (dicts with raw_blob_id) from their blobs"""
+    blobs = load_blobs(row['raw_blob_id'] for row in rows)
+    for row in rows:
+        if row['raw_blob_id']:
+            row['raw_data'] = blobs.get(row['raw_blob_id'], {})
+        elif row['raw_data'] is None:
+            row['raw_data'] = {}
+    return rows
+
+
+@single_writer
+def prune_blobs(min_age: int = 3600) -> int:
+    """Delete blobs no result refers to any more and stored at least min_age seconds ago
+
+    A scan stores its blobs before the results that refer to them. Running
+    on the writer thread orders the prune after any scan already queued, and
+    the age limit keeps blobs a scan writing outside the writer just stored.
+    """
+    referenced = PackageScanResult.objects.filter(raw_blob__isnull=False).values('raw_blob')
+    deleted, _ = RawDataBlob.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=min_age)
+    ).exclude(digest__in=referenced).delete()
+    return deleted
+
+
+def raw_data_stats() -> Dict:
+    """Row counts and sizes of result details, inline and in blobs"""
+    results = PackageScanResult.objects.aggregate(
+        total=Count('id'),
+        inline=Count('id', filter=Q(raw_blob__isnull=True, raw_data__isnull=False)),
+        referencing=Count('id', filter=Q(raw_blob__isnull=False)),
+    )
+    inline_bytes = 0
+    inline_rows = PackageScanResult.objects.filter(raw_blob__isnull=True, raw_data__isnull=False)
+    for raw_data in inline_rows.values_list('raw_data', flat=True).iterator(chunk_size=2000):
+        inline_bytes += len(canonical_json(raw_data))
+    blobs = RawDataBlob.objects.aggregate(count=Count('digest'), size=Sum('size'),
+                                          stored_size=Sum('stored_size'))
+    stats = {
+        'package_results': results['total'],
+        'inline_rows': results['inline'],
+        'inline_bytes': inline_bytes,
+        'blob_references': results['referencing'],
+        'blobs': blobs['count'],
+        'blob_bytes': blobs['size'] or 0,
+        'blob_stored_bytes': blobs['stored_size'] or 0,
+    }
+    if connection.vendor == 'sqlite':
+        path = str(connection.settings_dict['NAME'])
+        stats['database_bytes'] = sum(
+            os.path.getsize(name) for name in (path, path + '-wal') if os.path.exists(name)
+        )
+    return stats
@@ -0,0 +1,135 @@
+import hashlib
+import json
+from datetime import timedelta
+from typing import Dict, Iterable, List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from scanners.vulnerability_index import get_vulnerability_index
+
+from .models import ScanRequest, ScanResult
+from .persistence import copy_package_results, stored_result, stored_results
+from .writer import single_writer
+from .service import RiskCalculator
+
+
+# Scan options that change what a scan produces
+RESULT_OPTIONS = ('transitive',)
+
+
+def get_dedup_window() -> int:
+    """Seconds a completed scan can be reused for an identical manifest; 0 disables it"""
+    return getattr(settings, 'SCAN_DEDUP_WINDOW', 3600)
+
+
+def manifest_hash(dependencies: Iterable[Dict], ecosystem: str, options: Optional[Dict] = None) -> str:
+    """Hash of what a scan depends on, independent of formatting and key order
+
+    Covers the parsed dependencies, the ecosystem, the scoring and
+    vulnerability index versions, and the options that change results.
+    Takes the dependencies the scan itself parsed, so a submission is not
+    parsed twice.
+    """
+    dependencies = sorted({
+        (dep['name'], str(dep.get('version') or ''), dep.get('type', 'dependency'))
+        for dep in dependencies
+    })
+    options = options or {}
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'ecosystem': ecosystem.lower(),
+        'scoring': RiskCalculator().version,
+        'advisories': get_vulnerability_index().version,
+        'options': {name: options.get(name) for name in RESULT_OPTIONS},
+    }, sort_keys=True).encode())
+    for dependency in dependencies:
+        digest.update(json.dumps(dependency).encode())
+    return digest.hexdigest()
+
+
+def find_previous_scan(content_hash: str):
+    """The latest completed scan with this hash and whether it is still fresh"""
+    previous = (
+        ScanRequest.objects.filter(content_hash=content_hash, status='completed', duplicate_of=None)
+        # Scans with packages the registry failed for are worth repeating
+        .exclude(scanresult__package_results__error__gt='')
+        .order_by('-completed_at')
+        .first()
+    )
+    if previous is None:
+        return None, False
+    fresh = previous.completed_at >= timezone.now() - timedelta(seconds=get_dedup_window())
+    return previous, fresh
+
+
+@single_writer
+def clone_scan(original: ScanRequest, scan_request: ScanRequest) -> ScanResult:
+    """Copy a completed scan's results to a new, completed scan request"""
+    original_result = ScanResult.objects.get(scan_request=original)
+    rows = stored_results(original_result, with_raw_data=False)
+
+    with transaction.atomic():
+        scan_result = ScanResult.objects.create(
+            scan_request=scan_request,
+            overall_risk_score=original_result.overall_risk_score,
+            report_path=f"/api/reports/{scan_request.id}.json",
+            dependency_graph=original_result.dependency_graph,
+            scoring_policy=original_result.scoring_policy,
+        )
+        copy_package_results(scan_result, rows)
+
+        scan_request.status = 'completed'
+        scan_request.packages_total = original.packages_total
+        scan_request.packages_scanned = original.packages_total
+        scan_request.completed_at = timezone.now()
+        scan_request.save(update_fields=['status', 'packages_total', 'packages_scanned', 'completed_at'])
+
+    return scan_result
+
+
+def direct_results(scan_result: ScanResult) -> List[Dict]:
+    """Results of a stored scan's direct dependencies, shaped like pipeline results"""
+    return [stored_result(row) for row in stored_results(scan_result, depth=0)]
+
+
+def dedup_stats(hours: int = 24) -> Dict:
+    """How often submissions reused an earlier scan, to tune SCAN_DEDUP_WINDOW"""
+    submissions = ScanRequest.objects.filter(
+        requested_at__gte=timezone.now() - timedelta(hours=hours)
+    ).exclude(dedup_result='')
+
+    counts = {'hit': 0, 'expired': 0, 'miss': 0}
+    for dedup_result in submissions.values_list('dedup_result', flat=True):
+        counts[dedup_result] = counts.get(dedup_result, 0) + 1
+    total = sum(counts.values())
+
+    ages = sorted(
+        (requested_at - completed_at).total_seconds()
+        for requested_at, completed_at in submissions.filter(dedup_result='hit').values_list(
+            'requested_at', 'duplicate_of__completed_at'
+        )
+        if completed_at is not None
+    )
+
+    def percentile(p):
+        return ages[min(len(ages) - 1, int(p * len(ages)))] if ages else None
+
+    return {
+        'window_seconds': get_dedup_window(),
+        'hours': hours,
+        'submissions': total,
+        'hits': counts['hit'],
+        # Repeats that arrived after the window; a longer window would have served them
+        'expired_repeats': counts['expired'],
+        'misses': counts['miss'],
+        'hit_ratio': counts['hit'] / total if total else 0.0,
+        'repeat_ratio': (counts['hit'] + counts['expired']) / total if total else 0.0,
+        'reused_age_seconds': {
+            'p50': percentile(0.5),
+            'p90': percentile(0.9),
+            'max': ages[-1] if ages else None,
+        },
+    }
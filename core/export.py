@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import PackageScanResult
+
+
+# Exported columns, in CSV order, and the PackageScanResult fields they come from
+EXPORT_COLUMNS = (
+    ('scan_id', 'scan_result__scan_request_id'),
+    ('scanned_at', 'scan_result__created_at'),
+    ('package', 'package__name'),
+    ('ecosystem', 'package__ecosystem'),
+    ('version', 'version'),
+    ('version_constraint', 'version_constraint'),
+    ('dependency_type', 'dependency_type'),
+    ('depth', 'depth'),
+    ('risk_score', 'risk_score'),
+    ('vulnerabilities_found', 'vulnerabilities_found'),
+    ('is_deprecated', 'is_deprecated'),
+    ('is_unmaintained', 'is_unmaintained'),
+    ('error', 'error'),
+)
+EXPORT_FORMATS = ('ndjson', 'csv')
+CONTENT_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def parse_bound(value: Optional[str]) -> Optional[datetime]:
+    """A date range bound given as an ISO date or datetime; dates mean midnight UTC"""
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"Invalid date: {value}")
+        parsed = datetime(day.year, day.month, day.day)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def export_queryset(scan_id=None, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                    ecosystem: Optional[str] = None):
+    """Package results of one scan, of the scans in a date range, and/or of one ecosystem"""
+    rows = PackageScanResult.objects.all()
+    if scan_id:
+        rows = rows.filter(scan_result__scan_request_id=scan_id)
+    if since:
+        rows = rows.filter(scan_result__created_at__gte=since)
+    if until:
+        rows = rows.filter(scan_result__created_at__lt=until)
+    if ecosystem:
+        rows = rows.filter(package__ecosystem=ecosystem)
+    # Scan by scan, in the order the rows were written
+    return rows.order_by('scan_result__created_at', 'scan_result_id', 'created_at', 'id')
+
+
+def iter_export_rows(queryset, chunk_size: Optional[int] = None) -> Iterator[Dict]:
+    """Rows of the queryset as export dicts, read from the database chunk_size at a time"""
+    chunk_size = chunk_size or getattr(settings, 'SCAN_EXPORT_CHUNK_SIZE', 2000)
+    fields = [field for _, field in EXPORT_COLUMNS]
+    for values in queryset.values_list(*fields).iterator(chunk_size=chunk_size):
+        row = {column: value for (column, _), value in zip(EXPORT_COLUMNS, values)}
+        row['scan_id'] = str(row['scan_id'])
+        row['scanned_at'] = row['scanned_at'].isoformat()
+        row['risk_score'] = float(row['risk_score'])
+        yield row
+
+
+def iter_ndjson(rows: Iterable[Dict]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+def iter_csv(rows: Iterable[Dict]) -> Iterator[str]:
+    """CSV with a header line, one string per row"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=[column for column, _ in EXPORT_COLUMNS])
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks: Iterable[bytes], flush_size: int = 64 * 1024) -> Iterator[bytes]:
+    """Compress a byte stream into a gzip stream, emitting at least flush_size bytes of input at a time"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31: gzip header and trailer
+    pending = 0
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        pending += len(chunk)
+        if compressed:
+            yield compressed
+        if pending >= flush_size:
+            # Keeps a slow client's stream moving instead of waiting for deflate's buffer
+            yield compressor.flush(zlib.Z_SYNC_FLUSH)
+            pending = 0
+    yield compressor.flush()
+
+
+def export_stream(queryset, export_format: str, compress: bool = False) -> Iterator[bytes]:
+    """The queryset's rows encoded as NDJSON or CSV, optionally gzipped"""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {export_format}")
+    encode = iter_ndjson if export_format == 'ndjson' else iter_csv
+    chunks = (text.encode('utf-8') for text in encode(iter_export_rows(queryset)))
+    return gzip_chunks(chunks) if compress else chunks
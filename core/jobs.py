@@ -0,0 +1,186 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import ScanRequest
+from .persistence import fail_scan, requeue_stale_scans, touch_scan
+from .pipeline import ScanPipeline
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_heartbeat_interval() -> int:
+    """Seconds between heartbeats of a running scan"""
+    return getattr(settings, 'SCAN_HEARTBEAT_INTERVAL', 30)
+
+
+def get_stale_after() -> int:
+    """Seconds without a heartbeat after which a processing scan is requeued"""
+    return getattr(settings, 'SCAN_STALE_AFTER', 300)
+
+
+def claim_scan(scan_id) -> Optional[ScanRequest]:
+    """Atomically move a pending scan to processing; None if someone else got it"""
+    now = timezone.now()
+    claimed = ScanRequest.objects.filter(id=scan_id, status='pending').update(
+        status='processing',
+        started_at=now,
+        heartbeat_at=now,
+    )
+    if not claimed:
+        return None
+    return ScanRequest.objects.get(id=scan_id)
+
+
+def claim_next_scan() -> Optional[ScanRequest]:
+    """Claim the oldest pending scan, after requeueing scans whose worker died"""
+    requeued = requeue_stale_scans(get_stale_after())
+    if requeued:
+        logger.warning("Requeued %d scan(s) without a heartbeat for %ds", requeued, get_stale_after())
+    while True:
+        pending = list(
+            ScanRequest.objects.filter(status='pending')
+            .order_by('requested_at')
+            .values_list('id', flat=True)[:10]
+        )
+        if not pending:
+            return None
+        for scan_id in pending:
+            scan_request = claim_scan(scan_id)
+            if scan_request is not None:
+                return scan_request
+
+
+@contextmanager
+def heartbeat(scan_request: ScanRequest):
+    """Refresh the scan's heartbeat from a background thread while the block runs"""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(get_heartbeat_interval()):
+            try:
+                if not touch_scan(scan_request.id, scan_request.started_at):
+                    logger.warning("Scan %s was requeued while still running", scan_request.id)
+                    return
+            except Exception:
+                logger.exception("Heartbeat of scan %s failed", scan_request.id)
+            finally:
+                close_old_connections()
+
+    thread = threading.Thread(target=beat, name=f'scan-heartbeat-{scan_request.id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def still_claimed(scan_request: ScanRequest) -> bool:
+    """Whether the scan is still the run this worker claimed, not requeued after a missed heartbeat"""
+    return ScanRequest.objects.filter(
+        id=scan_request.id, status='processing', started_at=scan_request.started_at
+    ).exists()
+
+
+def run_scan(scan_request: ScanRequest):
+    """Run a claimed scan, storing partial results as chunks finish"""
+    with heartbeat(scan_request):
+        _run_scan(scan_request)
+
+
+def _run_scan(scan_request: ScanRequest):
+    chunk_size = getattr(settings, 'SCAN_PROGRESS_CHUNK_SIZE', 100)
+    try:
+        pipeline = ScanPipeline(
+            scan_request,
+            scan_request.ecosystem,
+            concurrency=scan_request.options.get('concurrency'),
+            transitive=scan_request.options.get('transitive', False),
+        )
+        base_scan_id = scan_request.options.get('base_scan_id')
+        if base_scan_id:
+            pipeline.run_incremental(scan_request.file_content, ScanRequest.objects.get(id=base_scan_id))
+            scan_request.file_content = ''
+            scan_request.save(update_fields=['file_content'])
+        else:
+            pipeline.run_in_chunks(scan_request.file_content, chunk_size)
+    except Exception as e:
+        logger.exception("Scan %s failed", scan_request.id)
+        if still_claimed(scan_request):
+            fail_scan(scan_request, str(e))
+
+
+def run_queued_scan(scan_id):
+    """Claim and run a single queued scan"""
+    close_old_connections()
+    try:
+        scan_request = claim_scan(scan_id)
+        if scan_request is not None:
+            run_scan(scan_request)
+    finally:
+        close_old_connections()
+
+
+def process_pending_scans(max_scans: Optional[int] = None) -> int:
+    """Run pending scans one after another until the queue is empty"""
+    processed = 0
+    close_old_connections()
+    try:
+        while max_scans is None or processed < max_scans:
+            scan_request = claim_next_scan()
+            if scan_request is None:
+                break
+            run_scan(scan_request)
+            processed += 1
+    finally:
+        close_old_connections()
+    return processed
+
+
+class ScanWorkerPool:
+    """In-process worker threads for queued scans
+
+    The queue itself lives in the ScanRequest table, so scans left pending
+    here can also be picked up by the run_scan_worker command.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='scan-worker')
+
+    def enqueue(self, scan_id):
+        """Start the scan on a worker thread"""
+        self._executor.submit(run_queued_scan, scan_id)
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> Optional[ScanWorkerPool]:
+    """Process-wide worker pool, or None when SCAN_ASYNC_WORKERS is 0"""
+    global _worker_pool
+    workers = getattr(settings, 'SCAN_ASYNC_WORKERS', 2)
+    if not workers:
+        return None
+    if _worker_pool is None:
+        with _worker_pool_lock:
+            if _worker_pool is None:
+                _worker_pool = ScanWorkerPool(workers)
+    return _worker_pool
+
+
+def enqueue_scan(scan_request: ScanRequest):
+    """Hand a pending scan to the local pool once the request has committed"""
+    pool = get_worker_pool()
+    if pool is not None:
+        scan_id = scan_request.id
+        transaction.on_commit(lambda: pool.enqueue(scan_id))
@@ -0,0 +1,80 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from benchmarks.registry import FakeRegistry
+from benchmarks.suite import DEFAULT_SIZES, TARGETS, run_suite
+
+
+class Command(BaseCommand):
+    help = 'Benchmark scans against a local stand-in npm registry and print the results as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                            help='Comma-separated dependency counts of the generated manifests')
+        parser.add_argument('--targets', default=','.join(TARGETS),
+                            help='view (POST /api/scan/file/), scanner (NPMPackageScanner alone) or both')
+        parser.add_argument('--iterations', type=int, default=3, help='Cold runs of each case')
+        parser.add_argument('--concurrency', type=int, default=8, help='Fetch workers per scan')
+        parser.add_argument('--latency', type=float, default=0.01, help='Registry response delay, seconds')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Random extra delay, seconds')
+        parser.add_argument('--payload-bytes', type=int, default=4096, help='Padding in every packument')
+        parser.add_argument('--error-rate', type=float, default=0.0,
+                            help='Fraction of registry requests failing with 503')
+        parser.add_argument('--capacity', type=int, default=0,
+                            help='Registry requests in flight before it answers 429 (0 for unlimited)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', '-o', help='Write the JSON report here instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size]
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated integers')
+        targets = [target for target in options['targets'].split(',') if target]
+        unknown = set(targets) - set(TARGETS)
+        if unknown:
+            raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+
+        registry = FakeRegistry(
+            latency=options['latency'], jitter=options['jitter'],
+            payload_bytes=options['payload_bytes'], error_rate=options['error_rate'],
+            seed=options['seed'], capacity=options['capacity'],
+        )
+
+        def progress(result):
+            self.stderr.write(
+                f"{result['target']:>8} {result['dependencies']:>6} deps: "
+                f"p50 {result['seconds']['p50']:.3f}s, "
+                f"{result['throughput_packages_per_second']:.0f} packages/s, "
+                f"{result['queries']} queries, {result['peak_rss_bytes'] / 2 ** 20:.0f} MiB peak"
+            )
+
+        # Scans write to a throwaway database, never the configured one
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with registry, override_settings(
+                NPM_REGISTRY_URL=registry.url,
+                NPM_DOWNLOADS_URL=registry.downloads_url,
+                # Every iteration must reach the registry
+                SCANNER_HTTP={'CACHE': False, 'POOL_MAXSIZE': max(options['concurrency'], 10)},
+                SCAN_DEDUP_WINDOW=0,
+                SCAN_MAX_CONCURRENCY=max(options['concurrency'], 1),
+            ):
+                report = run_suite(
+                    registry, sizes, targets, iterations=max(options['iterations'], 1),
+                    concurrency=options['concurrency'], progress=progress,
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
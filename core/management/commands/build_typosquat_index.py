@@ -0,0 +1,74 @@
+import heapq
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import PackageRiskSnapshot
+from scanners.typosquat_index import BUNDLED_LISTS, TyposquatIndex, iter_name_list
+
+
+class Command(BaseCommand):
+    help = 'Build the typosquatting index of popular package names'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--names', action='append', default=[], metavar='ECOSYSTEM:FILE',
+                            help='Extra reference list, one name per line, most popular first')
+        parser.add_argument('--top', type=int, default=10000,
+                            help='Most downloaded scanned packages indexed per ecosystem')
+        parser.add_argument('--min-downloads', type=int, default=100000,
+                            help='Weekly downloads a scanned package needs to be indexed')
+        parser.add_argument('--no-db', action='store_true',
+                            help='Index only the bundled and --names lists, not scanned packages')
+        parser.add_argument('--max-distance', type=int, default=1,
+                            help='Edits between a name and a popular one that flag it')
+        parser.add_argument('--output', default=None,
+                            help='Index file to write (defaults to TYPOSQUAT_INDEX_PATH)')
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'TYPOSQUAT_INDEX_PATH', None)
+        if not path:
+            raise CommandError('Set TYPOSQUAT_INDEX_PATH or pass --output')
+
+        lists = list(BUNDLED_LISTS.items())
+        for spec in options['names']:
+            ecosystem, sep, list_path = spec.partition(':')
+            if not sep or not os.path.exists(list_path):
+                raise CommandError(f"Expected ECOSYSTEM:FILE with an existing file, got {spec}")
+            lists.append((ecosystem, list_path))
+
+        started = time.monotonic()
+        index = TyposquatIndex(max_distance=max(1, options['max_distance']))
+        for ecosystem, list_path in lists:
+            if os.path.exists(list_path):
+                index.add(ecosystem, iter_name_list(list_path))
+        if not options['no_db']:
+            for ecosystem, names in self._popular_scanned(options['top'], options['min_downloads']).items():
+                index.add(ecosystem, names)
+        index.save(path)
+
+        stats = index.stats()
+        names = ', '.join(f'{count} {ecosystem}' for ecosystem, count in sorted(stats['names'].items()))
+        self.stdout.write(
+            f"Index {path}: {names or 'no'} names, {stats['deletions']} deletions "
+            f"in {time.monotonic() - started:.2f}s"
+        )
+
+    def _popular_scanned(self, top: int, min_downloads: int):
+        """The top most downloaded packages of each ecosystem, as recorded in the risk snapshot"""
+        downloads = {}
+        rows = PackageRiskSnapshot.objects.values_list('ecosystem', 'name', 'details')
+        for ecosystem, name, details in rows.iterator(chunk_size=2000):
+            count = details.get('downloads', 0) if isinstance(details, dict) else 0
+            if isinstance(count, int) and count >= min_downloads:
+                key = (ecosystem, name)
+                downloads[key] = max(downloads.get(key, 0), count)
+
+        by_ecosystem = {}
+        for (ecosystem, name), count in downloads.items():
+            by_ecosystem.setdefault(ecosystem, []).append((count, name))
+        return {
+            ecosystem: [(name, count) for count, name in heapq.nlargest(top, entries)]
+            for ecosystem, entries in by_ecosystem.items()
+        }
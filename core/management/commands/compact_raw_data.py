@@ -0,0 +1,61 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.blobs import prune_blobs, raw_data_stats, store_blobs
+from core.models import PackageScanResult
+
+
+class Command(BaseCommand):
+    help = 'Move inline PackageScanResult.raw_data into deduplicated, compressed blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Rows moved per transaction')
+        parser.add_argument('--prune-grace', type=int, default=3600,
+                            help='Seconds an unreferenced blob is kept, for scans still writing results')
+        parser.add_argument('--vacuum', action='store_true',
+                            help='VACUUM an SQLite database afterwards so the file actually shrinks')
+        parser.add_argument('--json', action='store_true', help='Print the before/after stats as JSON')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        started = time.monotonic()
+        before = raw_data_stats()
+
+        moved = 0
+        inline = PackageScanResult.objects.filter(raw_blob__isnull=True, raw_data__isnull=False)
+        while True:
+            # Moved rows leave the filter, so every pass takes the next batch
+            batch = list(inline.order_by('id').values_list('id', 'raw_data')[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                digests = store_blobs([raw_data if isinstance(raw_data, dict) else {} for _, raw_data in batch])
+                PackageScanResult.objects.bulk_update(
+                    [
+                        PackageScanResult(id=row_id, raw_blob_id=digest, raw_data=None)
+                        for (row_id, _), digest in zip(batch, digests)
+                    ],
+                    ['raw_blob', 'raw_data'],
+                    batch_size=1000,
+                )
+            moved += len(batch)
+
+        pruned = prune_blobs(min_age=max(0, options['prune_grace']))
+        if options['vacuum'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+
+        after = raw_data_stats()
+        if options['json']:
+            self.stdout.write(json.dumps({'moved': moved, 'pruned': pruned, 'before': before, 'after': after},
+                                         indent=2))
+            return
+
+        self.stdout.write(f'{moved} rows moved to blobs, {pruned} unused blobs pruned '
+                          f'in {time.monotonic() - started:.2f}s')
+        for name in before:
+            self.stdout.write(f'  {name:<18} {before[name]:>14,} -> {after[name]:>14,}')
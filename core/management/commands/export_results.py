@@ -0,0 +1,48 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import EXPORT_FORMATS, export_queryset, export_stream, parse_bound
+
+
+class Command(BaseCommand):
+    help = 'Stream stored package results as NDJSON or CSV to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=EXPORT_FORMATS, default='ndjson')
+        parser.add_argument('--scan', help='Only this scan request id')
+        parser.add_argument('--since', help='Only scans finished on or after this ISO date/datetime')
+        parser.add_argument('--until', help='Only scans finished before this ISO date/datetime')
+        parser.add_argument('--ecosystem', help='Only packages of this ecosystem')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output with gzip')
+        parser.add_argument('--output', '-o', help='File to write instead of stdout')
+
+    def handle(self, *args, **options):
+        try:
+            rows = export_queryset(
+                scan_id=options['scan'],
+                since=parse_bound(options['since']),
+                until=parse_bound(options['until']),
+                ecosystem=options['ecosystem'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        written = 0
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            for chunk in export_stream(rows, options['format'], options['gzip']):
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                out.close()
+            else:
+                out.flush()
+
+        if options['output']:
+            self.stdout.write(
+                f"Wrote {written} bytes to {options['output']} in {time.monotonic() - started:.2f}s"
+            )
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Avg, OuterRef, Subquery
+
+from core.blobs import load_blobs
+from core.models import PackageScanResult, ScanResult
+from core.service import RiskCalculator
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored package risk scores with the current RiskCalculator'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows scored and updated per batch')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Score every row without writing anything')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        risk_calculator = RiskCalculator()
+        started = time.monotonic()
+        counts = {'rescored': 0, 'changed': 0, 'skipped': 0}
+
+        batch = []
+        rows = PackageScanResult.objects.values_list('id', 'risk_score', 'raw_blob_id', 'raw_data')
+        for row in rows.iterator(chunk_size=batch_size):
+            batch.append(row)
+            if len(batch) >= batch_size:
+                self._rescore(risk_calculator, batch, counts, options['dry_run'])
+                batch = []
+        if batch:
+            self._rescore(risk_calculator, batch, counts, options['dry_run'])
+
+        if counts['changed'] and not options['dry_run']:
+            self._update_overall_scores()
+
+        self.stdout.write(
+            f"{counts['rescored']} rescored ({counts['changed']} changed), "
+            f"{counts['skipped']} skipped in {time.monotonic() - started:.2f}s"
+        )
+
+    def _rescore(self, risk_calculator, batch, counts, dry_run):
+        blobs = load_blobs(blob_id for _, _, blob_id, _ in batch)
+        rows = []
+        for row_id, old_score, blob_id, raw_data in batch:
+            raw_data = blobs.get(blob_id) if blob_id else raw_data
+            # Rows stored before download counts were kept cannot be rescored faithfully
+            if not isinstance(raw_data, dict) or 'downloads' not in raw_data:
+                counts['skipped'] += 1
+                continue
+            rows.append((row_id, old_score, blob_id or row_id, raw_data))
+
+        # Rows sharing a details blob share its score, so each blob is scored once
+        distinct = {key: raw_data for _, _, key, raw_data in rows}
+        scores = dict(zip(distinct, risk_calculator.score_batch(list(distinct.values()))))
+        changed = [
+            PackageScanResult(id=row_id, risk_score=round(scores[key], 2))
+            for row_id, old_score, key, _ in rows
+            if old_score is None or round(float(old_score), 2) != round(scores[key], 2)
+        ]
+        counts['rescored'] += len(rows)
+        counts['changed'] += len(changed)
+        if changed and not dry_run:
+            PackageScanResult.objects.bulk_update(changed, ['risk_score'], batch_size=1000)
+
+    def _update_overall_scores(self):
+        """Overall score of each completed scan is the mean of its direct dependencies"""
+        direct_mean = PackageScanResult.objects.filter(
+            scan_result=OuterRef('pk'), depth=0
+        ).values('scan_result').annotate(mean=Avg('risk_score')).values('mean')
+
+        with transaction.atomic():
+            ScanResult.objects.filter(
+                scan_request__status='completed',
+                pk__in=PackageScanResult.objects.filter(depth=0).values('scan_result'),
+            ).update(overall_risk_score=Subquery(direct_mean))
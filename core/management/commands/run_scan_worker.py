@@ -0,0 +1,32 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.jobs import process_pending_scans
+
+
+class Command(BaseCommand):
+    help = 'Process queued scans from the ScanRequest table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Number of scans to run in parallel')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        self.stdout.write(f"Processing queued scans with {workers} worker(s)")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                processed = sum(pool.map(lambda _: process_pending_scans(), range(workers)))
+                if processed:
+                    self.stdout.write(f"Processed {processed} scan(s)")
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(options['poll_interval'])
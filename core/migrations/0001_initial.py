@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vulnerability',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('cve_id', models.CharField(max_length=50, unique=True)),
+                ('severity', models.CharField(choices=[('critical', 'Critical'), ('high', 'High'), ('medium', 'Medium'), ('low', 'Low')], max_length=20)),
+                ('description', models.TextField()),
+                ('affected_versions', models.JSONField(default=list)),
+                ('published_date', models.DateTimeField()),
+                ('is_patched', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Package',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('ecosystem', models.CharField(choices=[('npm', 'NPM'), ('pypi', 'PyPI'), ('maven', 'Maven'), ('go', 'Go')], max_length=50)),
+                ('version', models.CharField(blank=True, max_length=100, null=True)),
+                ('description', models.TextField(blank=True, null=True)),
+                ('author', models.CharField(blank=True, max_length=255, null=True)),
+                ('last_updated', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('name', 'ecosystem')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ScanRequest',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('source', models.CharField(choices=[('cli', 'CLI'), ('web', 'Web'), ('ide', 'IDE'), ('ci', 'CI/CD')], max_length=50)),
+                ('target', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('requested_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScanResult',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('overall_risk_score', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('report_path', models.CharField(blank=True, max_length=500, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('scan_request', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='core.scanrequest')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PackageScanResult',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('risk_score', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('vulnerabilities_found', models.IntegerField(default=0)),
+                ('is_deprecated', models.BooleanField(default=False)),
+                ('is_unmaintained', models.BooleanField(default=False)),
+                ('raw_data', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('package', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.package')),
+                ('scan_result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='package_results', to='core.scanresult')),
+            ],
+            options={
+                'db_table': 'core_packagescanresult',
+                'unique_together': {('scan_result', 'package')},
+            },
+        ),
+    ]
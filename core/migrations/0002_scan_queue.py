@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanrequest',
+            name='ecosystem',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='error',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='file_content',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='options',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='packages_scanned',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='packages_total',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='scanrequest',
+            index=models.Index(fields=['status', 'requested_at'], name='core_scanre_status_53e013_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_scan_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='packagescanresult',
+            name='depth',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='scanresult',
+            name='dependency_graph',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_dependency_graph'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanrequest',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='dedup_result',
+            field=models.CharField(blank=True, choices=[('hit', 'Reused a fresh scan'), ('expired', 'Repeat of an expired scan'), ('miss', 'New content')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='scanrequest',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='core.scanrequest'),
+        ),
+        migrations.AddIndex(
+            model_name='scanrequest',
+            index=models.Index(fields=['content_hash', 'completed_at'], name='core_scanre_content_59323f_idx'),
+        ),
+    ]
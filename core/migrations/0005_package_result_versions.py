@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_scan_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='packagescanresult',
+            name='dependency_type',
+            field=models.CharField(blank=True, default='dependency', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='packagescanresult',
+            name='version',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='packagescanresult',
+            name='version_constraint',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_package_result_versions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='packagescanresult',
+            index=models.Index(fields=['scan_result', '-risk_score', 'id'], name='core_packag_scan_re_2dc04c_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_package_result_risk_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='scanresult',
+            index=models.Index(fields=['created_at'], name='core_scanre_created_5bdd22_idx'),
+        ),
+    ]
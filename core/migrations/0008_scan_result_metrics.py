@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_scan_result_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_scan_result_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='packagescanresult',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_package_result_error'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PackageRiskSnapshot',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('ecosystem', models.CharField(max_length=50)),
+                ('name', models.CharField(max_length=255)),
+                ('version', models.CharField(blank=True, default='', max_length=100)),
+                ('resolved_version', models.CharField(blank=True, default='', max_length=100)),
+                ('risk_score', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('vulnerabilities_found', models.IntegerField(default=0)),
+                ('is_deprecated', models.BooleanField(default=False)),
+                ('is_unmaintained', models.BooleanField(default=False)),
+                ('details', models.JSONField(default=dict)),
+                ('scorer_version', models.CharField(blank=True, default='', max_length=20)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('scan_result', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.scanresult')),
+            ],
+            options={
+                'unique_together': {('ecosystem', 'name', 'version')},
+            },
+        ),
+    ]
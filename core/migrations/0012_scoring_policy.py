@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_raw_data_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanresult',
+            name='scoring_policy',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AlterField(
+            model_name='packagerisksnapshot',
+            name='scorer_version',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_scoring_policy'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scanrequest',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
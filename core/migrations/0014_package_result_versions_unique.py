@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_scan_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='packagescanresult',
+            unique_together={('scan_result', 'package', 'version')},
+        ),
+    ]
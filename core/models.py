@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 import uuid
 from django.contrib.auth.models import User
 
@@ -64,12 +65,45 @@ class ScanRequest(models.Model):
         ('completed', 'Completed'),
         ('failed', 'Failed'),
     ], default='pending')
+    ecosystem = models.CharField(max_length=50, blank=True, default='')
+    file_content = models.TextField(blank=True, default='')  # Kept until a queued scan runs
+    options = models.JSONField(default=dict, blank=True)
+    # Identifies identical submissions; see core.dedup
+    content_hash = models.CharField(max_length=64, blank=True, default='')
+    duplicate_of = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='duplicates')
+    dedup_result = models.CharField(max_length=10, blank=True, default='', choices=[
+        ('hit', 'Reused a fresh scan'),
+        ('expired', 'Repeat of an expired scan'),
+        ('miss', 'New content'),
+    ])
+    packages_total = models.IntegerField(default=0)
+    packages_scanned = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
     requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed while a worker runs the scan; stale ones are requeued, see core.jobs
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'requested_at']),
+            models.Index(fields=['content_hash', 'completed_at']),
+        ]
+
     def __str__(self):
         return f"Scan {self.id} - {self.status}"
 
+    @property
+    def progress(self) -> float:
+        """Percentage of packages processed so far"""
+        if self.status == 'completed':
+            return 100.0
+        if not self.packages_total:
+            return 0.0
+        return round(100.0 * self.packages_scanned / self.packages_total, 2)
+
 
 class ScanResult(models.Model):
     """Results of a scan"""
@@ -77,12 +111,33 @@ class ScanResult(models.Model):
     scan_request = models.OneToOneField(ScanRequest, on_delete=models.CASCADE)
     overall_risk_score = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     report_path = models.CharField(max_length=500, null=True, blank=True)
+    dependency_graph = models.JSONField(null=True, blank=True)  # Transitive scans only
+    metrics = models.JSONField(null=True, blank=True)  # Stage timings and counts; see scanners.metrics
+    # RiskCalculator.version the scores were computed with: engine and scoring policy
+    scoring_policy = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),  # Date range exports
+        ]
+
     def __str__(self):
         return f"Result for {self.scan_request.id}"
 
 
+class RawDataBlob(models.Model):
+    """Package details JSON shared by every result that stored the same content; see core.blobs"""
+    digest = models.CharField(max_length=64, primary_key=True)  # SHA-256 of the canonical JSON
+    data = models.BinaryField()  # zlib-compressed canonical JSON
+    size = models.IntegerField()  # Uncompressed bytes
+    stored_size = models.IntegerField()  # Compressed bytes
+    created_at = models.DateTimeField(auto_now_add=True)  # Refreshed when reused; see core.blobs.prune_blobs
+
+    def __str__(self):
+        return f"{self.digest[:12]} ({self.stored_size}/{self.size} bytes)"
+
+
 class PackageScanResult(models.Model):
     """Individual package scan result"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -92,12 +147,48 @@ class PackageScanResult(models.Model):
     vulnerabilities_found = models.IntegerField(default=0)
     is_deprecated = models.BooleanField(default=False)
     is_unmaintained = models.BooleanField(default=False)
-    raw_data = models.JSONField(default=dict)  # Store raw API response
+    depth = models.IntegerField(default=0)  # 0 for direct dependencies
+    version = models.CharField(max_length=100, blank=True, default='')
+    version_constraint = models.CharField(max_length=255, blank=True, default='')  # As written in the manifest
+    dependency_type = models.CharField(max_length=20, blank=True, default='dependency')
+    error = models.TextField(blank=True, default='')  # Registry failure; the result is incomplete
+    raw_blob = models.ForeignKey(RawDataBlob, on_delete=models.PROTECT, null=True, blank=True,
+                                 related_name='+')  # Package details; see core.blobs
+    raw_data = models.JSONField(null=True, blank=True)  # Inline details of rows not yet compacted
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'core_packagescanresult'
-        unique_together = ['scan_result', 'package']
+        # Lockfiles can pin several versions of one package
+        unique_together = ['scan_result', 'package', 'version']
+        indexes = [
+            # Report pages are read riskiest first; see core.reports
+            models.Index(fields=['scan_result', '-risk_score', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.package.name} - Score: {self.risk_score}"
+
+
+class PackageRiskSnapshot(models.Model):
+    """Latest known risk of a package version, refreshed as scans complete; see core.snapshot"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    ecosystem = models.CharField(max_length=50)
+    name = models.CharField(max_length=255)
+    version = models.CharField(max_length=100, blank=True, default='')  # As checked; '' for the latest
+    resolved_version = models.CharField(max_length=100, blank=True, default='')
+    risk_score = models.DecimalField(max_digits=5, decimal_places=2)
+    vulnerabilities_found = models.IntegerField(default=0)
+    is_deprecated = models.BooleanField(default=False)
+    is_unmaintained = models.BooleanField(default=False)
+    details = models.JSONField(default=dict)
+    scorer_version = models.CharField(max_length=64, blank=True, default='')  # RiskCalculator.version
+    scan_result = models.ForeignKey(ScanResult, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='+')  # None when filled in by a package check
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['ecosystem', 'name', 'version']
 
     def __str__(self):
-        return f"{self.package.name} - Score: {self.risk_score}"
\ No newline at end of file
+        return f"{self.ecosystem}/{self.name}@{self.version or 'latest'}: {self.risk_score}"
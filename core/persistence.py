@@ -0,0 +1,389 @@
+from datetime import timedelta
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .blobs import attach_raw_data, store_blobs
+from .models import Package, PackageRiskSnapshot, PackageScanResult, ScanRequest, ScanResult
+from .service import RiskCalculator
+from .writer import single_writer
+
+
+PACKAGE_UPDATE_FIELDS = ['version', 'description', 'author', 'last_updated', 'updated_at']
+STORED_RESULT_FIELDS = (
+    'package_id', 'package__name', 'risk_score', 'vulnerabilities_found', 'is_deprecated',
+    'is_unmaintained', 'depth', 'version', 'version_constraint', 'dependency_type', 'error', 'raw_blob_id',
+    'raw_data',
+)
+SNAPSHOT_UPDATE_FIELDS = [
+    'resolved_version', 'risk_score', 'vulnerabilities_found', 'is_deprecated', 'is_unmaintained',
+    'details', 'scorer_version', 'scan_result', 'updated_at',
+]
+
+
+@single_writer
+def persist_scan(scan_request, ecosystem: str, results: List[Dict], overall_risk: float,
+                 dependency_graph: Optional[Dict] = None, scoring_policy: str = '') -> ScanResult:
+    """Store a finished scan with a constant number of queries
+
+    Packages are upserted in one statement, package results are inserted in
+    one batch and the scan request is marked completed, all in a single
+    transaction.
+    """
+    with transaction.atomic():
+        scan_result = ScanResult.objects.create(
+            scan_request=scan_request,
+            overall_risk_score=overall_risk,
+            report_path=f"/api/reports/{scan_request.id}.json",
+            dependency_graph=stored_graph(dependency_graph),
+            scoring_policy=scoring_policy,
+        )
+
+        scan_request.packages_total = len(results)
+        scan_request.packages_scanned = len(results)
+
+        # Transitive package versions already listed as direct dependencies are skipped
+        results = results + transitive_results(dependency_graph)
+        packages = upsert_packages(ecosystem, results)
+        create_package_results(scan_result, packages, results)
+        update_risk_snapshot(ecosystem, results, scan_result)
+
+        scan_request.status = 'completed'
+        scan_request.completed_at = timezone.now()
+        scan_request.save(update_fields=['status', 'packages_total', 'packages_scanned', 'completed_at'])
+
+    return scan_result
+
+
+@single_writer
+def persist_incremental_scan(scan_request, ecosystem: str, copied_rows: List[Dict],
+                             results: List[Dict], overall_risk: float, scoring_policy: str = '') -> ScanResult:
+    """Store a rescan: rows carried over from the base scan plus the newly scored results"""
+    with transaction.atomic():
+        scan_result = ScanResult.objects.create(
+            scan_request=scan_request,
+            overall_risk_score=overall_risk,
+            report_path=f"/api/reports/{scan_request.id}.json",
+            scoring_policy=scoring_policy,
+        )
+        copy_package_results(scan_result, copied_rows)
+        packages = upsert_packages(ecosystem, results)
+        create_package_results(scan_result, packages, results)
+        update_risk_snapshot(ecosystem, results, scan_result)
+
+        scan_request.status = 'completed'
+        scan_request.packages_total = len(copied_rows) + len(results)
+        scan_request.packages_scanned = scan_request.packages_total
+        scan_request.completed_at = timezone.now()
+        scan_request.save(update_fields=['status', 'packages_total', 'packages_scanned', 'completed_at'])
+
+    return scan_result
+
+
+@single_writer
+def start_scan(scan_request, packages_total: int, scoring_policy: str = '') -> ScanResult:
+    """Create the (still empty) result of a scan that stores partial results"""
+    with transaction.atomic():
+        scan_result = ScanResult.objects.create(
+            scan_request=scan_request,
+            report_path=f"/api/reports/{scan_request.id}.json",
+            scoring_policy=scoring_policy,
+        )
+        scan_request.packages_total = packages_total
+        scan_request.packages_scanned = 0
+        scan_request.save(update_fields=['packages_total', 'packages_scanned'])
+
+    return scan_result
+
+
+@single_writer
+def persist_partial_results(scan_result: ScanResult, ecosystem: str, results: List[Dict],
+                            count_progress: bool = True):
+    """Store one chunk of a running scan and advance its progress"""
+    with transaction.atomic():
+        packages = upsert_packages(ecosystem, results)
+        # A package version may reappear in a later chunk; the first row wins
+        create_package_results(scan_result, packages, results, ignore_conflicts=True)
+        update_risk_snapshot(ecosystem, results, scan_result)
+        if count_progress:
+            ScanRequest.objects.filter(id=scan_result.scan_request_id).update(
+                packages_scanned=F('packages_scanned') + len(results)
+            )
+
+
+@single_writer
+def complete_scan(scan_request, scan_result: ScanResult, overall_risk: float,
+                  dependency_graph: Optional[Dict] = None):
+    """Record the overall score of a scan that stored partial results"""
+    with transaction.atomic():
+        scan_result.overall_risk_score = overall_risk
+        scan_result.dependency_graph = stored_graph(dependency_graph)
+        scan_result.save(update_fields=['overall_risk_score', 'dependency_graph'])
+
+        scan_request.status = 'completed'
+        scan_request.packages_scanned = scan_request.packages_total
+        scan_request.file_content = ''
+        scan_request.completed_at = timezone.now()
+        scan_request.save(update_fields=['status', 'packages_scanned', 'file_content', 'completed_at'])
+
+
+@single_writer
+def store_scan_metrics(scan_result: ScanResult, metrics: Dict):
+    """Keep a finished scan's timing summary with its result"""
+    scan_result.metrics = metrics
+    scan_result.save(update_fields=['metrics'])
+
+
+@single_writer
+def touch_scan(scan_id, started_at) -> bool:
+    """Refresh the heartbeat of a scan; False once it is no longer the run claimed at started_at"""
+    return bool(ScanRequest.objects.filter(id=scan_id, status='processing', started_at=started_at).update(
+        heartbeat_at=timezone.now()
+    ))
+
+
+@single_writer
+def requeue_stale_scans(stale_after: int) -> int:
+    """Return scans whose worker stopped sending heartbeats to the queue, dropping partial results"""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    stale = list(ScanRequest.objects.filter(status='processing', heartbeat_at__lt=cutoff)
+                 .values_list('id', flat=True)[:100])
+    requeued = 0
+    with transaction.atomic():
+        for scan_id in stale:
+            # Checked again per row in case the scan finished or was requeued meanwhile
+            if ScanRequest.objects.filter(id=scan_id, status='processing', heartbeat_at__lt=cutoff).update(
+                status='pending', packages_scanned=0, started_at=None, heartbeat_at=None,
+            ):
+                ScanResult.objects.filter(scan_request_id=scan_id).delete()
+                requeued += 1
+    return requeued
+
+
+@single_writer
+def fail_scan(scan_request, error: str):
+    """Mark a scan as failed"""
+    scan_request.status = 'failed'
+    scan_request.error = error
+    scan_request.completed_at = timezone.now()
+    scan_request.save(update_fields=['status', 'error', 'completed_at'])
+
+
+def stored_graph(dependency_graph: Optional[Dict]) -> Optional[Dict]:
+    """The graph as kept on ScanResult; per-node details live in the result rows"""
+    if not dependency_graph:
+        return dependency_graph
+    return dict(
+        dependency_graph,
+        nodes=[
+            {k: v for k, v in node.items() if k != 'details'}
+            for node in dependency_graph['nodes']
+        ],
+    )
+
+
+def package_details(package_info: Dict) -> Dict:
+    """Scalar package fields kept as raw_data, enough to rescore the row later"""
+    details = {
+        k: v for k, v in package_info.items()
+        if k not in ['error'] and not isinstance(v, (dict, list))
+    }
+    downloads = package_info.get('downloads')
+    if isinstance(downloads, dict):
+        details['downloads'] = downloads.get('downloads', 0)
+    return details
+
+
+def transitive_results(dependency_graph: Optional[Dict]) -> List[Dict]:
+    """Result rows for the indirect dependencies of a resolved graph"""
+    if not dependency_graph:
+        return []
+    return [
+        {
+            'package': node['name'],
+            'version': node['version'],
+            'risk_score': node['risk_score'],
+            'has_vulnerabilities': node['has_vulnerabilities'],
+            'is_deprecated': node['is_deprecated'],
+            'depth': node['depth'],
+            'details': node.get('details', {}),
+        }
+        for node in dependency_graph['nodes'] if node['depth'] > 0
+    ]
+
+
+def stored_results(scan_result: ScanResult, with_raw_data: bool = True, **filters) -> List[Dict]:
+    """Package result rows of a stored scan as plain dicts
+
+    Without with_raw_data, raw_data is only set on rows not yet compacted
+    into blobs; that is enough to copy the rows.
+    """
+    rows = list(
+        PackageScanResult.objects.filter(scan_result=scan_result, **filters)
+        .values(*STORED_RESULT_FIELDS)
+    )
+    return attach_raw_data(rows) if with_raw_data else rows
+
+
+def stored_result(row: Dict) -> Dict:
+    """A stored_results row shaped like a pipeline result"""
+    return {
+        'package': row['package__name'],
+        'version': row['version'] or row['raw_data'].get('version', 'unknown'),
+        'version_constraint': row['version_constraint'],
+        'type': row['dependency_type'],
+        'risk_score': float(row['risk_score']),
+        'has_vulnerabilities': row['vulnerabilities_found'] > 0,
+        'is_deprecated': row['is_deprecated'],
+        'incomplete': bool(row['error']),
+        'error': row['error'] or None,
+        'details': row['raw_data'],
+    }
+
+
+def copy_package_results(scan_result: ScanResult, rows: List[Dict]) -> List[PackageScanResult]:
+    """Insert copies of stored_results rows into another scan in one batch
+
+    Copies share the original's details blob.
+    """
+    copied_fields = [field for field in STORED_RESULT_FIELDS if field not in ('package__name', 'raw_data')]
+    return PackageScanResult.objects.bulk_create([
+        PackageScanResult(
+            scan_result=scan_result,
+            raw_data=None if row['raw_blob_id'] else row['raw_data'],
+            **{field: row[field] for field in copied_fields}
+        )
+        for row in rows
+    ])
+
+
+def upsert_packages(ecosystem: str, results: List[Dict]) -> Dict[str, Package]:
+    """Insert or update one Package row per scanned name, keyed by name"""
+    now = timezone.now()
+    rows = {}
+    for result in results:
+        details = result.get('details', {})
+        rows[result['package']] = Package(
+            name=result['package'],
+            ecosystem=ecosystem,
+            version=details.get('version'),
+            description=details.get('description', ''),
+            author=details.get('author', ''),
+            last_updated=now,  # Placeholder
+            updated_at=now,
+        )
+
+    if not rows:
+        return {}
+
+    Package.objects.bulk_create(
+        rows.values(),
+        update_conflicts=True,
+        unique_fields=['name', 'ecosystem'],
+        update_fields=PACKAGE_UPDATE_FIELDS,
+    )
+
+    # Conflicting rows keep their existing primary key, so read ids back
+    return {
+        package.name: package
+        for package in Package.objects.filter(
+            ecosystem=ecosystem, name__in=list(rows)
+        ).only('id', 'name')
+    }
+
+
+def create_package_results(scan_result: ScanResult, packages: Dict[str, Package],
+                           results: List[Dict], ignore_conflicts: bool = False) -> List[PackageScanResult]:
+    """Insert every PackageScanResult for a scan in one batch"""
+    rows = {}
+    for result in results:
+        key = (result['package'], result.get('version') or '')
+        previous = rows.get(key)
+        # One row per package version and scan; keep the shallowest, then the riskiest entry
+        if previous is not None and (
+            (previous.get('depth', 0), -previous['risk_score'])
+            <= (result.get('depth', 0), -result['risk_score'])
+        ):
+            continue
+        rows[key] = result
+
+    # Details are stored once per distinct content, and referenced by digest
+    digests = store_blobs([result['details'] for result in rows.values()])
+    return PackageScanResult.objects.bulk_create([
+        PackageScanResult(
+            scan_result=scan_result,
+            package=packages[result['package']],
+            risk_score=result['risk_score'],
+            vulnerabilities_found=result['details'].get(
+                'vulnerability_count', 1 if result['has_vulnerabilities'] else 0
+            ),
+            is_deprecated=result['is_deprecated'],
+            depth=result.get('depth', 0),
+            version=result.get('version') or '',
+            version_constraint=result.get('version_constraint') or '',
+            dependency_type=result.get('type', 'dependency'),
+            error=result.get('error') or '',
+            raw_blob_id=digest,
+        )
+        for result, digest in zip(rows.values(), digests)
+    ], ignore_conflicts=ignore_conflicts)
+
+
+def snapshot_entry(ecosystem: str, version: str, result: Dict, scan_result: Optional[ScanResult] = None,
+                   now=None, scorer_version: Optional[str] = None) -> PackageRiskSnapshot:
+    """A risk snapshot row for a scored result, stored under version
+
+    scorer_version defaults to the scan's scoring policy, or the current one.
+    """
+    details = result.get('details', {})
+    return PackageRiskSnapshot(
+        ecosystem=ecosystem,
+        name=result['package'],
+        version=version,
+        resolved_version=result.get('version') or '',
+        risk_score=round(result['risk_score'], 2),
+        vulnerabilities_found=details.get(
+            'vulnerability_count', 1 if result['has_vulnerabilities'] else 0
+        ),
+        is_deprecated=result['is_deprecated'],
+        is_unmaintained=bool(details.get('is_unmaintained', False)),
+        details=details,
+        scorer_version=scorer_version or (scan_result and scan_result.scoring_policy) or RiskCalculator().version,
+        scan_result=scan_result,
+        updated_at=now or timezone.now(),
+    )
+
+
+@single_writer
+def save_snapshot(entries: List[PackageRiskSnapshot]):
+    """Insert or replace snapshot rows in one statement; the last entry for a key wins"""
+    rows = {(entry.ecosystem, entry.name, entry.version): entry for entry in entries}
+    if not rows:
+        return
+    PackageRiskSnapshot.objects.bulk_create(
+        rows.values(),
+        update_conflicts=True,
+        unique_fields=['ecosystem', 'name', 'version'],
+        update_fields=SNAPSHOT_UPDATE_FIELDS,
+    )
+
+
+def update_risk_snapshot(ecosystem: str, results: List[Dict], scan_result: Optional[ScanResult] = None):
+    """Record the complete results of a scan as the latest risk of each resolved version
+
+    A version that is the registry's latest release is also recorded under
+    '', so name-only checks are answered from it too.
+    """
+    now = timezone.now()
+    scorer_version = (scan_result and scan_result.scoring_policy) or RiskCalculator().version
+    entries = []
+    for result in results:
+        # A failed lookup's score is a guess, and without a version there is no key
+        if result.get('error') or result.get('version') in (None, '', 'unknown'):
+            continue
+        entries.append(snapshot_entry(ecosystem, result['version'], result, scan_result, now, scorer_version))
+        if result['version'] == result.get('details', {}).get('latest_version'):
+            entries.append(snapshot_entry(ecosystem, '', result, scan_result, now, scorer_version))
+    save_snapshot(entries)
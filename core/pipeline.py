@@ -0,0 +1,275 @@
+from contextlib import contextmanager
+from itertools import islice
+from typing import Dict, List, Optional
+
+from scanners import ScannerFactory
+from scanners.fetcher import PackageFetcher
+from scanners.metrics import ScanMetrics, span
+
+from .models import ScanResult
+from .persistence import (
+    complete_scan, package_details, persist_incremental_scan, persist_partial_results, persist_scan,
+    start_scan, store_scan_metrics, stored_result, stored_results, transitive_results,
+)
+from .resolver import DependencyResolver, node_id
+from .service import RiskCalculator
+
+
+def calculate_overall_risk(results: List[Dict]) -> float:
+    """Average risk score of a scan's packages"""
+    return sum(r['risk_score'] for r in results) / len(results) if results else 0
+
+
+class ScanPipeline:
+    """Parse a manifest, fetch and score its dependencies and store the results"""
+
+    def __init__(self, scan_request, ecosystem: str, concurrency: Optional[int] = None,
+                 transitive: bool = False, metrics: Optional[ScanMetrics] = None):
+        self.scan_request = scan_request
+        self.ecosystem = ecosystem
+        self.concurrency = concurrency
+        self.transitive = transitive
+        self.scanner = ScannerFactory.get_scanner(ecosystem)
+        self.fetcher = PackageFetcher(self.scanner, max_workers=concurrency)
+        self.risk_calculator = RiskCalculator()
+        # Callers that parse the manifest before the scan starts time it here too
+        self.metrics = metrics or ScanMetrics()
+
+    @contextmanager
+    def instrument(self):
+        """Attribute stage timings, registry requests, cache lookups and queries to this scan"""
+        with self.metrics.activate(), self.metrics.count_queries():
+            yield
+
+    def run(self, file_content: str, dependencies: Optional[List[Dict]] = None) -> Dict:
+        """Scan in one pass and persist everything at the end
+
+        dependencies, when given, are file_content already parsed.
+        """
+        with self.instrument():
+            if dependencies is None:
+                with span('parse'):
+                    dependencies = self.scanner.parse_dependencies(file_content)
+            resolver = self.resolver() if self.transitive else None
+            results = self.score(dependencies, resolver)
+            overall_risk = calculate_overall_risk(results)
+
+            dependency_graph = None
+            if self.transitive:
+                dependency_graph = self.resolve_graph(dependencies, resolver)
+                self.annotate_subtree_risk(results, dependency_graph)
+
+            with span('persist'):
+                scan_result = persist_scan(
+                    self.scan_request, self.ecosystem, results, overall_risk, dependency_graph,
+                    scoring_policy=self.risk_calculator.version,
+                )
+        store_scan_metrics(scan_result, self.metrics.finish())
+
+        return {
+            'scan_result': scan_result,
+            'results': results,
+            'overall_risk': overall_risk,
+            'dependency_graph': scan_result.dependency_graph,
+        }
+
+    def run_in_chunks(self, file_content: str, chunk_size: int) -> Dict:
+        """Scan chunk by chunk, storing partial results and progress as it goes
+
+        Dependencies are read from the file as they are needed, so a large
+        lockfile is never held fully parsed.
+        """
+        with self.instrument():
+            # A first streaming pass only counts, to report progress
+            with span('parse'):
+                packages_total = sum(1 for _ in self.scanner.iter_dependencies(file_content))
+            with span('persist'):
+                scan_result = start_scan(self.scan_request, packages_total,
+                                         scoring_policy=self.risk_calculator.version)
+
+            dependencies = self.scanner.iter_dependencies(file_content)
+            resolver = self.resolver() if self.transitive else None
+            direct = []
+            scanned = 0
+            total_risk = 0.0
+            while True:
+                with span('parse'):
+                    chunk = list(islice(dependencies, chunk_size))
+                if not chunk:
+                    break
+                results = self.score(chunk, resolver)
+                with span('persist'):
+                    persist_partial_results(scan_result, self.ecosystem, results)
+                total_risk += sum(r['risk_score'] for r in results)
+                scanned += len(chunk)
+                if self.transitive:
+                    direct.extend(chunk)
+
+            overall_risk = total_risk / scanned if scanned else 0
+
+            dependency_graph = None
+            if self.transitive:
+                dependency_graph = self.resolve_graph(direct, resolver)
+                with span('persist'):
+                    persist_partial_results(scan_result, self.ecosystem,
+                                            transitive_results(dependency_graph), count_progress=False)
+
+            with span('persist'):
+                complete_scan(self.scan_request, scan_result, overall_risk, dependency_graph)
+        store_scan_metrics(scan_result, self.metrics.finish())
+
+        return {
+            'scan_result': scan_result,
+            'overall_risk': overall_risk,
+        }
+
+    def run_incremental(self, file_content: str, base_scan_request,
+                        dependencies: Optional[List[Dict]] = None) -> Dict:
+        """Rescan against an earlier scan, fetching and scoring only what changed
+
+        Direct dependencies are matched by name. Those whose manifest
+        constraint is unchanged are copied forward from the base scan
+        without re-resolving their ranges.
+        """
+        with self.instrument():
+            scan = self._run_incremental(file_content, base_scan_request, dependencies)
+        store_scan_metrics(scan['scan_result'], self.metrics.finish())
+        return scan
+
+    def _run_incremental(self, file_content: str, base_scan_request,
+                         dependencies: Optional[List[Dict]] = None) -> Dict:
+        if self.transitive:
+            raise ValueError('Incremental rescans do not support transitive scans')
+        base_scan_result = ScanResult.objects.filter(
+            scan_request=base_scan_request, scan_request__status='completed'
+        ).first()
+        if base_scan_result is None or base_scan_request.ecosystem not in ('', self.ecosystem):
+            raise ValueError('Base scan must be a completed scan of the same ecosystem')
+        if base_scan_result.dependency_graph is not None:
+            raise ValueError('Base scan is a transitive scan')
+
+        if dependencies is None:
+            with span('parse'):
+                dependencies = self.scanner.parse_dependencies(file_content)
+        # Lockfiles can pin several versions of one name, so match whole groups
+        base_rows = {}
+        for row in stored_results(base_scan_result, depth=0):
+            base_rows.setdefault(row['package__name'], []).append(row)
+        by_name = {}
+        for dep in dependencies:
+            by_name.setdefault(dep['name'], []).append(dep)
+
+        diff = {'added': [], 'changed': [], 'removed': [], 'unchanged': 0}
+        copied = {}
+        to_scan = []
+        for name, deps in by_name.items():
+            constraints = sorted(str(dep.get('version') or '') for dep in deps)
+            rows = base_rows.get(name)
+            if rows is not None and '' not in constraints and constraints == sorted(
+                row['version_constraint'] for row in rows
+            ) and not any(row['error'] for row in rows):
+                types = {str(dep.get('version') or ''): dep.get('type', 'dependency') for dep in deps}
+                copied[name] = [
+                    dict(row, dependency_type=types[row['version_constraint']]) for row in rows
+                ]
+                diff['unchanged'] += 1
+                continue
+
+            to_scan.extend(deps)
+            if rows is None:
+                diff['added'].append({'package': name, 'version_constraint': ', '.join(constraints)})
+            else:
+                diff['changed'].append({
+                    'package': name,
+                    'from': ', '.join(sorted(row['version_constraint'] for row in rows)),
+                    'to': ', '.join(constraints),
+                    'previous_version': ', '.join(sorted(row['version'] for row in rows)),
+                })
+        diff['removed'] = [
+            {'package': name, 'version_constraint': ', '.join(row['version_constraint'] for row in rows)}
+            for name, rows in base_rows.items() if name not in by_name
+        ]
+
+        scanned = self.score(to_scan)
+        copied_rows = [row for rows in copied.values() for row in rows]
+        # Unchanged scores are reused as stored; only new scores are added in
+        total_risk = (
+            sum(float(row['risk_score']) for row in copied_rows)
+            + sum(r['risk_score'] for r in scanned)
+        )
+        # Averaged over the rows summed; a lockfile's duplicate entries are stored once
+        summed = len(copied_rows) + len(scanned)
+        overall_risk = total_risk / summed if summed else 0
+
+        with span('persist'):
+            scan_result = persist_incremental_scan(
+                self.scan_request, self.ecosystem, copied_rows, scanned, overall_risk,
+                scoring_policy=self.risk_calculator.version,
+            )
+
+        scanned_by_name = {}
+        for result in scanned:
+            scanned_by_name.setdefault(result['package'], []).append(result)
+        results = []
+        for name in by_name:
+            if name in copied:
+                results.extend(stored_result(row) for row in copied[name])
+            else:
+                results.extend(scanned_by_name.get(name, []))
+
+        return {
+            'scan_result': scan_result,
+            'results': results,
+            'overall_risk': overall_risk,
+            'dependency_graph': None,
+            'diff': diff,
+        }
+
+    def resolver(self) -> DependencyResolver:
+        return DependencyResolver(self.scanner, self.risk_calculator, max_workers=self.concurrency)
+
+    def resolve_graph(self, dependencies: List[Dict], resolver: Optional[DependencyResolver] = None) -> Dict:
+        """Resolve the transitive dependency graph, reusing direct dependencies seeded into resolver"""
+        resolver = resolver or self.resolver()
+        with span('resolve'):
+            return resolver.resolve(dependencies)
+
+    def annotate_subtree_risk(self, results: List[Dict], dependency_graph: Dict):
+        """Add the riskiest package below each direct dependency to its result"""
+        subtree_risk = dependency_graph['subtree_risk']
+        for result in results:
+            subtree = subtree_risk.get(node_id(result['package'], result['version']))
+            if subtree is not None:
+                result['transitive_risk_score'] = subtree['max_risk']
+                result['transitive_packages'] = subtree['packages'] - 1
+
+    def score(self, dependencies: List[Dict], resolver: Optional[DependencyResolver] = None) -> List[Dict]:
+        """Fetch registry metadata concurrently and score each dependency
+
+        With a resolver, the fetched and scored packages are seeded into it so
+        resolving the graph does not fetch and score them again.
+        """
+        package_infos = self.fetcher.fetch(dependencies)
+        with span('score'):
+            risk_scores = self.risk_calculator.score_batch(package_infos)
+        if resolver is not None:
+            resolver.seed(dependencies, package_infos, risk_scores)
+
+        results = []
+        for dep, package_info, risk_score in zip(dependencies, package_infos, risk_scores):
+            results.append({
+                'package': dep['name'],
+                'version': package_info.get('version', 'unknown'),
+                'version_constraint': dep.get('version', ''),
+                'type': dep.get('type', 'dependency'),
+                'risk_score': float(risk_score),
+                'has_vulnerabilities': package_info.get('has_vulnerabilities', False),
+                'vulnerabilities': package_info.get('vulnerabilities', []),
+                'is_deprecated': package_info.get('is_deprecated', False),
+                # The registry could not be read, so the score is a guess
+                'incomplete': 'error' in package_info,
+                'error': package_info.get('error'),
+                'details': package_details(package_info),
+            })
+
+        return results
@@ -0,0 +1,235 @@
+import bisect
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from datetime import date
+from typing import Callable, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+
+logger = logging.getLogger(__name__)
+
+# License classes, in the order they are checked
+LICENSE_SAFE, LICENSE_RISKY, LICENSE_UNKNOWN, LICENSE_OTHER = range(4)
+LICENSE_CLASS_NAMES = {'safe': LICENSE_SAFE, 'risky': LICENSE_RISKY, 'unknown': LICENSE_UNKNOWN,
+                       'other': LICENSE_OTHER}
+
+DEFAULT_POLICY = {
+    'name': 'default',
+    'weights': {
+        'security': 0.4,
+        'maintenance': 0.3,
+        'popularity': 0.2,
+        'license': 0.1,
+    },
+    'security': {
+        'vulnerable': 40,
+        # Any of these in the name
+        'suspicious_name': 20,
+        'suspicious_keywords': ['test', 'example', 'demo', 'fake', 'malicious'],
+        # A typo away from a popular package; see scanners.typosquat_index
+        'typosquat': 30,
+        'unknown_author': 10,
+        'unknown_authors': ['unknown', 'anonymous', ''],
+    },
+    'maintenance': {
+        'deprecated': 50,
+        'unmaintained': 30,
+        # [date, risk]: risk added when the last update is before date; the earliest match wins,
+        # so updates older than the first date get its risk too (scoring before policies only
+        # penalised 2019 and 2020, leaving older packages at 0)
+        'last_updated_before': [['2021-01-01', 20], ['2022-01-01', 15], ['2023-01-01', 10], ['2024-01-01', 5]],
+    },
+    'popularity': {
+        # Download thresholds in ascending order, and the risk below each (one more for above all)
+        'thresholds': [100, 1000, 10000, 100000],
+        'scores': [80, 60, 40, 20, 10],
+    },
+    'license': {
+        # Any of these in the license text, checked in this order
+        'safe': ['mit', 'apache', 'bsd', 'isc', 'unlicense'],
+        'risky': ['gpl', 'agpl', 'lgpl'],
+        # Also when there is no license at all
+        'unknown': ['unknown', 'proprietary'],
+        'scores': {'safe': 10, 'risky': 50, 'unknown': 70, 'other': 30},
+    },
+}
+
+# A leading ISO date, or failing that any year in the text
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+YEAR = re.compile(r'(?<!\d)(?:19|20)\d{2}(?!\d)')
+# Distinct license strings remembered per policy
+LICENSE_MEMO_SIZE = 10000
+
+
+def _any_of(words) -> Optional[re.Pattern]:
+    """One regex finding any of words as a substring, or None for no words"""
+    words = [word.lower() for word in words if word]
+    if not words:
+        return None
+    return re.compile('|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)))
+
+
+class ScoringPolicy:
+    """A risk scoring policy compiled into lookup tables
+
+    Keyword lists become single regexes, author lists sets, date thresholds
+    sorted ISO date strings searched with bisect, and license texts are
+    classified once each and remembered.
+    """
+
+    def __init__(self, config: Dict):
+        self.config = config
+        canonical = json.dumps(config, sort_keys=True, separators=(',', ':'))
+        # Recorded with every score, so it fits ScanResult.scoring_policy
+        self.version = f"{str(config.get('name', 'custom'))[:32]}-{hashlib.sha256(canonical.encode()).hexdigest()[:12]}"
+
+        try:
+            self.weights = {factor: float(config['weights'][factor])
+                            for factor in ('security', 'maintenance', 'popularity', 'license')}
+
+            security = config['security']
+            self.vulnerable_score = security['vulnerable']
+            self.suspicious_score = security['suspicious_name']
+            self.suspicious_names = _any_of(security['suspicious_keywords'])
+            self.typosquat_score = security['typosquat']
+            self.unknown_author_score = security['unknown_author']
+            self.unknown_authors = frozenset(author.lower() for author in security['unknown_authors']) | {''}
+
+            maintenance = config['maintenance']
+            self.deprecated_score = maintenance['deprecated']
+            self.unmaintained_score = maintenance['unmaintained']
+            cutoffs = sorted(
+                (date.fromisoformat(cutoff).isoformat(), score)
+                for cutoff, score in maintenance['last_updated_before']
+            )
+            self.update_cutoffs = [cutoff for cutoff, _ in cutoffs]
+            self.update_scores = [score for _, score in cutoffs]
+
+            popularity = config['popularity']
+            self.popularity_thresholds = list(popularity['thresholds'])
+            self.popularity_scores = [float(score) for score in popularity['scores']]
+            if self.popularity_thresholds != sorted(self.popularity_thresholds):
+                raise ValueError('popularity thresholds must be ascending')
+            if len(self.popularity_scores) != len(self.popularity_thresholds) + 1:
+                raise ValueError('popularity needs one more score than thresholds')
+
+            licenses = config['license']
+            self.license_patterns = [
+                (LICENSE_SAFE, _any_of(licenses['safe'])),
+                (LICENSE_RISKY, _any_of(licenses['risky'])),
+            ]
+            self.unknown_licenses = _any_of(licenses['unknown'])
+            self.license_scores = {
+                LICENSE_CLASS_NAMES[name]: score for name, score in licenses['scores'].items()
+            }
+            missing = set(LICENSE_CLASS_NAMES.values()) - set(self.license_scores)
+            if missing:
+                raise ValueError('license scores need safe, risky, unknown and other')
+        except (KeyError, TypeError, ValueError) as e:
+            raise ImproperlyConfigured(f'Invalid risk scoring policy {self.version}: {e!r}')
+
+        self._license_classes: Dict[str, int] = {}
+
+    def has_suspicious_name(self, name: str) -> bool:
+        return self.suspicious_names is not None and self.suspicious_names.search(name.lower()) is not None
+
+    def has_unknown_author(self, author: str) -> bool:
+        return author.lower() in self.unknown_authors
+
+    def update_age_score(self, last_updated: str) -> int:
+        """Risk added for a last update before the policy's cutoffs"""
+        match = ISO_DATE.match(last_updated)
+        if match:
+            updated = match.group()
+        else:
+            year = YEAR.search(last_updated)
+            if year is None:
+                return 0
+            updated = f'{year.group()}-01-01'
+        position = bisect.bisect_right(self.update_cutoffs, updated)
+        return self.update_scores[position] if position < len(self.update_scores) else 0
+
+    def popularity_score(self, downloads: int) -> float:
+        return self.popularity_scores[bisect.bisect_right(self.popularity_thresholds, downloads)]
+
+    def license_class(self, license_text: str) -> int:
+        license_text = license_text.lower()
+        license_class = self._license_classes.get(license_text)
+        if license_class is None:
+            license_class = self._classify_license(license_text)
+            if len(self._license_classes) < LICENSE_MEMO_SIZE:
+                self._license_classes[license_text] = license_class
+        return license_class
+
+    def _classify_license(self, license_text: str) -> int:
+        for license_class, pattern in self.license_patterns:
+            if pattern is not None and pattern.search(license_text):
+                return license_class
+        if not license_text or (self.unknown_licenses is not None and self.unknown_licenses.search(license_text)):
+            return LICENSE_UNKNOWN
+        return LICENSE_OTHER
+
+
+def merge_policy(overrides: Optional[Dict]) -> Dict:
+    """DEFAULT_POLICY with the sections of overrides laid over it, key by key"""
+    policy = copy.deepcopy(DEFAULT_POLICY)
+    for key, value in (overrides or {}).items():
+        if isinstance(value, dict) and isinstance(policy.get(key), dict):
+            policy[key].update(value)
+        else:
+            policy[key] = value
+    return policy
+
+
+def _policy_source() -> Tuple[str, Callable[[], Optional[Dict]]]:
+    """(key that changes whenever the policy does, function reading its overrides)
+
+    RISK_POLICY_PATH is keyed by its modification time, RISK_POLICY by its contents.
+    """
+    path = getattr(settings, 'RISK_POLICY_PATH', None)
+    if path:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+
+        def read_file():
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        return f'file:{path}:{mtime}', read_file
+    overrides = getattr(settings, 'RISK_POLICY', None) or {}
+    return 'settings:' + json.dumps(overrides, sort_keys=True, default=str), lambda: overrides
+
+
+_policy_state = {'key': None, 'policy': None}
+_policy_lock = threading.Lock()
+
+
+def get_scoring_policy() -> ScoringPolicy:
+    """The current compiled policy, recompiled whenever its file or setting changes
+
+    A policy that fails to load or compile is logged once and the previous
+    one stays in use; with no previous policy the error is raised.
+    """
+    key, read_overrides = _policy_source()
+    if key != _policy_state['key']:
+        with _policy_lock:
+            if key != _policy_state['key']:
+                try:
+                    policy = ScoringPolicy(merge_policy(read_overrides()))
+                except (OSError, ValueError, ImproperlyConfigured):
+                    if _policy_state['policy'] is None:
+                        raise
+                    logger.exception('Could not load the risk scoring policy; keeping %s',
+                                     _policy_state['policy'].version)
+                    policy = _policy_state['policy']
+                _policy_state['policy'] = policy
+                _policy_state['key'] = key
+    return _policy_state['policy']
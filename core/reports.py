@@ -0,0 +1,91 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterator, List, Optional, Tuple
+from uuid import UUID
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import PackageScanResult, ScanResult
+
+
+# Columns a report row is built from; nothing else is loaded, raw_data included
+REPORT_FIELDS = (
+    'id', 'package__name', 'package__ecosystem', 'risk_score', 'vulnerabilities_found',
+    'is_deprecated', 'is_unmaintained', 'depth', 'version', 'error',
+)
+# Riskiest first; the id makes the order total so cursors never skip or repeat rows
+REPORT_ORDERING = ('-risk_score', 'id')
+
+
+def get_page_size(requested=None) -> int:
+    """Rows per report page: the requested limit, capped at SCAN_REPORT_MAX_PAGE_SIZE"""
+    default = getattr(settings, 'SCAN_REPORT_PAGE_SIZE', 500)
+    maximum = getattr(settings, 'SCAN_REPORT_MAX_PAGE_SIZE', 5000)
+    if requested in (None, ''):
+        return default
+    try:
+        limit = int(requested)
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    return min(limit, maximum)
+
+
+def encode_cursor(row: Dict) -> str:
+    """Opaque cursor pointing just after a report row"""
+    position = json.dumps([str(row['risk_score']), str(row['id'])])
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[Decimal, UUID]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        risk_score, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return Decimal(risk_score), UUID(row_id)
+    except (ValueError, TypeError, InvalidOperation):
+        raise ValueError('Invalid cursor')
+
+
+def report_rows(scan_result: ScanResult, cursor: Optional[str] = None):
+    """Report rows of a scan as dicts, in report order, starting after cursor"""
+    rows = PackageScanResult.objects.filter(scan_result=scan_result)
+    if cursor:
+        risk_score, row_id = decode_cursor(cursor)
+        rows = rows.filter(Q(risk_score__lt=risk_score) | Q(risk_score=risk_score, id__gt=row_id))
+    return rows.order_by(*REPORT_ORDERING).values(*REPORT_FIELDS)
+
+
+def report_page(scan_result: ScanResult, cursor: Optional[str] = None,
+                limit: Optional[int] = None) -> Tuple[List[Dict], Optional[str]]:
+    """One page of results and the cursor of the next page, None on the last one"""
+    limit = limit or get_page_size()
+    # One extra row tells whether there is a next page without a count
+    rows = list(report_rows(scan_result, cursor)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return [report_result(row) for row in rows[:limit]], next_cursor
+
+
+def iter_report(scan_result: ScanResult, chunk_size: Optional[int] = None) -> Iterator[Dict]:
+    """Every result of a scan, fetched chunk_size rows at a time"""
+    chunk_size = chunk_size or getattr(settings, 'SCAN_REPORT_STREAM_CHUNK_SIZE', 2000)
+    for row in report_rows(scan_result).iterator(chunk_size=chunk_size):
+        yield report_result(row)
+
+
+def report_result(row: Dict) -> Dict:
+    return {
+        'package': row['package__name'],
+        'ecosystem': row['package__ecosystem'],
+        # Lockfiles can list several versions of one package
+        'version': row['version'] or None,
+        'risk_score': float(row['risk_score']),
+        'vulnerabilities_found': row['vulnerabilities_found'],
+        'is_deprecated': row['is_deprecated'],
+        'is_unmaintained': row['is_unmaintained'],
+        'depth': row['depth'],
+        'incomplete': bool(row['error']),
+        'error': row['error'] or None,
+    }
@@ -0,0 +1,260 @@
+from collections import deque
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from scanners.fetcher import PackageFetcher
+from scanners.vulnerability_index import get_vulnerability_index
+
+from .persistence import package_details
+from .service import RiskCalculator
+
+
+def node_id(name: str, version: str) -> str:
+    return f"{name}@{version}"
+
+
+class DependencyResolver:
+    """Resolve the full dependency graph of a manifest breadth-first
+
+    Nodes are deduplicated by (name, resolved version). Each level of the
+    graph is fetched concurrently. Scored nodes, together with the versions
+    their own dependencies resolved to, are memoized in the shared metadata
+    cache, so a subtree seen by an earlier scan is walked again without any
+    registry request or rescoring.
+    """
+
+    def __init__(self, scanner, risk_calculator: Optional[RiskCalculator] = None,
+                 max_depth: Optional[int] = None, max_nodes: Optional[int] = None,
+                 max_workers: Optional[int] = None):
+        self.scanner = scanner
+        self.cache = scanner.cache
+        self.risk_calculator = risk_calculator or RiskCalculator()
+        self.fetcher = PackageFetcher(scanner, max_workers=max_workers)
+        self.max_depth = max_depth if max_depth is not None else getattr(settings, 'SCAN_TRANSITIVE_MAX_DEPTH', 10)
+        self.max_nodes = max_nodes if max_nodes is not None else getattr(settings, 'SCAN_TRANSITIVE_MAX_NODES', 5000)
+        self.index_version = get_vulnerability_index().version
+        self.stats = {'fetched': 0, 'memo_hits': 0, 'seeded': 0, 'failed': 0}
+        # Records of packages already fetched and scored by the caller, and
+        # the versions their (name, spec) resolved to; see seed()
+        self._seeded = {}
+        self._seeded_versions = {}
+
+    def seed(self, dependencies: List[Dict], package_infos: List[Dict], risk_scores: List[float]):
+        """Take direct dependencies the pipeline already fetched and scored, so resolve() reuses them"""
+        for dep, package_info, risk_score in zip(dependencies, package_infos, risk_scores):
+            if 'error' in package_info or not package_info.get('version'):
+                continue
+            key = (dep['name'], package_info['version'])
+            self._seeded_versions[(dep['name'], dep.get('version'))] = package_info['version']
+            if key not in self._seeded:
+                self._seeded[key] = self._record(package_info, risk_score)
+                self.cache.set(self._memo_key(*key), self._seeded[key])
+
+    def resolve(self, dependencies: List[Dict]) -> Dict:
+        """Build the dependency graph for a list of direct dependencies"""
+        nodes = {}
+        records = {}
+        edges = set()
+        roots = []
+        truncated = False
+
+        # (parent id, name, spec, resolved version if already known)
+        level = [
+            (None, dep['name'], dep.get('version'), self._seeded_versions.get((dep['name'], dep.get('version'))))
+            for dep in dependencies
+        ]
+        depth = 0
+
+        while level:
+            resolved = self._resolve_level(level)
+
+            next_level = []
+            child_versions = {}
+            for (parent, name, spec, _), record in zip(level, resolved):
+                if record is None:
+                    continue
+                child_id = node_id(name, record['version'])
+
+                if child_id not in nodes:
+                    if len(nodes) >= self.max_nodes:
+                        truncated = True
+                        continue
+                    nodes[child_id] = {
+                        'id': child_id,
+                        'name': name,
+                        'version': record['version'],
+                        'depth': depth,
+                        'risk_score': record['risk_score'],
+                        'has_vulnerabilities': record['details'].get('has_vulnerabilities', False),
+                        'is_deprecated': record['details'].get('is_deprecated', False),
+                        'details': record['details'],
+                    }
+                    records[child_id] = record
+
+                    if depth >= self.max_depth:
+                        if record['dependencies']:
+                            truncated = True
+                    else:
+                        for dep_name, dep_spec in record['dependencies'].items():
+                            next_level.append(
+                                (child_id, dep_name, dep_spec, record['resolved'].get(dep_name))
+                            )
+
+                if parent is None:
+                    roots.append(child_id)
+                else:
+                    edges.add((parent, child_id))
+                    child_versions.setdefault(parent, {})[name] = record['version']
+
+            self._remember_children(records, child_versions)
+            level = next_level
+            depth += 1
+
+        graph = {
+            'roots': list(dict.fromkeys(roots)),
+            'nodes': list(nodes.values()),
+            'edges': sorted(edges),
+            'truncated': truncated,
+        }
+        graph['subtree_risk'] = self._subtree_risk(graph)
+        graph['aggregate'] = self._aggregate(graph)
+        graph['stats'] = dict(self.stats, nodes=len(nodes), edges=len(edges), depth=depth)
+        return graph
+
+    def _resolve_level(self, level) -> List[Optional[Dict]]:
+        """Scored node records for one BFS level, in level order"""
+        records = {}
+
+        # Children whose versions a memoized parent already knows
+        for _, name, spec, version in level:
+            if version and (name, version) not in records:
+                if (name, version) in self._seeded:
+                    records[(name, version)] = self._seeded[(name, version)]
+                    self.stats['seeded'] += 1
+                    continue
+                memo = self.cache.get(self._memo_key(name, version))
+                if memo is not None:
+                    records[(name, version)] = memo
+                    self.stats['memo_hits'] += 1
+
+        to_fetch = [
+            {'name': name, 'version': spec}
+            for _, name, spec, version in level
+            if not (version and (name, version) in records)
+        ]
+        to_fetch = list({(d['name'], d['version']): d for d in to_fetch}.values())
+        fetched = dict(zip(
+            ((d['name'], d['version']) for d in to_fetch),
+            self.fetcher.fetch(to_fetch) if to_fetch else [],
+        ))
+        self.stats['fetched'] += len(fetched)
+        # Packages the registry failed for are left out of the graph
+        self.stats['failed'] += sum(1 for info in fetched.values() if 'error' in info)
+
+        # Nodes not memoized yet are scored together
+        to_score = {}
+        for _, name, spec, version in level:
+            if version and (name, version) in records:
+                continue
+            package_info = fetched.get((name, spec))
+            if package_info is None or 'error' in package_info or not package_info.get('version'):
+                continue
+            key = (name, package_info['version'])
+            if key not in records and key not in to_score:
+                memo = self.cache.get(self._memo_key(*key))
+                if memo is not None:
+                    self.stats['memo_hits'] += 1
+                    records[key] = memo
+                else:
+                    to_score[key] = package_info
+        records.update(self._score(to_score))
+
+        results = []
+        for _, name, spec, version in level:
+            if version and (name, version) in records:
+                results.append(records[(name, version)])
+                continue
+            package_info = fetched.get((name, spec))
+            if package_info is None or 'error' in package_info or not package_info.get('version'):
+                results.append(None)
+                continue
+            results.append(records[(name, package_info['version'])])
+
+        return results
+
+    def _score(self, package_infos: Dict) -> Dict:
+        """Score new nodes, keyed by (name, version), and memoize them"""
+        risk_scores = self.risk_calculator.score_batch(list(package_infos.values()))
+
+        records = {}
+        for (name, version), package_info, risk_score in zip(
+            package_infos, package_infos.values(), risk_scores
+        ):
+            records[(name, version)] = self._record(package_info, risk_score)
+            self.cache.set(self._memo_key(name, version), records[(name, version)])
+        return records
+
+    def _record(self, package_info: Dict, risk_score: float) -> Dict:
+        return {
+            'version': package_info['version'],
+            'risk_score': float(risk_score),
+            'details': package_details(package_info),
+            'dependencies': package_info.get('dependencies') or {},
+            # Filled in once the children have been resolved
+            'resolved': {},
+        }
+
+    def _remember_children(self, records: Dict, child_versions: Dict):
+        """Store the versions a node's children resolved to with its memo"""
+        for parent_id, versions in child_versions.items():
+            record = records[parent_id]
+            if all(record['resolved'].get(name) == version for name, version in versions.items()):
+                continue
+            record['resolved'].update(versions)
+            name = parent_id.rsplit('@', 1)[0]
+            self.cache.set(self._memo_key(name, record['version']), record)
+
+    def _memo_key(self, name: str, version: str):
+        # Scores depend on the scoring code and on the advisories known at the time
+        return (
+            f'{self.scanner.ecosystem}/scored', name, version,
+            self.risk_calculator.version, self.index_version,
+        )
+
+    def _subtree_risk(self, graph: Dict) -> Dict[str, Dict]:
+        """Highest risk and size of the subtree reachable from each direct dependency"""
+        children = {}
+        for parent, child in graph['edges']:
+            children.setdefault(parent, []).append(child)
+        risk = {node['id']: node['risk_score'] for node in graph['nodes']}
+
+        subtree = {}
+        for root in graph['roots']:
+            seen = {root}
+            queue = deque([root])
+            while queue:
+                current = queue.popleft()
+                for child in children.get(current, ()):
+                    if child not in seen:
+                        seen.add(child)
+                        queue.append(child)
+            subtree[root] = {
+                'max_risk': max(risk.get(n, 0.0) for n in seen),
+                'packages': len(seen),
+            }
+        return subtree
+
+    def _aggregate(self, graph: Dict) -> Dict:
+        """Risk summary over every node in the graph"""
+        nodes = graph['nodes']
+        scores = [node['risk_score'] for node in nodes]
+        return {
+            'total_packages': len(nodes),
+            'transitive_packages': sum(1 for node in nodes if node['depth'] > 0),
+            'max_risk_score': max(scores) if scores else 0.0,
+            'mean_risk_score': sum(scores) / len(scores) if scores else 0.0,
+            'risky_packages': sum(1 for score in scores if score > 70),
+            'packages_with_vulnerabilities': sum(1 for node in nodes if node['has_vulnerabilities']),
+            'deprecated_packages': sum(1 for node in nodes if node['is_deprecated']),
+        }
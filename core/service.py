@@ -1,8 +1,39 @@
-from typing import Dict
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:  # score_batch falls back to scoring one package at a time
+    np = None
+
+from .policy import ScoringPolicy, get_scoring_policy
+
+
+# (lowest score, level); the first match wins
+RISK_LEVELS = ((80, 'CRITICAL'), (60, 'HIGH'), (40, 'MEDIUM'), (0, 'LOW'))
+
+
+def risk_level(risk_score: float) -> str:
+    """CRITICAL, HIGH, MEDIUM or LOW for a 0-100 risk score"""
+    for threshold, level in RISK_LEVELS:
+        if risk_score >= threshold:
+            return level
+    return 'LOW'
 
 
 class RiskCalculator:
-    """Enhanced risk calculation service"""
+    """Enhanced risk calculation service
+
+    Weights, keywords, license classes and thresholds come from a compiled
+    ScoringPolicy (see core.policy); by default the current one from settings.
+    """
+
+    # Bump whenever the scoring code changes so memoized scores are recomputed;
+    # policy changes are covered by the policy's own version
+    ENGINE_VERSION = '3'
+
+    def __init__(self, policy: Optional[ScoringPolicy] = None):
+        self.policy = policy or get_scoring_policy()
+        self.version = f'{self.ENGINE_VERSION}/{self.policy.version}'
 
     def calculate_package_risk(self, package_data: Dict) -> float:
         """Calculate comprehensive risk score (0-100)"""
@@ -14,59 +45,114 @@ class RiskCalculator:
             'license': self._calculate_license_score(package_data),
         }
 
-        weights = {
-            'security': 0.4,
-            'maintenance': 0.3,
-            'popularity': 0.2,
-            'license': 0.1,
-        }
-
         # Weighted average
+        weights = self.policy.weights
         total_score = sum(factors[key] * weights[key] for key in factors)
         return min(total_score, 100.0)
 
+    def score_batch(self, packages: List[Dict]) -> List[float]:
+        """Score many packages at once; identical to calling calculate_package_risk on each
+
+        Features are pulled into columns and every factor and the weighted sum
+        are computed with vectorized NumPy operations.
+        """
+        if np is None or not packages:
+            return [float(self.calculate_package_risk(package)) for package in packages]
+
+        policy = self.policy
+        (vulnerable, suspicious, typosquat, unknown_author, deprecated, unmaintained,
+         update_age, downloads, license_class) = self._feature_columns(packages)
+
+        security = np.minimum(
+            np.where(vulnerable, policy.vulnerable_score, 0) + np.where(suspicious, policy.suspicious_score, 0)
+            + np.where(typosquat, policy.typosquat_score, 0)
+            + np.where(unknown_author, policy.unknown_author_score, 0),
+            100,
+        )
+        maintenance = np.minimum(
+            np.where(deprecated, policy.deprecated_score, 0) + np.where(unmaintained, policy.unmaintained_score, 0)
+            + update_age,
+            100,
+        )
+        popularity = np.array(policy.popularity_scores)[
+            np.searchsorted(np.array(policy.popularity_thresholds), downloads, side='right')
+        ]
+        license_scores = np.array([policy.license_scores[c] for c in range(len(policy.license_scores))])
+        license_ = license_scores[license_class]
+
+        # Same order of operations as the per-item weighted sum
+        weights = policy.weights
+        total = (
+            security * weights['security']
+            + maintenance * weights['maintenance']
+            + popularity * weights['popularity']
+            + license_ * weights['license']
+        )
+        return np.minimum(total, 100.0).tolist()
+
+    def _feature_columns(self, packages: List[Dict]) -> tuple:
+        """Columnar features for score_batch, from the same policy lookups as the per-item checks"""
+        policy = self.policy
+
+        def flags(field):
+            return np.array([bool(p.get(field, False)) for p in packages])
+
+        def column(check, field, dtype=bool):
+            return np.array([check(str(p.get(field, ''))) for p in packages], dtype=dtype)
+
+        downloads = np.array([
+            d if type(d) is int else self._extract_download_count(p)
+            for p, d in ((p, p.get('downloads', 0)) for p in packages)
+        ], dtype=np.int64)
+
+        return (
+            flags('has_vulnerabilities'),
+            column(policy.has_suspicious_name, 'name'),
+            flags('typosquat_of'),
+            column(policy.has_unknown_author, 'author'),
+            flags('is_deprecated'),
+            flags('is_unmaintained'),
+            column(policy.update_age_score, 'last_updated', dtype=np.int64),
+            downloads,
+            column(policy.license_class, 'license', dtype=np.intp),
+        )
+
     def _calculate_security_score(self, package_data: Dict) -> float:
         """Calculate security risk (0-100) - higher = more risky"""
+        policy = self.policy
         score = 0
 
         if package_data.get('has_vulnerabilities', False):
-            score += 40
+            score += policy.vulnerable_score
 
         # Check for suspicious patterns in package name
-        name = str(package_data.get('name', '')).lower()
-        suspicious_keywords = ['test', 'example', 'demo', 'fake', 'malicious']
-        if any(keyword in name for keyword in suspicious_keywords):
-            score += 20
+        if policy.has_suspicious_name(str(package_data.get('name', ''))):
+            score += policy.suspicious_score
+
+        # A typo away from a popular package (typosquat_of, set by scanners
+        # from scanners.typosquat_index)
+        if package_data.get('typosquat_of'):
+            score += policy.typosquat_score
 
         # Check author reputation
-        author = str(package_data.get('author', '')).lower()
-        if not author or author in ['unknown', 'anonymous', '']:
-            score += 10
+        if policy.has_unknown_author(str(package_data.get('author', ''))):
+            score += policy.unknown_author_score
 
         return min(score, 100)
 
     def _calculate_maintenance_score(self, package_data: Dict) -> float:
         """Calculate maintenance risk (0-100) - higher = more risky"""
+        policy = self.policy
         score = 0
 
         if package_data.get('is_deprecated', False):
-            score += 50
+            score += policy.deprecated_score
 
         if package_data.get('is_unmaintained', False):
-            score += 30
+            score += policy.unmaintained_score
 
-        # Check last update (simplified logic)
-        last_updated = str(package_data.get('last_updated', ''))
-
-        # Very basic date checking - enhance this later
-        if '2020' in last_updated or '2019' in last_updated:
-            score += 20
-        elif '2021' in last_updated:
-            score += 15
-        elif '2022' in last_updated:
-            score += 10
-        elif '2023' in last_updated:
-            score += 5
+        # Risk for a last update before the policy's cutoffs
+        score += policy.update_age_score(str(package_data.get('last_updated', '')))
 
         return min(score, 100)
 
@@ -75,24 +161,10 @@ class RiskCalculator:
         Calculate popularity-based risk score.
 
         Lower adoption implies higher risk.
-        Score range: 10 (very low risk) → 80 (high risk)
+        Score range (default policy): 10 (very low risk) → 80 (high risk)
         """
 
-        downloads = self._extract_download_count(package_data)
-
-        # Thresholds ordered by ascending popularity
-        risk_bands = (
-            (100, 80.0),
-            (1_000, 60.0),
-            (10_000, 40.0),
-            (100_000, 20.0),
-        )
-
-        for threshold, score in risk_bands:
-            if downloads < threshold:
-                return score
-
-        return 10.0  # Very low risk for widely adopted packages
+        return self.policy.popularity_score(self._extract_download_count(package_data))
 
     def _extract_download_count(self, package_data: Dict) -> int:
         """
@@ -110,21 +182,5 @@ class RiskCalculator:
 
     def _calculate_license_score(self, package_data: Dict) -> float:
         """Calculate license risk (higher = more risky)"""
-        license_text = str(package_data.get('license', '')).lower()
-
-        # Safe licenses (low risk)
-        safe_licenses = ['mit', 'apache', 'bsd', 'isc', 'unlicense']
-        # Risky licenses (medium-high risk)
-        risky_licenses = ['gpl', 'agpl', 'lgpl']
-        # Very risky (proprietary or unknown)
-
-        if any(license in license_text for license in safe_licenses):
-            return 10  # Low risk
-
-        if any(license in license_text for license in risky_licenses):
-            return 50  # Medium risk
-
-        if not license_text or 'unknown' in license_text or 'proprietary' in license_text:
-            return 70  # High risk (unknown/proprietary license)
-
-        return 30  # Medium-low risk for other licenses
\ No newline at end of file
+        policy = self.policy
+        return policy.license_scores[policy.license_class(str(package_data.get('license', '')))]
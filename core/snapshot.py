@@ -0,0 +1,177 @@
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from scanners import ScannerFactory
+from scanners.fetcher import PackageFetcher
+from scanners.metrics import span
+
+from .models import PackageRiskSnapshot
+from .persistence import package_details, save_snapshot, snapshot_entry
+from .service import RiskCalculator, risk_level
+
+
+# (ecosystem, name, version); version is '' for the latest release
+CheckKey = Tuple[str, str, str]
+SNAPSHOT_FIELDS = (
+    'name', 'version', 'resolved_version', 'risk_score', 'vulnerabilities_found', 'is_deprecated',
+    'is_unmaintained', 'details', 'scorer_version', 'updated_at',
+)
+
+
+def get_snapshot_ttl() -> int:
+    """Seconds a snapshot entry is answered from before it is checked again"""
+    return getattr(settings, 'SCAN_SNAPSHOT_TTL', 24 * 3600)
+
+
+def parse_check_items(items, default_ecosystem: str = 'npm') -> List[CheckKey]:
+    """Keys of a batch check request: package names, or objects with name, ecosystem and version"""
+    maximum = getattr(settings, 'SCAN_CHECK_MAX_PACKAGES', 1000)
+    if not isinstance(items, list) or not items:
+        raise ValueError('packages must be a non-empty list')
+    if len(items) > maximum:
+        raise ValueError(f'At most {maximum} packages can be checked at once')
+
+    keys = []
+    for item in items:
+        if isinstance(item, str):
+            name, ecosystem, version = item, default_ecosystem, ''
+        elif isinstance(item, dict):
+            name = item.get('name') or item.get('package')
+            ecosystem = item.get('ecosystem') or default_ecosystem
+            version = item.get('version') or ''
+        else:
+            raise ValueError('Each package must be a name or an object')
+        if not isinstance(name, str) or not name:
+            raise ValueError('Every package needs a name')
+        keys.append((str(ecosystem).lower(), name, str(version)))
+    return keys
+
+
+def check_packages(keys: List[CheckKey], concurrency: Optional[int] = None) -> List[Dict]:
+    """Risk of every key, in order: from the snapshot when fresh, otherwise fetched and scored
+
+    Entries the registries fail for fall back to a stale snapshot entry,
+    when there is one.
+    """
+    unique_keys = list(dict.fromkeys(keys))
+    with span('snapshot'):
+        fresh, stale = load_snapshot(unique_keys)
+    missing = [key for key in unique_keys if key not in fresh]
+
+    found = dict(fresh)
+    if missing:
+        for key, result in fetch_and_score(missing, concurrency).items():
+            if result['incomplete'] and key in stale:
+                result = dict(stale[key], stale=True, error=result['error'])
+            found[key] = result
+    return [found[key] for key in keys]
+
+
+def load_snapshot(keys: List[CheckKey]) -> Tuple[Dict[CheckKey, Dict], Dict[CheckKey, Dict]]:
+    """Snapshot results for keys, split into (fresh, stale), one query per ecosystem"""
+    cutoff = timezone.now() - timedelta(seconds=get_snapshot_ttl())
+    scorer_version = RiskCalculator().version
+    wanted = set(keys)
+    names_by_ecosystem = {}
+    for ecosystem, name, _ in keys:
+        names_by_ecosystem.setdefault(ecosystem, set()).add(name)
+
+    fresh, stale = {}, {}
+    for ecosystem, names in names_by_ecosystem.items():
+        rows = PackageRiskSnapshot.objects.filter(
+            ecosystem=ecosystem, name__in=list(names)
+        ).values(*SNAPSHOT_FIELDS)
+        for row in rows:
+            key = (ecosystem, row['name'], row['version'])
+            if key not in wanted:
+                continue
+            # Scores from other scoring rules or policies are stale however recent
+            is_fresh = row['updated_at'] >= cutoff and row['scorer_version'] == scorer_version
+            (fresh if is_fresh else stale)[key] = snapshot_result(ecosystem, row, 'snapshot')
+    return fresh, stale
+
+
+def fetch_and_score(keys: List[CheckKey], concurrency: Optional[int] = None) -> Dict[CheckKey, Dict]:
+    """Fetch keys from their registries concurrently, score them and record them in the snapshot"""
+    keys_by_ecosystem = {}
+    for key in keys:
+        keys_by_ecosystem.setdefault(key[0], []).append(key)
+
+    risk_calculator = RiskCalculator()
+    now = timezone.now()
+    results = {}
+    entries = []
+    for ecosystem, ecosystem_keys in keys_by_ecosystem.items():
+        try:
+            scanner = ScannerFactory.get_scanner(ecosystem)
+        except ValueError as e:
+            results.update({key: failed_result(key, str(e)) for key in ecosystem_keys})
+            continue
+
+        package_infos = PackageFetcher(scanner, max_workers=concurrency).fetch([
+            {'name': name, 'version': version or None} for _, name, version in ecosystem_keys
+        ])
+        with span('score'):
+            risk_scores = risk_calculator.score_batch(package_infos)
+
+        for key, package_info, risk_score in zip(ecosystem_keys, package_infos, risk_scores):
+            if 'error' in package_info:
+                results[key] = failed_result(key, package_info['error'])
+                continue
+            entry = snapshot_entry(ecosystem, key[2], {
+                'package': key[1],
+                'version': package_info.get('version', ''),
+                'risk_score': float(risk_score),
+                'has_vulnerabilities': package_info.get('has_vulnerabilities', False),
+                'is_deprecated': package_info.get('is_deprecated', False),
+                'details': package_details(package_info),
+            }, now=now, scorer_version=risk_calculator.version)
+            entries.append(entry)
+            results[key] = snapshot_result(
+                ecosystem, {field: getattr(entry, field) for field in SNAPSHOT_FIELDS}, 'registry'
+            )
+
+    with span('persist'):
+        save_snapshot(entries)
+    return results
+
+
+def snapshot_result(ecosystem: str, row: Dict, source: str) -> Dict:
+    """A check result from a snapshot row; source is 'snapshot' or 'registry'"""
+    risk_score = float(row['risk_score'])
+    return {
+        'package': row['name'],
+        'ecosystem': ecosystem,
+        'version': row['version'] or None,
+        'resolved_version': row['resolved_version'] or None,
+        'risk_score': risk_score,
+        'risk_level': risk_level(risk_score),
+        'vulnerabilities_found': row['vulnerabilities_found'],
+        'is_deprecated': row['is_deprecated'],
+        'is_unmaintained': row['is_unmaintained'],
+        'checked_at': row['updated_at'].isoformat(),
+        'source': source,
+        'stale': False,
+        'incomplete': False,
+        'error': None,
+        'details': row['details'],
+    }
+
+
+def failed_result(key: CheckKey, error: str) -> Dict:
+    ecosystem, name, version = key
+    return {
+        'package': name,
+        'ecosystem': ecosystem,
+        'version': version or None,
+        'resolved_version': None,
+        'risk_score': None,
+        'risk_level': None,
+        'source': 'registry',
+        'stale': False,
+        'incomplete': True,
+        'error': error,
+    }
@@ -1,3 +1,354 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from scanners.metrics import ScanMetrics
+
+from . import policy as policy_module
+from . import service
+from .blobs import load_blobs, prune_blobs, store_blobs
+from .dedup import manifest_hash
+from .jobs import claim_next_scan
+from .models import PackageRiskSnapshot, PackageScanResult, RawDataBlob, ScanRequest, ScanResult
+from .persistence import (complete_scan, persist_partial_results, persist_scan, start_scan, stored_result,
+                          stored_results)
+from .policy import DEFAULT_POLICY, ScoringPolicy, get_scoring_policy, merge_policy
+from .service import RiskCalculator, risk_level
+from .snapshot import load_snapshot, parse_check_items
+from .writer import WriterStopped, get_writer, single_writer, stop_writer
+
+
+PACKAGES = [
+    {'name': 'lodash', 'downloads': {'downloads': 50000000}, 'license': 'MIT', 'author': 'jdalton',
+     'last_updated': '2024-02-20T10:00:00.000Z'},
+    {'name': 'test-helper', 'downloads': 50, 'license': 'GPL-3.0', 'author': '',
+     'last_updated': '2019-06-01', 'has_vulnerabilities': True, 'is_deprecated': True},
+    {'name': 'lodahs', 'downloads': 999.7, 'license': 'Proprietary', 'author': 'Anonymous',
+     'typosquat_of': 'lodash', 'is_unmaintained': True, 'last_updated': 'Released in 2022'},
+    {'name': 'left-pad', 'downloads': 'n/a', 'license': 'WTFPL', 'last_updated': 'never'},
+    {'name': 'empty'},
+]
+
+
+class ScoringPolicyTests(SimpleTestCase):
+    def setUp(self):
+        self.policy = ScoringPolicy(merge_policy(None))
+
+    def test_merge_policy_overrides_keys_within_sections(self):
+        merged = merge_policy({'name': 'strict', 'security': {'typosquat': 60}})
+        self.assertEqual(merged['name'], 'strict')
+        self.assertEqual(merged['security']['typosquat'], 60)
+        self.assertEqual(merged['security']['vulnerable'], DEFAULT_POLICY['security']['vulnerable'])
+        self.assertEqual(DEFAULT_POLICY['security']['typosquat'], 30)
+
+    def test_version_follows_content(self):
+        self.assertEqual(ScoringPolicy(merge_policy({})).version, self.policy.version)
+        strict = ScoringPolicy(merge_policy({'name': 'strict', 'security': {'typosquat': 60}}))
+        self.assertTrue(strict.version.startswith('strict-'))
+        self.assertNotEqual(strict.version, self.policy.version)
+
+    def test_invalid_policies(self):
+        cases = [
+            {'weights': {'security': 'heavy'}},
+            {'popularity': {'thresholds': [1000, 100], 'scores': [1, 2, 3]}},
+            {'popularity': {'thresholds': [100], 'scores': [1]}},
+            {'maintenance': {'last_updated_before': [['yesterday', 5]]}},
+            {'license': {'scores': {'safe': 10}}},
+        ]
+        for overrides in cases:
+            with self.subTest(overrides=overrides):
+                with self.assertRaises(ImproperlyConfigured):
+                    ScoringPolicy(merge_policy(overrides))
+
+    def test_update_age_score(self):
+        cases = [
+            ('2020-12-31T23:59:59Z', 20),
+            ('2021-01-01', 15),
+            ('2022-06-30', 10),
+            ('2023-12-31', 5),
+            ('2024-01-01', 0),
+            ('Released in 2019', 20),
+            # Older than every cutoff is the stalest of all, not fresh
+            ('2018-12-31', 20),
+            ('2012-05-01T00:00:00Z', 20),
+            ('published 1999', 20),
+            ('sometime in 2023', 5),
+            ('', 0),
+            ('unknown', 0),
+        ]
+        for last_updated, expected in cases:
+            with self.subTest(last_updated=last_updated):
+                self.assertEqual(self.policy.update_age_score(last_updated), expected)
+
+    def test_license_class(self):
+        cases = [
+            ('MIT', policy_module.LICENSE_SAFE),
+            ('Apache-2.0', policy_module.LICENSE_SAFE),
+            ('GPL-3.0-only', policy_module.LICENSE_RISKY),
+            ('(MIT OR GPL-3.0)', policy_module.LICENSE_SAFE),
+            ('', policy_module.LICENSE_UNKNOWN),
+            ('UNKNOWN', policy_module.LICENSE_UNKNOWN),
+            ('WTFPL', policy_module.LICENSE_OTHER),
+        ]
+        for license_text, expected in cases:
+            with self.subTest(license_text=license_text):
+                self.assertEqual(self.policy.license_class(license_text), expected)
+
+    def test_invalid_policy_file_keeps_the_previous_policy(self):
+        self.addCleanup(policy_module._policy_state.update, dict(policy_module._policy_state))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'policy.json')
+            with open(path, 'w') as f:
+                json.dump({'name': 'strict', 'security': {'typosquat': 60}}, f)
+            with override_settings(RISK_POLICY_PATH=path):
+                strict = get_scoring_policy()
+                self.assertEqual(strict.typosquat_score, 60)
+
+                with open(path, 'w') as f:
+                    f.write('{"name": ')
+                os.utime(path, ns=(1, 1))
+                with self.assertLogs(policy_module.logger, 'ERROR'):
+                    self.assertIs(get_scoring_policy(), strict)
+
+
+class RiskCalculatorTests(SimpleTestCase):
+    def test_risk_level(self):
+        cases = [(100, 'CRITICAL'), (80, 'CRITICAL'), (79.99, 'HIGH'), (60, 'HIGH'), (40, 'MEDIUM'),
+                 (39.9, 'LOW'), (0, 'LOW'), (-1, 'LOW')]
+        for score, expected in cases:
+            with self.subTest(score=score):
+                self.assertEqual(risk_level(score), expected)
+
+    def test_score(self):
+        calculator = RiskCalculator(ScoringPolicy(merge_policy(None)))
+        # security 0, maintenance 0, popularity 10, license 10
+        self.assertAlmostEqual(calculator.calculate_package_risk(PACKAGES[0]), 3.0)
+        # security 40 + 20 + 10, maintenance 50 + 20, popularity 80, license 50
+        self.assertAlmostEqual(calculator.calculate_package_risk(PACKAGES[1]), 28 + 21 + 16 + 5)
+
+    def test_score_batch_matches_scoring_one_at_a_time(self):
+        policies = [merge_policy(None), merge_policy({'weights': {'security': 0.7, 'popularity': 0.05},
+                                                      'security': {'typosquat': 90}})]
+        for config in policies:
+            calculator = RiskCalculator(ScoringPolicy(config))
+            expected = [calculator.calculate_package_risk(package) for package in PACKAGES]
+            with self.subTest(policy=config['weights']):
+                self.assertEqual(calculator.score_batch(PACKAGES), expected)
+            with self.subTest(policy=config['weights'], numpy=False), mock.patch.object(service, 'np', None):
+                self.assertEqual(calculator.score_batch(PACKAGES), expected)
+        self.assertEqual(RiskCalculator().score_batch([]), [])
+
+
+def result(package, version, risk_score=10.0, depth=0, **details):
+    """A scored pipeline result"""
+    return {
+        'package': package,
+        'version': version,
+        'version_constraint': version,
+        'risk_score': risk_score,
+        'has_vulnerabilities': False,
+        'is_deprecated': False,
+        'depth': depth,
+        'details': dict({'name': package, 'version': version}, **details),
+    }
+
+
+class PersistenceTests(TestCase):
+    def setUp(self):
+        self.scan_request = ScanRequest.objects.create(source='cli', target='package-lock.json',
+                                                       status='processing')
+
+    def test_every_locked_version_is_stored(self):
+        results = [
+            result('a', '1.0.0', 20.0),
+            result('a', '2.0.0', 30.0),
+            result('b', '1.0.0', 10.0),
+            # The same version again keeps the shallowest, then riskiest entry
+            result('a', '2.0.0', 90.0, depth=1),
+            result('b', '1.0.0', 15.0),
+        ]
+        scan_result = persist_scan(self.scan_request, 'npm', results, 20.0)
+
+        rows = sorted((row['package__name'], row['version'], float(row['risk_score']))
+                      for row in stored_results(scan_result))
+        self.assertEqual(rows, [('a', '1.0.0', 20.0), ('a', '2.0.0', 30.0), ('b', '1.0.0', 15.0)])
+        self.scan_request.refresh_from_db()
+        self.assertEqual(self.scan_request.status, 'completed')
+
+    def test_details_round_trip_through_shared_blobs(self):
+        results = [result('a', '1.0.0', description='same'), result('c', '1.0.0', description='other')]
+        scan_result = persist_scan(self.scan_request, 'npm', results, 10.0)
+        rows = {row['package__name']: stored_result(row) for row in stored_results(scan_result)}
+        self.assertEqual(rows['a']['details'], results[0]['details'])
+        self.assertEqual(rows['c']['details']['description'], 'other')
+        self.assertEqual(RawDataBlob.objects.count(), 2)
+
+    def test_snapshot_answers_name_only_checks_for_the_latest_version(self):
+        results = [result('a', '2.0.0', latest_version='2.0.0'), result('b', '1.0.0', latest_version='3.0.0')]
+        persist_scan(self.scan_request, 'npm', results, 10.0, scoring_policy=RiskCalculator().version)
+
+        self.assertEqual(
+            sorted(PackageRiskSnapshot.objects.values_list('name', 'version', 'resolved_version')),
+            [('a', '', '2.0.0'), ('a', '2.0.0', '2.0.0'), ('b', '1.0.0', '1.0.0')],
+        )
+        fresh, stale = load_snapshot([('npm', 'a', ''), ('npm', 'b', ''), ('npm', 'b', '1.0.0')])
+        self.assertEqual(sorted(fresh), [('npm', 'a', ''), ('npm', 'b', '1.0.0')])
+        self.assertEqual(stale, {})
+
+
+class BlobTests(TestCase):
+    def test_store_blobs_stores_each_content_once(self):
+        digests = store_blobs([{'b': 1, 'a': 2}, {'a': 2, 'b': 1}, {'c': 'é'}])
+        self.assertEqual(digests[0], digests[1])
+        self.assertEqual(RawDataBlob.objects.count(), 2)
+        self.assertEqual(store_blobs([{'a': 2, 'b': 1}]), digests[:1])
+        self.assertEqual(load_blobs(digests + ['']), {digests[0]: {'a': 2, 'b': 1}, digests[2]: {'c': 'é'}})
+
+    def test_prune_keeps_referenced_and_recent_blobs(self):
+        scan_request = ScanRequest.objects.create(source='cli', target='package.json', status='processing')
+        persist_scan(scan_request, 'npm', [result('a', '1.0.0')], 10.0)
+        referenced = PackageScanResult.objects.get().raw_blob_id
+        orphan, recent = store_blobs([{'orphan': True}, {'recent': True}])
+        long_ago = timezone.now() - timedelta(hours=2)
+        RawDataBlob.objects.exclude(digest=recent).update(created_at=long_ago)
+
+        self.assertEqual(prune_blobs(min_age=3600), 1)
+        self.assertEqual(set(RawDataBlob.objects.values_list('digest', flat=True)), {referenced, recent})
+
+        # A blob a scan is about to reuse counts as just stored
+        RawDataBlob.objects.update(created_at=long_ago)
+        store_blobs([{'recent': True}])
+        self.assertEqual(prune_blobs(min_age=3600), 0)
+        self.assertIn(recent, set(RawDataBlob.objects.values_list('digest', flat=True)))
+
+
+@override_settings(SCAN_DB_WRITER={'ENABLED': True})
+class PersistenceWriterTests(TransactionTestCase):
+    """Writes from outside a transaction, so they really go through the writer thread"""
+
+    def setUp(self):
+        stop_writer()
+        self.addCleanup(stop_writer)
+        self.writer = get_writer()
+
+    def test_scans_are_written_by_the_writer(self):
+        whole = ScanRequest.objects.create(source='cli', target='package.json', status='processing')
+        persist_scan(whole, 'npm', [result('a', '1.0.0', 20.0), result('b', '1.0.0', 40.0)], 40.0)
+
+        partial = ScanRequest.objects.create(source='cli', target='package-lock.json', status='processing')
+        scan_result = start_scan(partial, 1)
+        persist_partial_results(scan_result, 'npm', [result('a', '2.0.0', 30.0)])
+        complete_scan(partial, scan_result, 30.0)
+
+        self.assertEqual(self.writer.stats()['writes'], 4)
+        for scan_request, expected in ((whole, ['1.0.0', '1.0.0']), (partial, ['2.0.0'])):
+            scan_request.refresh_from_db()
+            self.assertEqual(scan_request.status, 'completed')
+            self.assertEqual(sorted(row['version'] for row in stored_results(scan_request.scanresult)), expected)
+
+    def test_queries_count_toward_the_submitting_scan(self):
+        counts = {}
+        for enabled in (True, False):
+            with override_settings(SCAN_DB_WRITER={'ENABLED': enabled}):
+                scan_request = ScanRequest.objects.create(source='cli', target='package.json', status='processing')
+                scan = ScanMetrics()
+                with scan.activate(), scan.count_queries():
+                    persist_scan(scan_request, 'npm', [result('a', '1.0.0'), result(f'b{enabled}', '1.0.0')], 10.0)
+                counts[enabled] = scan.db_queries
+        self.assertEqual(self.writer.stats()['writes'], 1)
+        self.assertEqual(counts[True], counts[False])
+
+        # Writes submitted outside the scan are not counted toward it
+        persist_scan(ScanRequest.objects.create(source='cli', target='package.json', status='processing'),
+                     'npm', [result('c', '1.0.0')], 10.0)
+        self.assertEqual(scan.db_queries, counts[False])
+
+    def test_errors_reach_the_caller(self):
+        ran_on_writer = []
+
+        @single_writer
+        def fail():
+            ran_on_writer.append(self.writer.is_writer_thread())
+            ScanRequest.objects.create(source='cli', target='rolled back')
+            raise ValueError('boom')
+
+        with self.assertRaisesMessage(ValueError, 'boom'):
+            fail()
+        self.assertEqual(ran_on_writer, [True])
+        self.assertFalse(ScanRequest.objects.filter(target='rolled back').exists())
+        self.assertEqual(self.writer.stats()['failed_writes'], 1)
+
+        # The writer carries on after a failed write
+        scan_request = ScanRequest.objects.create(source='cli', target='package.json', status='processing')
+        persist_scan(scan_request, 'npm', [result('a', '1.0.0')], 10.0)
+        self.assertEqual(self.writer.stats()['writes'], 1)
+
+    def test_stop_applies_queued_writes_first(self):
+        futures = [self.writer.submit(ScanRequest.objects.create, source='cli', target=str(i)) for i in range(5)]
+        self.assertTrue(stop_writer(timeout=10))
+        self.assertFalse(self.writer._thread.is_alive())
+        self.assertEqual(sorted(future.result(timeout=0).target for future in futures), ['0', '1', '2', '3', '4'])
+        self.assertEqual(ScanRequest.objects.count(), 5)
+
+        with self.assertRaises(WriterStopped):
+            self.writer.submit(ScanRequest.objects.count)
+        self.assertIsNot(get_writer(), self.writer)
+
+
+class ScanQueueTests(TestCase):
+    def test_scans_without_a_heartbeat_are_requeued(self):
+        long_ago = timezone.now() - timedelta(hours=1)
+        stale = ScanRequest.objects.create(source='cli', target='a', status='processing', started_at=long_ago,
+                                           heartbeat_at=long_ago, packages_scanned=5)
+        ScanResult.objects.create(scan_request=stale)
+        running = ScanRequest.objects.create(source='cli', target='b', status='processing',
+                                             started_at=long_ago, heartbeat_at=timezone.now())
+
+        with self.assertLogs('core.jobs', 'WARNING'):
+            claimed = claim_next_scan()
+        self.assertEqual(claimed.id, stale.id)
+        self.assertEqual(claimed.status, 'processing')
+        self.assertEqual(claimed.packages_scanned, 0)
+        self.assertFalse(ScanResult.objects.filter(scan_request=stale).exists())
+        running.refresh_from_db()
+        self.assertEqual(running.status, 'processing')
+        self.assertIsNone(claim_next_scan())
+
+
+class DedupTests(SimpleTestCase):
+    def test_manifest_hash_ignores_order_and_duplicates(self):
+        dependencies = [{'name': 'a', 'version': '^1.0.0'}, {'name': 'b', 'version': '2.0.0', 'type': 'devDependency'}]
+        same = [dependencies[1], dependencies[0], dict(dependencies[0])]
+        self.assertEqual(manifest_hash(dependencies, 'npm'), manifest_hash(same, 'NPM'))
+
+        different = [
+            manifest_hash(dependencies[:1], 'npm'),
+            manifest_hash([dict(dependencies[0], version='^1.0.1'), dependencies[1]], 'npm'),
+            manifest_hash(dependencies, 'pypi'),
+            manifest_hash(dependencies, 'npm', {'transitive': True}),
+        ]
+        self.assertNotIn(manifest_hash(dependencies, 'npm'), different)
+        # Options that do not change results do not change the hash
+        self.assertEqual(manifest_hash(dependencies, 'npm', {'concurrency': 4}), manifest_hash(dependencies, 'npm'))
+
+
+class CheckItemTests(SimpleTestCase):
+    def test_parse_check_items(self):
+        self.assertEqual(
+            parse_check_items(['lodash', {'name': 'Flask', 'ecosystem': 'PyPI', 'version': '2.0'},
+                               {'package': 'react', 'version': None}]),
+            [('npm', 'lodash', ''), ('pypi', 'Flask', '2.0'), ('npm', 'react', '')],
+        )
+
+    @override_settings(SCAN_CHECK_MAX_PACKAGES=2)
+    def test_invalid_check_items(self):
+        for items in ([], 'lodash', ['a', 'b', 'c'], [1], [{'version': '1.0.0'}], ['']):
+            with self.subTest(items=items):
+                with self.assertRaises(ValueError):
+                    parse_check_items(items)
@@ -0,0 +1,225 @@
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+from scanners.metrics import count_scan_query, registry as metrics
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WRITER = {
+    # None turns the writer on for SQLite only
+    'ENABLED': None,
+    'MAX_QUEUE': 256,
+    'MAX_BATCH': 64,
+    'MAX_DELAY': 0.005,
+    'QUEUE_TIMEOUT': 60.0,
+}
+
+
+class WriterOverloaded(RuntimeError):
+    """The writer's queue stayed full for longer than QUEUE_TIMEOUT"""
+
+
+class WriterStopped(RuntimeError):
+    """Writes were submitted after the writer was stopped"""
+
+
+class PersistenceWriter:
+    """A single thread applying the database writes of every scan, many per transaction
+
+    SQLite takes one writer at a time, so scan threads writing on their own
+    mostly wait for each other's locks, or fail with "database is locked".
+    They queue their writes here instead and wait for the outcome. The
+    writer takes up to max_batch queued writes, waiting at most max_delay
+    seconds for more to arrive, and commits them together, each in its own
+    savepoint so one failing write does not undo the others.
+
+    The queue is bounded: while it is full, submit blocks, so scans slow
+    down to the rate the database can take rather than piling up.
+
+    Each write runs in the context it was submitted from, so the queries it
+    makes count toward the submitting scan's metrics.
+    """
+
+    def __init__(self, max_queue: int = 256, max_batch: int = 64, max_delay: float = 0.005,
+                 queue_timeout: float = 60.0, using: str = DEFAULT_DB_ALIAS):
+        self.max_batch = max(1, max_batch)
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+        self.using = using
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._stats = {'writes': 0, 'failed_writes': 0, 'transactions': 0, 'largest_batch': 0}
+        self._lock = threading.Lock()
+        # Held while queueing, so nothing is queued behind the stop marker
+        self._submit_lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queue fn(*args, **kwargs) for the writer; blocks while the queue is full"""
+        future = Future()
+        with self._submit_lock:
+            if self._stopped:
+                raise WriterStopped('Database writer has been stopped')
+            try:
+                self._queue.put((future, contextvars.copy_context(), fn, args, kwargs),
+                                timeout=self.queue_timeout)
+            except queue.Full:
+                raise WriterOverloaded(
+                    f'Database writer queue has been full for {self.queue_timeout:g} seconds'
+                )
+        metrics.set('package_scanner_db_writer_queue', self._queue.qsize())
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """Apply fn on the writer and return its result once committed"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Apply the writes already queued, then end the writer thread
+
+        Returns whether the thread ended within timeout. Later submits raise
+        WriterStopped.
+        """
+        with self._submit_lock:
+            if not self._stopped:
+                self._stopped = True
+                self._queue.put(None)
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def is_writer_thread(self) -> bool:
+        return threading.current_thread() is self._thread
+
+    def stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _run(self):
+        connection = connections[self.using]
+        try:
+            with connection.execute_wrapper(count_scan_query):
+                self._loop()
+        finally:
+            connection.close()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while batch[-1] is not None and len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            # None marks a stop; everything queued before it is applied first
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            if batch:
+                self._apply(batch)
+            metrics.set('package_scanner_db_writer_queue', self._queue.qsize())
+            if stopping:
+                return
+
+    def _apply(self, batch):
+        outcomes = []
+        try:
+            with transaction.atomic(using=self.using):
+                for future, context, fn, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        outcomes.append((future, self._apply_one(context, fn, args, kwargs), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            # The commit itself failed, so nothing in the batch was stored
+            logger.exception('Database writer transaction failed')
+            close_old_connections()
+            outcomes = [(future, None, e) for future, *_ in batch if not future.cancelled()]
+
+        failed = sum(1 for _, _, error in outcomes if error is not None)
+        with self._lock:
+            self._stats['writes'] += len(outcomes) - failed
+            self._stats['failed_writes'] += failed
+            self._stats['transactions'] += 1
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+        metrics.observe('package_scanner_db_writer_batch_size', len(batch),
+                        buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+
+        # Results are handed back only once they are committed
+        for future, result, error in outcomes:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _apply_one(self, context, fn, args, kwargs):
+        # Savepoints are the writer's overhead; only fn's own queries count toward its scan
+        with transaction.atomic(using=self.using):
+            return context.run(fn, *args, **kwargs)
+
+
+def writer_enabled(config: Dict, using: str = DEFAULT_DB_ALIAS) -> bool:
+    enabled = config.get('ENABLED')
+    if enabled is None:
+        return connections[using].vendor == 'sqlite'
+    return bool(enabled)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> Optional[PersistenceWriter]:
+    """Process-wide writer from SCAN_DB_WRITER, or None when writes go straight to the database"""
+    global _writer
+    config = dict(DEFAULT_WRITER, **getattr(settings, 'SCAN_DB_WRITER', {}))
+    if not writer_enabled(config):
+        return None
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = PersistenceWriter(
+                    max_queue=config['MAX_QUEUE'],
+                    max_batch=config['MAX_BATCH'],
+                    max_delay=config['MAX_DELAY'],
+                    queue_timeout=config['QUEUE_TIMEOUT'],
+                )
+    return _writer
+
+
+def stop_writer(timeout: Optional[float] = None) -> bool:
+    """Stop the process-wide writer, if one was started; the next get_writer starts a new one"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    return writer.stop(timeout) if writer is not None else True
+
+
+def single_writer(fn):
+    """Run a persistence function on the writer when there is one
+
+    Calls already inside a transaction run in place: handing them to the
+    writer would make it wait on the caller's own lock.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        writer = get_writer()
+        if writer is None or writer.is_writer_thread() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return fn(*args, **kwargs)
+        return writer.run(fn, *args, **kwargs)
+    return wrapper
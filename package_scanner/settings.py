@@ -83,6 +83,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL lets requests read while scan results are committed;
+            # IMMEDIATE transactions take the write lock up front instead of
+            # failing to upgrade a read lock with "database is locked"
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -122,3 +130,146 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# Package scanner
+
+# Worker pool size used to fetch registry metadata for a single scan; a scan
+# request may ask for a different value up to SCAN_MAX_CONCURRENCY
+SCAN_CONCURRENCY = 8
+SCAN_MAX_CONCURRENCY = 32
+
+# Shared registry metadata cache. 'lru' keeps entries in process memory;
+# 'sqlite' stores them in PATH so every worker process shares them. Entries
+# older than TTL seconds are still served for STALE_TTL more seconds while
+# they are refreshed in the background. With COALESCE, concurrent misses for
+# the same package share one registry request; on 'sqlite' that holds across
+# processes too, through leases that expire after LEASE_TTL seconds.
+SCANNER_CACHE = {
+    'BACKEND': 'lru',
+    'PATH': BASE_DIR / 'scanner_cache.sqlite3',
+    'MAX_ENTRIES': 10000,
+    'TTL': 3600,
+    'STALE_TTL': 86400,
+    'COALESCE': True,
+    'LEASE_TTL': 30,
+}
+SCANNER_DOWNLOADS_TTL = 6 * 3600
+
+# Background scans (POST /api/scan/file/ with "async": true). Queued scans are
+# run by this many threads in each web process; set it to 0 to leave them to
+# `manage.py run_scan_worker`. Progress is stored every SCAN_PROGRESS_CHUNK_SIZE
+# packages.
+SCAN_ASYNC_WORKERS = 2
+SCAN_PROGRESS_CHUNK_SIZE = 100
+# Running scans refresh ScanRequest.heartbeat_at every SCAN_HEARTBEAT_INTERVAL
+# seconds; a processing scan silent for SCAN_STALE_AFTER seconds (its worker
+# crashed) is requeued, its partial results dropped, by the next worker to poll.
+SCAN_HEARTBEAT_INTERVAL = 30
+SCAN_STALE_AFTER = 300
+
+# npm registry and downloads API; point them at a mirror or at the benchmark
+# stand-in registry (see benchmarks/)
+NPM_REGISTRY_URL = 'https://registry.npmjs.org'
+NPM_DOWNLOADS_URL = 'https://api.npmjs.org/downloads/point/last-week'
+# Package info is read from the full packument, streamed so READMEs and unused
+# version manifests are skipped rather than parsed: one request per package,
+# with the resolved version's publish time. NPM_LEAN_METADATA reads abbreviated
+# metadata plus the version's manifest instead: fewer bytes, but two requests,
+# and unless the registry includes publish times in abbreviated metadata the
+# package's last change is scored instead of the version's.
+NPM_LEAN_METADATA = False
+# Packages per bulk query to the npm downloads API (its maximum is 128)
+NPM_DOWNLOADS_BATCH_SIZE = 128
+
+# Budget for transitive scans ("transitive": true); graphs that hit either
+# limit are reported as truncated
+SCAN_TRANSITIVE_MAX_DEPTH = 10
+SCAN_TRANSITIVE_MAX_NODES = 5000
+
+# Offline vulnerability index built from OSV advisories with
+# `manage.py build_vuln_index <dump>`; running processes pick up a rebuilt file
+VULN_INDEX_PATH = BASE_DIR / 'vulnerability_index.json.gz'
+
+# Popular package names that near-miss names are flagged against, built with
+# `manage.py build_typosquat_index`; without it the lists in scanners/data are
+# used. Running processes pick up a rebuilt file.
+TYPOSQUAT_INDEX_PATH = BASE_DIR / 'typosquat_index.json.gz'
+# Packages with more weekly downloads than this are not flagged, so popular
+# packages missing from the lists (preact, a typo away from react) are spared
+TYPOSQUAT_MAX_DOWNLOADS = 100000
+
+# Risk scoring policy: sections laid over core.policy.DEFAULT_POLICY (weights,
+# security, maintenance, popularity, license). RISK_POLICY_PATH, a JSON file of
+# the same shape, takes precedence and is reloaded when it changes; an invalid
+# edit is logged and the previous policy kept. Scans record the policy version.
+RISK_POLICY = {}
+RISK_POLICY_PATH = None
+
+# Registry HTTP client. Responses with an ETag or Last-Modified are kept
+# zlib-compressed in CACHE_PATH (shared by every worker process) and
+# revalidated with conditional requests, so unchanged documents cost a 304.
+# POOL_MAXSIZE should be at least SCAN_MAX_CONCURRENCY.
+SCANNER_HTTP = {
+    'CACHE': True,
+    'CACHE_PATH': BASE_DIR / 'scanner_http_cache.sqlite3',
+    'CACHE_MAX_BYTES': 512 * 1024 * 1024,
+    'POOL_CONNECTIONS': 10,
+    'POOL_MAXSIZE': 32,
+    'KEEP_ALIVE': True,
+}
+
+# Registry rate limiting, per host: a token bucket (RATE requests/s, BURST at
+# once), an AIMD concurrency window that halves on 429/503 and honours
+# Retry-After, RETRIES jittered retries, and a circuit breaker that fails fast
+# for BREAKER_RESET seconds after BREAKER_THRESHOLD consecutive failures.
+# Packages that still fail are reported as incomplete. See scanners.ratelimit
+# for every key; HOSTS overrides them per host.
+SCANNER_RATE_LIMIT = {
+    'ENABLED': True,
+    'RATE': 200.0,
+    'BURST': 200,
+    'INITIAL_CONCURRENCY': 16,
+    'MAX_CONCURRENCY': 64,
+    'RETRIES': 3,
+    'BREAKER_THRESHOLD': 10,
+    'BREAKER_RESET': 30.0,
+    'HOSTS': {},
+}
+
+# Identical submissions (same parsed dependencies, ecosystem, scoring and
+# advisory versions) within this many seconds of a completed scan get a copy
+# of its results instead of a new scan; 0 turns deduplication off. Hit rates
+# are at /api/scan/dedup/stats/.
+SCAN_DEDUP_WINDOW = 3600
+
+# Scan reports (/api/reports/<id>/) are paginated riskiest first: ?limit= rows
+# per page (default SCAN_REPORT_PAGE_SIZE, at most SCAN_REPORT_MAX_PAGE_SIZE).
+# ?stream=1 sends the whole report, reading SCAN_REPORT_STREAM_CHUNK_SIZE rows
+# from the database at a time.
+SCAN_REPORT_PAGE_SIZE = 500
+SCAN_REPORT_MAX_PAGE_SIZE = 5000
+SCAN_REPORT_STREAM_CHUNK_SIZE = 2000
+
+# Bulk exports (/api/export/ and `manage.py export_results`) read this many
+# package results from the database at a time
+SCAN_EXPORT_CHUNK_SIZE = 2000
+
+# Batch package checks (/api/check/packages/) answer from the latest-risk
+# snapshot that completed scans keep up to date. Entries older than
+# SCAN_SNAPSHOT_TTL seconds are fetched and scored again; a request may check
+# up to SCAN_CHECK_MAX_PACKAGES packages.
+SCAN_SNAPSHOT_TTL = 24 * 3600
+SCAN_CHECK_MAX_PACKAGES = 1000
+
+# Scan results are written by one thread per process that commits many scans'
+# writes per transaction (see core.writer). ENABLED None means SQLite only.
+# Up to MAX_BATCH writes are grouped, waiting MAX_DELAY seconds for more; when
+# MAX_QUEUE writes are waiting, scans block, and fail after QUEUE_TIMEOUT.
+SCAN_DB_WRITER = {
+    'ENABLED': None,
+    'MAX_QUEUE': 256,
+    'MAX_BATCH': 64,
+    'MAX_DELAY': 0.005,
+    'QUEUE_TIMEOUT': 60,
+}
@@ -1,19 +1,82 @@
 from abc import ABC, abstractmethod
-import requests
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+
+from .cache import get_metadata_cache
+from .metrics import span
+from .registry_http import build_registry_session
+from .typosquat_index import get_typosquat_index, get_typosquat_max_downloads
+from .vulnerability_index import get_vulnerability_index
 
 
 class BasePackageScanner(ABC):
     """Abstract base class for all package scanners"""
 
+    # Ecosystem name used in metadata cache keys
+    ecosystem = None
+
     def __init__(self):
-        self.session = requests.Session()
+        self.session = build_registry_session()
         self.session.headers.update({
             'User-Agent': 'PackageScanner/1.0'
         })
+        self.cache = get_metadata_cache()
+
+    def get_package_info(self, package_name: str, version: Optional[str] = None,
+                         include_downloads: bool = True) -> Dict:
+        """Get package information, served from the shared metadata cache"""
+        package_info = self.cache.get_or_load(
+            (self.ecosystem, package_name, version),
+            lambda: self._fetch_package_info(package_name, version),
+            cacheable=lambda info: 'error' not in info,
+        )
+        if 'error' not in package_info:
+            # Checked after the cache so a rebuilt index applies immediately
+            self._annotate_vulnerabilities(package_info)
+            self._annotate_typosquat(package_info)
+            if include_downloads:
+                self.set_download_stats(package_info, self._get_download_stats(package_name))
+        return package_info
+
+    def get_cached_package_info(self, package_name: str, version: Optional[str] = None) -> Optional[Dict]:
+        """Package information from the metadata cache alone, however old; None if never fetched"""
+        package_info = self.cache.peek((self.ecosystem, package_name, version))
+        if package_info is None:
+            return None
+        self._annotate_vulnerabilities(package_info)
+        self._annotate_typosquat(package_info)
+        downloads = self.cache.peek(self._download_stats_key(package_name))
+        self.set_download_stats(package_info, downloads if downloads is not None else {'downloads': 0})
+        return package_info
+
+    def check_vulnerabilities(self, package_name: str, version: Optional[str]) -> List[Dict]:
+        """Known advisories for a package version, from the offline index"""
+        return get_vulnerability_index().lookup(self.ecosystem, package_name, version)
+
+    def _annotate_vulnerabilities(self, package_info: Dict):
+        advisories = self.check_vulnerabilities(package_info.get('name'), package_info.get('version'))
+        package_info['has_vulnerabilities'] = bool(advisories)
+        package_info['vulnerability_count'] = len(advisories)
+        package_info['vulnerabilities'] = [advisory['id'] for advisory in advisories]
+
+    def _annotate_typosquat(self, package_info: Dict):
+        # The popular name this one is a near miss of, if any
+        package_info['typosquat_of'] = get_typosquat_index().lookup(self.ecosystem, package_info.get('name'))
+
+    def set_download_stats(self, package_info: Dict, stats):
+        """Attach download stats to package info
+
+        A package this popular is a reference in its own right rather than a
+        typosquat of one, however close its name (preact and react).
+        """
+        package_info['downloads'] = stats
+        downloads = stats.get('downloads', 0) if isinstance(stats, dict) else stats
+        if package_info.get('typosquat_of') and (downloads or 0) > get_typosquat_max_downloads():
+            package_info['typosquat_of'] = None
 
     @abstractmethod
-    def get_package_info(self, package_name: str) -> Dict:
+    def _fetch_package_info(self, package_name: str, version: Optional[str] = None) -> Dict:
         """Get package information from registry"""
         pass
 
@@ -22,6 +85,52 @@ class BasePackageScanner(ABC):
         """Parse dependencies from package file"""
         pass
 
+    def iter_dependencies(self, file_content: str) -> Iterator[Dict]:
+        """Yield dependencies one at a time; scanners that can stream large files override this"""
+        return iter(self.parse_dependencies(file_content))
+
+    def _get_download_stats(self, package_name: str) -> Dict:
+        """Get download statistics, served from the shared metadata cache"""
+        with span('download_stats'):
+            stats = self.cache.get_or_load(
+                self._download_stats_key(package_name),
+                lambda: self._fetch_download_stats(package_name),
+                ttl=getattr(settings, 'SCANNER_DOWNLOADS_TTL', 6 * 3600),
+                cacheable=lambda result: result is not None,
+            )
+        return stats if stats is not None else {'downloads': 0}
+
+    def get_download_stats_batch(self, package_names: List[str]) -> Dict[str, Dict]:
+        """Get download statistics for many packages, fetching cache misses together"""
+        keys = {self._download_stats_key(name): name for name in package_names}
+
+        def load(missing_keys):
+            fetched = self._fetch_download_stats_batch([keys[key] for key in missing_keys])
+            return {key: fetched.get(keys[key]) for key in missing_keys}
+
+        with span('download_stats'):
+            values = self.cache.get_many_or_load(
+                list(keys),
+                load,
+                ttl=getattr(settings, 'SCANNER_DOWNLOADS_TTL', 6 * 3600),
+                cacheable=lambda result: result is not None,
+            )
+        return {
+            keys[key]: stats if stats is not None else {'downloads': 0}
+            for key, stats in values.items()
+        }
+
+    def _download_stats_key(self, package_name: str):
+        return (f'{self.ecosystem}/downloads', package_name, None)
+
+    def _fetch_download_stats(self, package_name: str) -> Optional[Dict]:
+        """Get download statistics (None when the registry has none)"""
+        return None
+
+    def _fetch_download_stats_batch(self, package_names: List[str]) -> Dict[str, Optional[Dict]]:
+        """Get download statistics for many packages; registries with a bulk API override this"""
+        return {name: self._fetch_download_stats(name) for name in package_names}
+
     def calculate_risk_score(self, package_data: Dict) -> float:
         """Calculate risk score (0-100) for a package"""
         score = 50.0  # Default
@@ -34,4 +143,4 @@ class BasePackageScanner(ABC):
         if package_data.get('is_unmaintained'):
             score += 25
 
-        return min(score, 100.0)
\ No newline at end of file
+        return min(score, 100.0)
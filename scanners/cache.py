@@ -0,0 +1,460 @@
+import copy
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .metrics import record_cache_lookup
+from .singleflight import LeaseTable, SingleFlight
+
+
+CacheKey = Tuple
+# (value, expires_at, stale_until)
+CacheRecord = Tuple[Any, float, float]
+# Counters that are lookups, also attributed to the scan making them
+LOOKUP_RESULTS = ('hits', 'stale_hits', 'misses')
+
+
+class BaseCacheBackend(ABC):
+    """Storage for metadata cache records"""
+
+    evictions = 0
+
+    @abstractmethod
+    def get(self, key: CacheKey) -> Optional[CacheRecord]:
+        """Return the stored record for key, if any"""
+        pass
+
+    @abstractmethod
+    def set(self, key: CacheKey, value: Any, expires_at: float, stale_until: float):
+        """Store a record for key"""
+        pass
+
+    @abstractmethod
+    def delete(self, key: CacheKey):
+        """Remove key from the cache"""
+        pass
+
+    @abstractmethod
+    def clear(self):
+        """Remove every record"""
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class LRUCacheBackend(BaseCacheBackend):
+    """In-process cache evicting the least recently used entry"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: CacheKey) -> Optional[CacheRecord]:
+        with self._lock:
+            record = self._data.get(key)
+            if record is None:
+                return None
+            self._data.move_to_end(key)
+        value, expires_at, stale_until = record
+        # Callers are free to mutate what they get back
+        return copy.deepcopy(value), expires_at, stale_until
+
+    def set(self, key: CacheKey, value: Any, expires_at: float, stale_until: float):
+        record = (copy.deepcopy(value), expires_at, stale_until)
+        with self._lock:
+            self._data[key] = record
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: CacheKey):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCacheBackend(BaseCacheBackend):
+    """On-disk cache shared by every process using the same file"""
+
+    # How many writes happen between size checks
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL,'
+            ' stale_until REAL NOT NULL,'
+            ' stored_at REAL NOT NULL)'
+        )
+        conn.execute(
+            'CREATE INDEX IF NOT EXISTS metadata_cache_stored_at '
+            'ON metadata_cache (stored_at)'
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def _encode_key(self, key: CacheKey) -> str:
+        return json.dumps(list(key))
+
+    def get(self, key: CacheKey) -> Optional[CacheRecord]:
+        row = self._connection().execute(
+            'SELECT value, expires_at, stale_until FROM metadata_cache WHERE key = ?',
+            (self._encode_key(key),)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key: CacheKey, value: Any, expires_at: float, stale_until: float):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO metadata_cache '
+                '(key, value, expires_at, stale_until, stored_at) VALUES (?, ?, ?, ?, ?)',
+                (self._encode_key(key), json.dumps(value), expires_at, stale_until, time.time())
+            )
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_INTERVAL == 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        """Drop expired records, then the oldest ones above max_entries"""
+        conn = self._connection()
+        with conn:
+            expired = conn.execute(
+                'DELETE FROM metadata_cache WHERE stale_until < ?', (time.time(),)
+            ).rowcount
+            overflow = conn.execute(
+                'DELETE FROM metadata_cache WHERE key IN ('
+                ' SELECT key FROM metadata_cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            ).rowcount
+        self.evictions += expired + overflow
+
+    def delete(self, key: CacheKey):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM metadata_cache WHERE key = ?', (self._encode_key(key),))
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM metadata_cache')
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM metadata_cache').fetchone()[0]
+
+
+class MetadataCache:
+    """Registry metadata cache with per-entry TTLs and stale-while-revalidate
+
+    Fresh entries are returned directly. Entries past their TTL but still
+    inside the stale window are returned immediately while a background
+    worker reloads them, so hot packages never wait on the registry.
+
+    Concurrent misses for the same key share one load: threads wait for
+    the one already loading it, and with leases, so do other processes
+    using the same cache file.
+    """
+
+    def __init__(self, backend: BaseCacheBackend, ttl: int = 3600,
+                 stale_ttl: int = 86400, refresh_workers: int = 4, coalesce: bool = True,
+                 leases: Optional[LeaseTable] = None):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._flights = SingleFlight() if coalesce else None
+        self.leases = leases
+        self._refresh_pool = ThreadPoolExecutor(
+            max_workers=refresh_workers, thread_name_prefix='cache-refresh'
+        )
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'stale_hits': 0,
+            'misses': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'coalesced': 0,
+            'lease_waits': 0,
+        }
+
+    def get_or_load(self, key: CacheKey, loader: Callable[[], Any], ttl: Optional[int] = None,
+                    cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """Return the cached value for key, calling loader on a miss"""
+        now = time.time()
+        record = self.backend.get(key)
+
+        if record is not None:
+            value, expires_at, stale_until = record
+            if now < expires_at:
+                self._count('hits')
+                return value
+            if now < stale_until:
+                self._count('stale_hits')
+                self._schedule_refresh(key, loader, ttl, cacheable)
+                return value
+
+        self._count('misses')
+        if self._flights is None:
+            return self._load(key, loader, ttl, cacheable)
+        value, shared = self._flights.do(key, lambda: self._load(key, loader, ttl, cacheable))
+        if shared:
+            self._count('coalesced')
+        return value
+
+    def get(self, key: CacheKey) -> Any:
+        """Return the cached value for key, fresh or stale, without loading it"""
+        record = self.backend.get(key)
+        if record is not None:
+            value, expires_at, stale_until = record
+            now = time.time()
+            if now < expires_at:
+                self._count('hits')
+                return value
+            if now < stale_until:
+                self._count('stale_hits')
+                return value
+        self._count('misses')
+        return None
+
+    def peek(self, key: CacheKey) -> Any:
+        """Return any stored value for key, however old, without loading or counting it"""
+        record = self.backend.get(key)
+        return record[0] if record is not None else None
+
+    def get_many_or_load(self, keys: List[CacheKey], loader: Callable[[List[CacheKey]], Dict],
+                         ttl: Optional[int] = None,
+                         cacheable: Optional[Callable[[Any], bool]] = None) -> Dict:
+        """Return cached values for keys, loading every miss with one loader call
+
+        loader receives the missing keys and returns a dict keyed by them.
+        Stale keys are served and reloaded together in the background.
+        """
+        now = time.time()
+        values = {}
+        missing = []
+        stale = []
+
+        for key in dict.fromkeys(keys):
+            record = self.backend.get(key)
+            if record is not None:
+                value, expires_at, stale_until = record
+                if now < expires_at:
+                    self._count('hits')
+                    values[key] = value
+                    continue
+                if now < stale_until:
+                    self._count('stale_hits')
+                    values[key] = value
+                    stale.append(key)
+                    continue
+            self._count('misses')
+            missing.append(key)
+
+        if stale:
+            self._schedule_refresh_many(stale, loader, ttl, cacheable)
+
+        if missing:
+            loaded = loader(missing)
+            for key in missing:
+                values[key] = loaded.get(key)
+                self._store(key, values[key], ttl, cacheable)
+
+        return values
+
+    def set(self, key: CacheKey, value: Any, ttl: Optional[int] = None):
+        """Store value under key"""
+        self._store(key, value, ttl, None)
+
+    def invalidate(self, key: CacheKey):
+        """Drop a single entry"""
+        self.backend.delete(key)
+
+    def clear(self):
+        """Drop every entry"""
+        self.backend.clear()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and backend size"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['stale_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['hits'] + stats['stale_hits']) / lookups if lookups else 0.0
+        stats['entries'] = len(self.backend)
+        stats['evictions'] = self.backend.evictions
+        stats['backend'] = type(self.backend).__name__
+        stats['in_flight'] = len(self._flights) if self._flights is not None else 0
+        return stats
+
+    def _load(self, key, loader, ttl, cacheable):
+        leased = False
+        if self.leases is not None:
+            leased, record = self._wait_for_lease(key)
+            if record is not None:
+                return record[0]
+        try:
+            value = loader()
+            self._store(key, value, ttl, cacheable)
+        finally:
+            if leased:
+                self.leases.release(self._lease_key(key))
+        return value
+
+    def _wait_for_lease(self, key) -> Tuple[bool, Optional[CacheRecord]]:
+        """Take the lease on key, or wait for the process holding it to store the value
+
+        Returns (True, None) once leased and (False, record) when another
+        process stored the key meanwhile. After the lease TTL it returns
+        (False, None) and the caller loads the key anyway.
+        """
+        lease_key = self._lease_key(key)
+        deadline = time.monotonic() + self.leases.ttl
+        waited = False
+        while not self.leases.acquire(lease_key):
+            if not waited:
+                self._count('lease_waits')
+                waited = True
+            time.sleep(self.leases.poll_interval)
+            record = self.backend.get(key)
+            if record is not None and time.time() < record[1]:
+                return False, record
+            if time.monotonic() >= deadline:
+                return False, None
+        return True, None
+
+    def _lease_key(self, key) -> str:
+        return json.dumps(list(key))
+
+    def _store(self, key, value, ttl, cacheable):
+        if cacheable is not None and not cacheable(value):
+            return
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl
+        self.backend.set(key, value, expires_at, expires_at + self.stale_ttl)
+
+    def _schedule_refresh(self, key, loader, ttl, cacheable):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        self._refresh_pool.submit(self._refresh, key, loader, ttl, cacheable)
+
+    def _refresh(self, key, loader, ttl, cacheable):
+        # Another process already refreshing the key will store it for everyone
+        leased = self.leases is None or self.leases.acquire(self._lease_key(key))
+        try:
+            if leased:
+                self._store(key, loader(), ttl, cacheable)
+                self._count('refreshes')
+        except Exception:
+            # The stale value keeps being served until the next attempt
+            self._count('refresh_errors')
+        finally:
+            if leased and self.leases is not None:
+                self.leases.release(self._lease_key(key))
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _schedule_refresh_many(self, keys, loader, ttl, cacheable):
+        with self._lock:
+            keys = [key for key in keys if key not in self._refreshing]
+            self._refreshing.update(keys)
+        if keys:
+            self._refresh_pool.submit(self._refresh_many, keys, loader, ttl, cacheable)
+
+    def _refresh_many(self, keys, loader, ttl, cacheable):
+        try:
+            loaded = loader(keys)
+            for key in keys:
+                if key in loaded:
+                    self._store(key, loaded[key], ttl, cacheable)
+            self._count('refreshes')
+        except Exception:
+            self._count('refresh_errors')
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(keys)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._stats[counter] += 1
+        if counter in LOOKUP_RESULTS:
+            record_cache_lookup(counter)
+
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+
+def build_metadata_cache(config: Dict) -> MetadataCache:
+    """Create a MetadataCache from a SCANNER_CACHE style dict"""
+    backend_name = config.get('BACKEND', 'lru')
+    coalesce = config.get('COALESCE', True)
+    leases = None
+    if backend_name == 'lru':
+        backend = LRUCacheBackend(max_entries=config.get('MAX_ENTRIES', 10000))
+    elif backend_name == 'sqlite':
+        path = config.get('PATH', 'scanner_cache.sqlite3')
+        backend = SQLiteCacheBackend(path, max_entries=config.get('MAX_ENTRIES', 100000))
+        # Only a shared file lets one process's load serve the others
+        if coalesce:
+            leases = LeaseTable(path, ttl=config.get('LEASE_TTL', 30.0))
+    else:
+        raise ValueError(f"Unsupported cache backend: {backend_name}")
+
+    return MetadataCache(
+        backend,
+        ttl=config.get('TTL', 3600),
+        stale_ttl=config.get('STALE_TTL', 86400),
+        refresh_workers=config.get('REFRESH_WORKERS', 4),
+        coalesce=coalesce,
+        leases=leases,
+    )
+
+
+def get_metadata_cache() -> MetadataCache:
+    """Process-wide metadata cache shared by every scanner instance"""
+    global _metadata_cache
+    if _metadata_cache is None:
+        with _metadata_cache_lock:
+            if _metadata_cache is None:
+                _metadata_cache = build_metadata_cache(getattr(settings, 'SCANNER_CACHE', {}))
+    return _metadata_cache
@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from .metrics import span, submit_in_context
+
+
+def get_scan_concurrency(requested: Optional[int] = None) -> int:
+    """Resolve the worker count for a scan, capped by SCAN_MAX_CONCURRENCY"""
+    default = getattr(settings, 'SCAN_CONCURRENCY', 8)
+    limit = getattr(settings, 'SCAN_MAX_CONCURRENCY', 32)
+
+    try:
+        workers = int(requested) if requested else default
+    except (TypeError, ValueError):
+        workers = default
+
+    return max(1, min(workers, limit))
+
+
+class PackageFetcher:
+    """Fetch registry metadata for many dependencies with a bounded worker pool"""
+
+    def __init__(self, scanner, max_workers: Optional[int] = None):
+        self.scanner = scanner
+        self.max_workers = get_scan_concurrency(max_workers)
+
+    def fetch(self, dependencies: List[Dict]) -> List[Dict]:
+        """Fetch package info for each dependency, returned in manifest order"""
+        keys = [(dep['name'], dep.get('version')) for dep in dependencies]
+        unique_keys = list(dict.fromkeys(keys))
+        if not unique_keys:
+            return []
+
+        names = list(dict.fromkeys(name for name, _ in unique_keys))
+
+        with span('fetch'), ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            # Download stats are fetched in bulk alongside the metadata
+            stats_future = submit_in_context(pool, self.scanner.get_download_stats_batch, names)
+            info_futures = {
+                key: submit_in_context(
+                    pool, self.scanner.get_package_info, key[0], key[1], include_downloads=False
+                )
+                for key in unique_keys
+            }
+
+            fetched = {key: future.result() for key, future in info_futures.items()}
+            download_stats = stats_future.result()
+
+        for (name, _), package_info in fetched.items():
+            if 'error' not in package_info:
+                self.scanner.set_download_stats(package_info, download_stats.get(name, {'downloads': 0}))
+
+        # Duplicate entries share one fetch but get their own dict
+        return [dict(fetched[key]) for key in keys]
@@ -0,0 +1,178 @@
+import codecs
+import json
+import re
+from typing import Any, Iterable, Iterator, Union
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+_STRUCTURAL = re.compile(r'["{}\[\]]')
+_NUMBER_CHARS = re.compile(r'[0-9.eE+-]*')
+
+
+class JSONStream:
+    """Pull-style reader over a JSON document that arrives in chunks
+
+    Only the part of the document currently being read is held in memory.
+    Callers walk containers with iter_object/iter_array and must consume
+    every member value with read_value, skip_value or a nested iterator.
+    """
+
+    def __init__(self, chunks: Iterable[Union[str, bytes]]):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.bytes_read = 0
+        self.peak_buffer = 0
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield the keys of the object at the current position"""
+        self._expect('{')
+        if self._peek() == '}':
+            self.pos += 1
+            return
+
+        while True:
+            key = self.read_value()
+            if not isinstance(key, str):
+                raise ValueError(f"Expected an object key, got {key!r}")
+            self._expect(':')
+            yield key
+            if self._end_member('}') == '}':
+                return
+
+    def iter_array(self) -> Iterator[int]:
+        """Yield the index of each element of the array at the current position"""
+        self._expect('[')
+        if self._peek() == ']':
+            self.pos += 1
+            return
+
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self._end_member(']') == ']':
+                return
+
+    def read_value(self) -> Any:
+        """Decode the value at the current position"""
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._grow():
+                    raise
+                continue
+
+            # A number cut by a chunk boundary decodes as a shorter one
+            if isinstance(value, (int, float)) and not self.eof:
+                if _NUMBER_CHARS.match(self.buffer, end).end() == len(self.buffer):
+                    self._fill()
+                    continue
+
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """Move past the value at the current position without decoding it"""
+        char = self._peek()
+        if char == '"':
+            self._skip_string()
+            return
+        if char not in ('{', '['):
+            self.read_value()
+            return
+
+        depth = 0
+        while True:
+            match = _STRUCTURAL.search(self.buffer, self.pos)
+            if match is None:
+                self.pos = len(self.buffer)
+                if not self._fill():
+                    raise ValueError('Unexpected end of JSON input')
+                continue
+
+            char = match.group()
+            if char == '"':
+                self.pos = match.start()
+                self._skip_string()
+                continue
+
+            self.pos = match.end()
+            if char in ('{', '['):
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return
+
+    def _skip_string(self):
+        self.pos += 1  # Opening quote
+        while True:
+            self.pos = _STRING_BODY.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) and self.buffer[self.pos] == '"':
+                self.pos += 1
+                return
+            # Stopped at the end of the buffer, possibly before a split escape
+            if not self._fill():
+                raise ValueError('Unterminated string in JSON input')
+
+    def _end_member(self, closing: str) -> str:
+        char = self._peek()
+        if char not in (',', closing):
+            raise ValueError(f"Expected ',' or {closing!r} in JSON input, got {char!r}")
+        self.pos += 1
+        return char
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON input, got {found!r}")
+        self.pos += 1
+
+    def _peek(self) -> str:
+        """Next non-whitespace character ('' at end of input)"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def _grow(self) -> bool:
+        """Read until the unconsumed buffer doubles, so large values parse in linear time"""
+        target = max(len(self.buffer) - self.pos, 1) * 2
+        grew = False
+        while len(self.buffer) - self.pos < target and self._fill():
+            grew = True
+        return grew
+
+    def _fill(self) -> bool:
+        """Drop consumed text and append the next chunk; False at end of input"""
+        if self.eof:
+            return False
+
+        if self.pos:
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            self.eof = True
+            self.buffer += self._utf8.decode(b'', final=True)
+            return False
+
+        if isinstance(chunk, bytes):
+            self.bytes_read += len(chunk)
+            chunk = self._utf8.decode(chunk)
+        else:
+            self.bytes_read += len(chunk)
+        self.buffer += chunk
+        self.peak_buffer = max(self.peak_buffer, len(self.buffer))
+        return True
@@ -0,0 +1,178 @@
+import codecs
+import re
+from itertools import chain
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from .jsonstream import JSONStream
+
+
+Source = Union[str, bytes, Iterable[Union[str, bytes]]]
+
+CHUNK_SIZE = 64 * 1024
+
+# Yarn protocols that do not come from the npm registry
+_YARN_PROTOCOL_RE = re.compile(r'^[a-z+-]+:')
+_YARN_VERSION_RE = re.compile(r'^  version:? "?([^"\s]+)"?\s*$')
+
+
+def iter_chunks(source: Source) -> Iterator[Union[str, bytes]]:
+    """Split an in-memory document into chunks, or pass a chunk iterable through"""
+    if isinstance(source, (str, bytes)):
+        return (source[i:i + CHUNK_SIZE] for i in range(0, len(source), CHUNK_SIZE))
+    return iter(source)
+
+
+def sniff(source: Source) -> Tuple[str, Iterator[Union[str, bytes]]]:
+    """First non-blank character of a document, and its chunks with nothing consumed"""
+    chunks = iter_chunks(source)
+    seen = []
+    for chunk in chunks:
+        seen.append(chunk)
+        text = chunk.decode('utf-8', 'ignore') if isinstance(chunk, bytes) else chunk
+        text = text.lstrip('\ufeff \t\r\n')
+        if text:
+            return text[0], chain(seen, chunks)
+    return '', iter(seen)
+
+
+def iter_lines(chunks: Iterable[Union[str, bytes]]) -> Iterator[str]:
+    """Lines of a chunked text document, without line endings"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+        lines = pending.split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending.rstrip('\r')
+
+
+def iter_npm_json(chunks: Iterable[Union[str, bytes]]) -> Iterator[Dict]:
+    """Dependencies of a package.json or package-lock.json (v1, v2 or v3)
+
+    Lockfile entries are yielded one at a time, with the locked version, as
+    the document is read. package.json ranges are small and are yielded once
+    the document has been read, with devDependencies taking precedence.
+    """
+    stream = JSONStream(chunks)
+    seen = set()
+    has_packages = False
+    deps, dev_deps = {}, {}
+
+    for key in stream.iter_object():
+        if key == 'packages':
+            # lockfileVersion 2 and 3: a flat map of install paths
+            has_packages = True
+            for path in stream.iter_object():
+                record = _lock_package_record(path, stream.read_value())
+                if record is not None and _first_time(seen, record):
+                    yield record
+        elif key == 'dependencies' and not has_packages:
+            for name in stream.iter_object():
+                value = stream.read_value()
+                if isinstance(value, dict):
+                    # lockfileVersion 1: a tree of nested dependency objects
+                    for record in _lock_v1_records(name, value):
+                        if _first_time(seen, record):
+                            yield record
+                else:
+                    deps[name] = value
+        elif key == 'devDependencies':
+            dev_deps = stream.read_value()
+        else:
+            stream.skip_value()
+
+    for name, version in {**deps, **dev_deps}.items():
+        yield {
+            'name': name,
+            'version': version,
+            'type': 'dependency' if name in deps else 'devDependency'
+        }
+
+
+def _lock_package_record(path: str, entry) -> Optional[Dict]:
+    """Dependency record for one "packages" entry of a v2/v3 lockfile"""
+    # "" is the project itself, paths outside node_modules are workspaces
+    if 'node_modules/' not in path or not isinstance(entry, dict) or entry.get('link'):
+        return None
+    version = entry.get('version')
+    if not version:
+        return None
+    return {
+        # Aliased installs record the real package name
+        'name': entry.get('name') or path.rsplit('node_modules/', 1)[1],
+        'version': version,
+        'type': 'devDependency' if entry.get('dev') else 'dependency',
+        'locked': True,
+    }
+
+
+def _lock_v1_records(name: str, entry: Dict) -> Iterator[Dict]:
+    """Dependency records for a v1 lockfile entry and everything nested below it"""
+    stack = [(name, entry)]
+    while stack:
+        name, entry = stack.pop()
+        version = entry.get('version', '')
+        if version.startswith('npm:'):
+            # Aliases: "npm:real-name@1.2.3"
+            name, _, version = version[4:].rpartition('@')
+        if version and not _YARN_PROTOCOL_RE.match(version) and '/' not in version:
+            yield {
+                'name': name,
+                'version': version,
+                'type': 'devDependency' if entry.get('dev') else 'dependency',
+                'locked': True,
+            }
+        stack.extend(reversed(list((entry.get('dependencies') or {}).items())))
+
+
+def iter_yarn_lock(lines: Iterable[str]) -> Iterator[Dict]:
+    """Dependencies of a yarn.lock, classic (v1) or berry, one entry at a time"""
+    seen = set()
+    name = None
+
+    for line in lines:
+        if not line or line.startswith('#'):
+            continue
+        if not line[0].isspace():
+            name = _yarn_entry_name(line)
+            continue
+        if name is None:
+            continue
+        match = _YARN_VERSION_RE.match(line)
+        if match:
+            record = {'name': name, 'version': match.group(1), 'type': 'dependency', 'locked': True}
+            name = None
+            if _first_time(seen, record):
+                yield record
+
+
+def _yarn_entry_name(header: str) -> Optional[str]:
+    """Package name of a yarn.lock entry header, or None for non-registry entries"""
+    descriptor = header.rstrip(':').split(',')[0].strip().strip('"')
+    at = descriptor.find('@', 1)
+    if at == -1:
+        # __metadata and other bookkeeping entries
+        return None
+    name, range_ = descriptor[:at], descriptor[at + 1:]
+
+    if range_.startswith('npm:'):
+        target = range_[4:]
+        # Aliases: "alias@npm:real-name@^1.0.0"
+        alias_at = target.find('@', 1)
+        return target[:alias_at] if alias_at != -1 else name
+    if _YARN_PROTOCOL_RE.match(range_):
+        # workspace:, patch:, git, file: and tarball URLs
+        return None
+    return name
+
+
+def _first_time(seen: set, record: Dict) -> bool:
+    key = (record['name'], record['version'])
+    if key in seen:
+        return False
+    seen.add(key)
+    return True
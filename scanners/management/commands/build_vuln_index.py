@@ -0,0 +1,52 @@
+import os
+from itertools import chain
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from scanners.vulnerability_index import VulnerabilityIndex, iter_osv_documents
+
+
+class Command(BaseCommand):
+    help = 'Build or update the offline vulnerability index from OSV advisories'
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='+',
+                            help='OSV zip dumps (e.g. npm/all.zip), directories or JSON files')
+        parser.add_argument('--output', default=None,
+                            help='Index file to write (defaults to VULN_INDEX_PATH)')
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild from scratch instead of reusing the existing index')
+        parser.add_argument('--prune', action='store_true',
+                            help='Remove advisories whose source file is no longer present')
+
+    def handle(self, *args, **options):
+        path = options['output'] or getattr(settings, 'VULN_INDEX_PATH', None)
+        if not path:
+            raise CommandError('Set VULN_INDEX_PATH or pass --output')
+
+        for source in options['sources']:
+            if not os.path.exists(source):
+                raise CommandError(f"Source not found: {source}")
+
+        index = VulnerabilityIndex()
+        if os.path.exists(path) and not options['full']:
+            try:
+                index = VulnerabilityIndex.load(path)
+            except Exception as e:
+                self.stderr.write(f"Could not read existing index ({e}); rebuilding from scratch")
+
+        counts = index.update(
+            chain.from_iterable(iter_osv_documents(source) for source in options['sources']),
+            prune=options['prune'],
+        )
+        index.save(path)
+
+        stats = index.stats()
+        self.stdout.write(
+            f"{counts['added']} added, {counts['updated']} updated, {counts['unchanged']} unchanged, "
+            f"{counts['removed']} removed, {counts['invalid']} invalid"
+        )
+        self.stdout.write(
+            f"Index {path}: {stats['advisories']} advisories for {stats['packages']} packages"
+        )
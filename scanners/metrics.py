@@ -0,0 +1,270 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), total
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.extend(self._header(name, 'counter'))
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+            for name, series in sorted(self._gauges.items()):
+                lines.extend(self._header(name, 'gauge'))
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+            for name, series in sorted(self._histograms.items()):
+                lines.extend(self._header(name, 'histogram'))
+                for labels, histogram in sorted(series.items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {count}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return lines
+
+    def _header(self, name: str, metric_type: str) -> List[str]:
+        lines = [f'# HELP {name} {self._help[name]}'] if name in self._help else []
+        lines.append(f'# TYPE {name} {metric_type}')
+        return lines
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + pairs + '}'
+
+
+registry = MetricsRegistry()
+registry.describe('package_scanner_stage_duration_seconds', 'Time spent in each scan pipeline stage')
+registry.describe('package_scanner_registry_request_duration_seconds',
+                  'Registry request latency up to the response headers, by host')
+registry.describe('package_scanner_registry_requests_total', 'Registry requests by host and status')
+registry.describe('package_scanner_scan_duration_seconds', 'Wall time of whole scans')
+registry.describe('package_scanner_scan_db_queries', 'Database queries per scan')
+registry.describe('package_scanner_registry_retries_total', 'Registry requests retried, by host and cause')
+registry.describe('package_scanner_registry_circuit_opened_total', 'Times a host circuit breaker opened')
+registry.describe('package_scanner_registry_concurrency_limit', 'Current AIMD concurrency window, by host')
+registry.describe('package_scanner_db_writer_queue', 'Writes waiting for the database writer')
+registry.describe('package_scanner_db_writer_batch_size', 'Writes committed per database writer transaction')
+
+
+class ScanMetrics:
+    """Timings and counts of a single scan
+
+    A scan's metrics are active for the thread running it and for work it
+    hands to pools with submit_in_context, so registry requests and cache
+    lookups made for the scan are attributed to it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict] = {}
+        self.registry: Dict[str, Dict] = {}
+        self.cache = {'hits': 0, 'stale_hits': 0, 'misses': 0}
+        self.db_queries = 0
+
+    @contextmanager
+    def activate(self):
+        token = _current_scan.set(self)
+        try:
+            yield self
+        finally:
+            _current_scan.reset(token)
+
+    @contextmanager
+    def count_queries(self):
+        """Count database queries made on this thread's connection
+
+        Writes handed to the database writer run on its connection; it counts
+        them toward the scan that submitted them (see count_scan_query).
+        """
+        from django.db import connection
+
+        def count(execute, sql, params, many, context):
+            self.add_query()
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            yield
+
+    def add_query(self):
+        with self._lock:
+            self.db_queries += 1
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            totals = self.stages.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            totals['seconds'] += seconds
+            totals['calls'] += 1
+
+    def add_request(self, host: str, seconds: float, failed: bool):
+        with self._lock:
+            totals = self.registry.setdefault(host, {'requests': 0, 'errors': 0, 'seconds': 0.0})
+            totals['requests'] += 1
+            totals['errors'] += int(failed)
+            totals['seconds'] += seconds
+
+    def add_cache_lookup(self, result: str):
+        with self._lock:
+            self.cache[result] = self.cache.get(result, 0) + 1
+
+    def summary(self) -> Dict:
+        """JSON-ready totals; stage times overlap where stages run concurrently"""
+        with self._lock:
+            total = time.perf_counter() - self.started
+            return {
+                'total_seconds': round(total, 4),
+                'stages': {
+                    stage: {'seconds': round(t['seconds'], 4), 'calls': t['calls']}
+                    for stage, t in self.stages.items()
+                },
+                'registry': {
+                    host: {
+                        'requests': t['requests'],
+                        'errors': t['errors'],
+                        'seconds': round(t['seconds'], 4),
+                        'mean_seconds': round(t['seconds'] / t['requests'], 4) if t['requests'] else 0.0,
+                    }
+                    for host, t in self.registry.items()
+                },
+                'cache': dict(self.cache),
+                'db_queries': self.db_queries,
+            }
+
+    def finish(self) -> Dict:
+        """Record the scan in the process-wide metrics and return its summary"""
+        summary = self.summary()
+        registry.observe('package_scanner_scan_duration_seconds', summary['total_seconds'])
+        registry.observe('package_scanner_scan_db_queries', summary['db_queries'], buckets=COUNT_BUCKETS)
+        return summary
+
+
+_current_scan: contextvars.ContextVar[Optional[ScanMetrics]] = contextvars.ContextVar(
+    'current_scan_metrics', default=None
+)
+
+
+def current_scan() -> Optional[ScanMetrics]:
+    return _current_scan.get()
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage, process-wide and for the current scan"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe('package_scanner_stage_duration_seconds', elapsed, stage=stage)
+        scan = _current_scan.get()
+        if scan is not None:
+            scan.add_stage(stage, elapsed)
+
+
+def record_request(host: str, seconds: float, status):
+    """One registry request; status is the HTTP status or 'error'"""
+    registry.observe('package_scanner_registry_request_duration_seconds', seconds, host=host)
+    registry.inc('package_scanner_registry_requests_total', host=host, status=status)
+    scan = _current_scan.get()
+    if scan is not None:
+        scan.add_request(host, seconds, failed=status == 'error' or status >= 500)
+
+
+def record_cache_lookup(result: str):
+    scan = _current_scan.get()
+    if scan is not None:
+        scan.add_cache_lookup(result)
+
+
+def count_scan_query(execute, sql, params, many, context):
+    """Connection execute_wrapper counting each query toward the current scan, if there is one"""
+    scan = _current_scan.get()
+    if scan is not None:
+        scan.add_query()
+    return execute(sql, params, many, context)
+
+
+def submit_in_context(pool, fn, *args, **kwargs):
+    """pool.submit, running fn with the caller's context so it counts toward the current scan"""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def render_prometheus(counters: Optional[Dict[str, float]] = None,
+                      gauges: Optional[Dict[str, float]] = None) -> str:
+    """Every process-wide metric, plus totals kept elsewhere (cache and HTTP stats), as Prometheus text"""
+    lines = registry.render()
+    for metric_type, values in (('counter', counters), ('gauge', gauges)):
+        for name, value in sorted((values or {}).items()):
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {value}')
+    return '\n'.join(lines) + '\n'
@@ -1,38 +1,45 @@
-import json
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+
+from django.conf import settings
+
 from .base_scanner import BasePackageScanner
+from .jsonstream import JSONStream
+from .lockfiles import Source, iter_lines, iter_npm_json, iter_yarn_lock, sniff
+from .semver import is_exact, max_satisfying, satisfies
+
+
+# Abbreviated "corgi" metadata: version manifests without READMEs and
+# publishing details, a fraction of the size of the full packument
+ABBREVIATED_METADATA_ACCEPT = 'application/vnd.npm.install-v1+json; q=1.0, application/json; q=0.8'
+PACKUMENT_VERSION_FIELDS = ('license', 'dependencies', 'deprecated')
+STREAM_CHUNK_SIZE = 64 * 1024
 
 
 class NPMPackageScanner(BasePackageScanner):
     """Scanner for NPM packages"""
 
+    ecosystem = 'npm'
+
     def __init__(self):
         super().__init__()
-        self.registry_url = "https://registry.npmjs.org"
+        self.registry_url = getattr(settings, 'NPM_REGISTRY_URL', 'https://registry.npmjs.org').rstrip('/')
+        self.downloads_url = getattr(
+            settings, 'NPM_DOWNLOADS_URL', 'https://api.npmjs.org/downloads/point/last-week'
+        ).rstrip('/')
+        self.lean_metadata = getattr(settings, 'NPM_LEAN_METADATA', False)
+        self.downloads_batch_size = getattr(settings, 'NPM_DOWNLOADS_BATCH_SIZE', 128)
 
-    def get_package_info(self, package_name: str) -> Dict:
+    def _fetch_package_info(self, package_name: str, version: Optional[str] = None) -> Dict:
         """Get package info from NPM registry"""
         try:
-            response = self.session.get(f"{self.registry_url}/{package_name}")
-            response.raise_for_status()
-            data = response.json()
-
-            latest_version = data.get('dist-tags', {}).get('latest', '')
-            latest_data = data.get('versions', {}).get(latest_version, {})
-
-            return {
-                'name': package_name,
-                'version': latest_version,
-                'description': data.get('description', ''),
-                'author': self._extract_author(data.get('author', {})),
-                'last_updated': data.get('time', {}).get(latest_version, ''),
-                'license': latest_data.get('license', ''),
-                'dependencies': latest_data.get('dependencies', {}),
-                'has_vulnerabilities': self._check_vulnerabilities(package_name),
-                'is_deprecated': 'deprecated' in data,
-                'downloads': self._get_download_stats(package_name),
-            }
+            if self.lean_metadata:
+                package_info = self._fetch_lean_package_info(package_name, version)
+                if package_info is not None:
+                    return package_info
+            return self._fetch_full_package_info(package_name, version)
         except requests.RequestException as e:
             return {
                 'name': package_name,
@@ -41,27 +48,178 @@ class NPMPackageScanner(BasePackageScanner):
                 'is_deprecated': False,
             }
 
-    def parse_dependencies(self, file_content: str) -> List[Dict]:
-        """Parse dependencies from package.json"""
+    def _fetch_lean_package_info(self, package_name: str, version: Optional[str] = None) -> Optional[Dict]:
+        """Build package info from abbreviated metadata plus one version manifest
+
+        Two requests per package (the summary is cached per package), but no
+        READMEs are transferred. Returns None when the registry does not serve
+        abbreviated metadata, in which case the full packument is needed.
+        """
+        summary = self.cache.get_or_load(
+            (f'{self.ecosystem}/summary', package_name, None),
+            lambda: self._fetch_summary(package_name),
+            cacheable=lambda result: result is not None,
+        )
+        if summary is None:
+            return None
+
+        selected_version = self._resolve_version(summary['dist_tags'], summary['versions'], version)
+        if not selected_version:
+            return None
+        if selected_version not in summary['versions']:
+            return self._missing_version_info(package_name, selected_version)
+
+        manifest, stream = self._read_document(
+            f"{self.registry_url}/{package_name}/{selected_version}",
+            lambda s: s.read_value(),
+        )
+
+        return {
+            'name': package_name,
+            'version': selected_version,
+            'latest_version': summary['dist_tags'].get('latest', ''),
+            'description': manifest.get('description', ''),
+            'author': self._extract_author(manifest.get('author', {})),
+            # Registries that include publish times in abbreviated metadata give the
+            # version's; otherwise only when the package as a whole last changed is known
+            'last_updated': summary['time'].get(selected_version) or summary['modified'],
+            'license': manifest.get('license', ''),
+            'dependencies': manifest.get('dependencies', {}),
+            'is_deprecated': 'deprecated' in manifest or selected_version in summary['deprecated'],
+            'metadata_mode': 'abbreviated',
+            'metadata_bytes': summary['bytes'] + stream.bytes_read,
+            'metadata_peak_bytes': max(summary['peak_bytes'], stream.peak_buffer),
+        }
+
+    def _fetch_summary(self, package_name: str) -> Optional[Dict]:
+        """Fetch abbreviated metadata, keeping only tags, version names, deprecations and times"""
+        headers = {'Accept': ABBREVIATED_METADATA_ACCEPT}
+        with self.session.get(f"{self.registry_url}/{package_name}", headers=headers, stream=True) as response:
+            response.raise_for_status()
+            if 'json' not in response.headers.get('Content-Type', 'application/json'):
+                return None
+
+            stream = JSONStream(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+            summary = {'dist_tags': {}, 'versions': [], 'deprecated': [], 'modified': '', 'time': {}}
+            for key in stream.iter_object():
+                if key == 'dist-tags':
+                    summary['dist_tags'] = stream.read_value()
+                elif key == 'modified':
+                    summary['modified'] = stream.read_value()
+                elif key == 'time':
+                    summary['time'] = stream.read_value()
+                elif key == 'versions':
+                    # Version manifests are read one at a time and dropped
+                    for version in stream.iter_object():
+                        manifest = stream.read_value()
+                        summary['versions'].append(version)
+                        if isinstance(manifest, dict) and manifest.get('deprecated'):
+                            summary['deprecated'].append(version)
+                else:
+                    stream.skip_value()
+
+        summary['bytes'] = stream.bytes_read
+        summary['peak_bytes'] = stream.peak_buffer
+        return summary
+
+    def _fetch_full_package_info(self, package_name: str, version: Optional[str] = None) -> Dict:
+        """Build package info from the full packument, streaming past what we do not need"""
+        data, stream = self._read_document(
+            f"{self.registry_url}/{package_name}",
+            self._extract_packument,
+        )
+
+        selected_version = self._resolve_version(data['dist-tags'], list(data['versions']), version)
+        if selected_version and selected_version not in data['versions']:
+            return self._missing_version_info(package_name, selected_version)
+        version_data = data['versions'].get(selected_version, {})
+
+        return {
+            'name': package_name,
+            'version': selected_version,
+            'latest_version': data['dist-tags'].get('latest', ''),
+            'description': data.get('description', ''),
+            'author': self._extract_author(data.get('author', {})),
+            'last_updated': data['time'].get(selected_version, ''),
+            'license': version_data.get('license', ''),
+            'dependencies': version_data.get('dependencies', {}),
+            'is_deprecated': 'deprecated' in data or 'deprecated' in version_data,
+            'metadata_mode': 'full',
+            'metadata_bytes': stream.bytes_read,
+            'metadata_peak_bytes': stream.peak_buffer,
+        }
+
+    def _extract_packument(self, stream: JSONStream) -> Dict:
+        """Pull the fields we score on out of a full packument"""
+        data = {'dist-tags': {}, 'versions': {}, 'time': {}}
+        for key in stream.iter_object():
+            if key in ('dist-tags', 'time', 'description', 'author', 'deprecated'):
+                data[key] = stream.read_value()
+            elif key == 'versions':
+                for version in stream.iter_object():
+                    manifest = stream.read_value()
+                    if not isinstance(manifest, dict):
+                        continue
+                    data['versions'][version] = {
+                        field: manifest[field]
+                        for field in PACKUMENT_VERSION_FIELDS if field in manifest
+                    }
+            else:
+                # readme, maintainers, users, ...
+                stream.skip_value()
+        return data
+
+    def _read_document(self, url: str, extract):
+        """Stream a registry JSON document through extract"""
+        with self.session.get(url, stream=True) as response:
+            response.raise_for_status()
+            stream = JSONStream(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+            return extract(stream), stream
+
+    def parse_dependencies(self, file_content: Source) -> List[Dict]:
+        """Parse dependencies from package.json, package-lock.json or yarn.lock"""
         try:
-            package_json = json.loads(file_content)
-            dependencies = []
-
-            # Get dependencies
-            deps = package_json.get('dependencies', {})
-            dev_deps = package_json.get('devDependencies', {})
-
-            for name, version in {**deps, **dev_deps}.items():
-                dependencies.append({
-                    'name': name,
-                    'version': version,
-                    'type': 'dependency' if name in deps else 'devDependency'
-                })
-
-            return dependencies
-        except json.JSONDecodeError:
+            return list(self.iter_dependencies(file_content))
+        except ValueError:
             return []
 
+    def iter_dependencies(self, file_content: Source) -> Iterator[Dict]:
+        """Yield dependencies as the file is read, so large lockfiles are never held parsed
+
+        Lockfile entries carry the exact locked version.
+        """
+        first_char, chunks = sniff(file_content)
+        if first_char == '{':
+            return iter_npm_json(chunks)
+        if first_char:
+            return iter_yarn_lock(iter_lines(chunks))
+        return iter(())
+
+    def _resolve_version(self, dist_tags: Dict, versions: List[str], spec: Optional[str]) -> str:
+        """Resolve an exact version, dist-tag or range the way npm install would"""
+        latest = dist_tags.get('latest', '')
+        if not spec:
+            return latest
+        if spec in dist_tags:
+            return dist_tags[spec]
+        if is_exact(spec):
+            # Lockfile versions are used as-is, even when the registry no longer has them:
+            # scoring latest instead would report a version that is not installed
+            return spec
+        if latest and satisfies(latest, spec):
+            return latest
+        return max_satisfying(versions, spec) or latest
+
+    def _missing_version_info(self, package_name: str, version: str) -> Dict:
+        """An error result for a version the registry does not list (unpublished or never existed)"""
+        return {
+            'name': package_name,
+            'version': version,
+            'error': f"Version {version} of {package_name} is not in the npm registry",
+            'has_vulnerabilities': False,
+            'is_deprecated': False,
+        }
+
     def _extract_author(self, author_data) -> str:
         """Extract author name from author data"""
         if isinstance(author_data, str):
@@ -70,20 +228,53 @@ class NPMPackageScanner(BasePackageScanner):
             return author_data.get('name', 'Unknown')
         return 'Unknown'
 
-    def _check_vulnerabilities(self, package_name: str) -> bool:
-        """Check if package has known vulnerabilities"""
-        # TODO: Integrate with OSV database or npm audit
-        # For now, return False
-        return False
-
-    def _get_download_stats(self, package_name: str) -> Dict:
+    def _fetch_download_stats(self, package_name: str) -> Optional[Dict]:
         """Get download statistics"""
         try:
-            response = self.session.get(
-                f"https://api.npmjs.org/downloads/point/last-week/{package_name}"
-            )
+            response = self.session.get(f"{self.downloads_url}/{package_name}")
             if response.status_code == 200:
                 return response.json()
         except:
             pass
-        return {'downloads': 0}
\ No newline at end of file
+        return None
+
+    def _fetch_download_stats_batch(self, package_names: List[str]) -> Dict[str, Optional[Dict]]:
+        """Get download statistics using bulk queries for unscoped packages
+
+        The downloads API accepts comma-separated names, but not for scoped
+        packages, which still need one request each.
+        """
+        unscoped = [name for name in package_names if not name.startswith('@')]
+        scoped = [name for name in package_names if name.startswith('@')]
+        chunks = [
+            unscoped[i:i + self.downloads_batch_size]
+            for i in range(0, len(unscoped), self.downloads_batch_size)
+        ]
+
+        stats = {}
+        workers = min(getattr(settings, 'SCAN_CONCURRENCY', 8), len(chunks) + len(scoped)) or 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for chunk_stats in pool.map(self._fetch_download_stats_chunk, chunks):
+                stats.update(chunk_stats)
+            for name, result in zip(scoped, pool.map(self._fetch_download_stats, scoped)):
+                stats[name] = result
+        return stats
+
+    def _fetch_download_stats_chunk(self, package_names: List[str]) -> Dict[str, Optional[Dict]]:
+        """One bulk downloads query"""
+        if len(package_names) == 1:
+            return {package_names[0]: self._fetch_download_stats(package_names[0])}
+
+        try:
+            response = self.session.get(f"{self.downloads_url}/{','.join(package_names)}")
+            if response.status_code == 200:
+                data = response.json()
+                if isinstance(data, dict):
+                    # Unknown packages come back as null
+                    return {
+                        name: data.get(name) or {'downloads': 0, 'package': name}
+                        for name in package_names
+                    }
+        except (requests.RequestException, ValueError):
+            pass
+        return {name: None for name in package_names}
@@ -0,0 +1,249 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+
+from django.conf import settings
+
+from .metrics import registry as metrics
+
+
+# Statuses worth another attempt; 429 and 503 also mean "slow down"
+RETRY_STATUSES = (429, 502, 503, 504)
+THROTTLE_STATUSES = (429, 503)
+
+DEFAULT_RATE_LIMIT = {
+    'ENABLED': True,
+    # Token bucket per host: sustained requests per second and burst size
+    'RATE': 200.0,
+    'BURST': 200,
+    # AIMD concurrency window per host
+    'INITIAL_CONCURRENCY': 16,
+    'MIN_CONCURRENCY': 1,
+    'MAX_CONCURRENCY': 64,
+    'DECREASE_FACTOR': 0.5,
+    # Retries of throttled, failed or unreachable requests, with full jitter
+    'RETRIES': 3,
+    'BACKOFF_BASE': 0.5,
+    'BACKOFF_MAX': 30.0,
+    # Consecutive failures that open a host's circuit, and seconds it stays open
+    'BREAKER_THRESHOLD': 10,
+    'BREAKER_RESET': 30.0,
+    # Per-host overrides of any of the above, e.g. {'api.npmjs.org': {'RATE': 20}}
+    'HOSTS': {},
+}
+
+
+class RegistryUnavailable(requests.ConnectionError):
+    """A host's circuit is open, so the request was not sent"""
+
+
+class TokenBucket:
+    """Allows rate requests per second on average and up to burst at once"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AIMDLimiter:
+    """Concurrent requests allowed to one host, adapting to how it responds
+
+    Every successful response grows the window by 1/window (about one
+    slot per window's worth of responses); a throttling response halves
+    it, at most once per in-flight generation so one burst of 429s does
+    not collapse it. Retry-After pauses the host entirely.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, decrease_factor: float = 0.5,
+                 name: str = ''):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.decrease_factor = decrease_factor
+        self.name = name
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._generation = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> int:
+        """Wait for a slot; returns the generation to hand back to release"""
+        with self._condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return self._generation
+                self._condition.wait(timeout=wait if wait > 0 else None)
+
+    def release(self, generation: int, throttled: bool = False, retry_after: Optional[float] = None):
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                if generation == self._generation:
+                    self.limit = max(self.minimum, self.limit * self.decrease_factor)
+                    self._generation += 1
+                if retry_after:
+                    self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            metrics.set('package_scanner_registry_concurrency_limit', int(self.limit), host=self.name)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """Fails fast once a host keeps failing, then lets one probe through after reset seconds"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, threshold: int, reset: float, name: str = ''):
+        self.threshold = threshold
+        self.reset = reset
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+                metrics.inc('package_scanner_registry_circuit_opened_total', host=self.name)
+
+
+class HostLimiter:
+    """Rate, concurrency and circuit state of one registry host"""
+
+    def __init__(self, host: str, config: Dict):
+        self.host = host
+        self.config = config
+        self.bucket = TokenBucket(config['RATE'], config['BURST']) if config['RATE'] else None
+        self.window = AIMDLimiter(
+            config['INITIAL_CONCURRENCY'], config['MIN_CONCURRENCY'], config['MAX_CONCURRENCY'],
+            config['DECREASE_FACTOR'], name=host,
+        )
+        self.breaker = CircuitBreaker(config['BREAKER_THRESHOLD'], config['BREAKER_RESET'], name=host)
+
+    def acquire(self) -> int:
+        if not self.breaker.allow():
+            raise RegistryUnavailable(f'{self.host} is failing; not retrying for now (circuit open)')
+        if self.bucket is not None:
+            self.bucket.acquire()
+        return self.window.acquire()
+
+    def release(self, generation: int, status=None, retry_after: Optional[float] = None):
+        """Record the outcome of one attempt; status is None when no response came back"""
+        throttled = status in THROTTLE_STATUSES
+        self.window.release(generation, throttled=throttled, retry_after=retry_after)
+        if status is None or status >= 500:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds before retry number attempt: full jitter, but never sooner than Retry-After"""
+        ceiling = min(self.config['BACKOFF_MAX'], self.config['BACKOFF_BASE'] * 2 ** attempt)
+        return max(retry_after or 0.0, random.uniform(0, ceiling))
+
+    def stats(self) -> Dict:
+        return {
+            'concurrency_limit': int(self.window.limit),
+            'in_flight': self.window.in_flight,
+            'circuit': self.breaker.state,
+        }
+
+
+class RegistryRateLimiter:
+    """HostLimiters for every host, created on first use"""
+
+    def __init__(self, config: Dict):
+        self.config = dict(DEFAULT_RATE_LIMIT, **config)
+        self.retries = self.config['RETRIES']
+        self._hosts: Dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_host(self, host: str) -> HostLimiter:
+        limiter = self._hosts.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self._hosts.get(host)
+                if limiter is None:
+                    config = dict(self.config, **self.config['HOSTS'].get(host, {}))
+                    limiter = self._hosts[host] = HostLimiter(host, config)
+        return limiter
+
+    def stats(self) -> Dict:
+        return {host: limiter.stats() for host, limiter in list(self._hosts.items())}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given as seconds or an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RegistryRateLimiter]:
+    """Process-wide limiter from SCANNER_RATE_LIMIT, or None when disabled"""
+    global _rate_limiter
+    config = getattr(settings, 'SCANNER_RATE_LIMIT', {})
+    if not config.get('ENABLED', True):
+        return None
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = RegistryRateLimiter(config)
+    return _rate_limiter
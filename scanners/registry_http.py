@@ -0,0 +1,402 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from django.conf import settings
+
+from .metrics import record_request, registry as metrics
+from .ratelimit import RETRY_STATUSES, get_rate_limiter, parse_retry_after
+
+
+# Response headers kept with a cached body
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+# Request headers that select a different representation of the same URL
+VARY_HEADERS = ('Accept',)
+CACHED_CHUNK_SIZE = 64 * 1024
+
+
+class HTTPCacheStats:
+    """Process-wide counters for conditional registry requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {
+            'requests': 0,
+            'conditional_requests': 0,
+            'not_modified': 0,
+            'bytes_downloaded': 0,
+            'bytes_saved': 0,
+            'stored': 0,
+        }
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self._counts[name] += value
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            stats = dict(self._counts)
+        conditional = stats['conditional_requests']
+        stats['not_modified_ratio'] = stats['not_modified'] / conditional if conditional else 0.0
+        return stats
+
+
+class HTTPBodyCache:
+    """zlib-compressed response bodies and their validators, in SQLite
+
+    Every worker process pointing at the same file shares the cache.
+    """
+
+    # How many writes happen between size checks
+    PRUNE_INTERVAL = 100
+
+    def __init__(self, path: str, max_bytes: int = 512 * 1024 * 1024):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS http_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' etag TEXT,'
+            ' last_modified TEXT,'
+            ' headers TEXT NOT NULL,'
+            ' body BLOB NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' stored_at REAL NOT NULL)'
+        )
+        conn.execute('CREATE INDEX IF NOT EXISTS http_cache_stored_at ON http_cache (stored_at)')
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self._connection().execute(
+            'SELECT etag, last_modified, headers, body, size FROM http_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        etag, last_modified, headers, body, size = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'headers': json.loads(headers),
+            'body': body,
+            'size': size,
+        }
+
+    def set(self, key: str, etag: Optional[str], last_modified: Optional[str],
+            headers: Dict, body: bytes, size: int):
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO http_cache '
+                '(key, etag, last_modified, headers, body, size, stored_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (key, etag, last_modified, json.dumps(headers), body, size, time.time())
+            )
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_INTERVAL == 0
+        if prune:
+            self._prune()
+
+    def touch(self, key: str):
+        """Mark an entry as recently validated so pruning keeps it"""
+        conn = self._connection()
+        with conn:
+            conn.execute('UPDATE http_cache SET stored_at = ? WHERE key = ?', (time.time(), key))
+
+    def _prune(self):
+        """Drop the oldest entries once compressed bodies exceed max_bytes"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                'DELETE FROM http_cache WHERE key IN ('
+                ' SELECT key FROM ('
+                '  SELECT key, SUM(LENGTH(body)) OVER (ORDER BY stored_at DESC) AS total'
+                '  FROM http_cache)'
+                ' WHERE total > ?)',
+                (self.max_bytes,)
+            )
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM http_cache')
+
+
+class _TeeBody:
+    """Wraps a urllib3 response, compressing the body into the cache as it is read"""
+
+    def __init__(self, raw, on_complete):
+        self._raw = raw
+        self._on_complete = on_complete
+        self._compressor = zlib.compressobj()
+        self._compressed = []
+        self._size = 0
+        self._started = False
+        self._finished = False
+
+    def stream(self, amt=CACHED_CHUNK_SIZE, decode_content=True):
+        self._started = True
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._feed(chunk)
+            yield chunk
+        self._finish()
+
+    def close(self):
+        # Parsers stop at the end of the document; read what is left so it gets stored
+        if self._started and not self._finished:
+            for chunk in self._raw.stream(CACHED_CHUNK_SIZE, decode_content=True):
+                self._feed(chunk)
+            self._finish()
+        self._raw.close()
+
+    def _feed(self, chunk: bytes):
+        self._size += len(chunk)
+        self._compressed.append(self._compressor.compress(chunk))
+
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            self._compressed.append(self._compressor.flush())
+            self._on_complete(b''.join(self._compressed), self._size)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+
+class _CachedBody:
+    """Response body served from the cache, decompressed chunk by chunk"""
+
+    def __init__(self, compressed: bytes):
+        self._compressed = compressed
+
+    def stream(self, amt=CACHED_CHUNK_SIZE, decode_content=True):
+        decompressor = zlib.decompressobj()
+        for start in range(0, len(self._compressed), amt):
+            chunk = decompressor.decompress(self._compressed[start:start + amt])
+            if chunk:
+                yield chunk
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+    def close(self):
+        pass
+
+    def release_conn(self):
+        pass
+
+
+class RegistrySession(requests.Session):
+    """requests.Session for registry APIs with revalidation and a shared body cache
+
+    GET responses carrying an ETag or Last-Modified are stored compressed;
+    later requests for the same URL send If-None-Match/If-Modified-Since,
+    and a 304 is answered from the stored body. With a rate limiter, every
+    request also goes through its host's limits and retry policy (see
+    scanners.ratelimit).
+    """
+
+    def __init__(self, body_cache: Optional[HTTPBodyCache] = None, pool_connections: int = 10,
+                 pool_maxsize: int = 32, keep_alive: bool = True,
+                 stats: Optional[HTTPCacheStats] = None, rate_limiter=None):
+        super().__init__()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+        if not keep_alive:
+            self.headers['Connection'] = 'close'
+        self.body_cache = body_cache
+        self.cache_stats = stats or HTTPCacheStats()
+        self.rate_limiter = rate_limiter
+        self._local = threading.local()
+
+    def send(self, request, **kwargs):
+        if self.body_cache is None or request.method != 'GET':
+            return self._limited_send(request, **kwargs)
+
+        key = self._cache_key(request)
+        entry = self.body_cache.get(key)
+        if entry is not None:
+            if entry['etag']:
+                request.headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                request.headers['If-Modified-Since'] = entry['last_modified']
+
+        stream = kwargs.pop('stream', False)
+        response = self._limited_send(request, stream=True, **kwargs)
+        if response.history:
+            # Each redirect hop went through send() and was handled there
+            if not stream:
+                response.content
+            return response
+        self.cache_stats.add(requests=1, conditional_requests=1 if entry is not None else 0)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.body_cache.touch(key)
+            self.cache_stats.add(not_modified=1, bytes_saved=entry['size'])
+            response = self._cached_response(response, entry)
+        elif response.status_code == 200 and (
+            response.headers.get('ETag') or response.headers.get('Last-Modified')
+        ):
+            response.raw = _TeeBody(response.raw, self._storer(key, response))
+        else:
+            response.raw = _TeeBody(response.raw, self._counter())
+
+        if not stream:
+            response.content
+        return response
+
+    def _limited_send(self, request, **kwargs):
+        """Send within the host's rate and concurrency limits, retrying throttled or failed attempts
+
+        A slot is held until the response headers arrive. Redirect hops
+        reuse the slot of the request that led to them.
+        """
+        if self.rate_limiter is None or getattr(self._local, 'holding_slot', False):
+            return self._timed_send(request, **kwargs)
+
+        host = urlparse(request.url).hostname or ''
+        limiter = self.rate_limiter.for_host(host)
+        attempt = 0
+        while True:
+            generation = limiter.acquire()
+            self._local.holding_slot = True
+            try:
+                response = self._timed_send(request, **kwargs)
+            except requests.RequestException:
+                limiter.release(generation)
+                if attempt >= self.rate_limiter.retries:
+                    raise
+                cause, retry_after = 'error', None
+            else:
+                status = response.status_code
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                limiter.release(generation, status, retry_after if status in RETRY_STATUSES else None)
+                if status not in RETRY_STATUSES or attempt >= self.rate_limiter.retries:
+                    return response
+                response.close()
+                cause = str(status)
+            finally:
+                self._local.holding_slot = False
+
+            metrics.inc('package_scanner_registry_retries_total', host=host, cause=cause)
+            time.sleep(limiter.backoff(attempt, retry_after))
+            attempt += 1
+
+    def _timed_send(self, request, **kwargs):
+        """Send, recording the request's latency for its registry host"""
+        host = urlparse(request.url).hostname or ''
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+        except requests.RequestException:
+            record_request(host, time.perf_counter() - started, 'error')
+            raise
+        # Redirect hops were sent, and recorded, by their own send() calls;
+        # only the first response of a redirect chain is left to record here
+        first = response.history[0] if response.history else response
+        record_request(urlparse(first.url).hostname or host, first.elapsed.total_seconds(),
+                       first.status_code)
+        return response
+
+    def _cache_key(self, request) -> str:
+        vary = '|'.join(request.headers.get(name, '') for name in VARY_HEADERS)
+        return f"{request.method} {request.url} {vary}"
+
+    def _storer(self, key, response):
+        headers = {name: response.headers[name] for name in STORED_HEADERS if name in response.headers}
+
+        def store(body: bytes, size: int):
+            self.cache_stats.add(bytes_downloaded=size, stored=1)
+            self.body_cache.set(
+                key, response.headers.get('ETag'), response.headers.get('Last-Modified'),
+                headers, body, size,
+            )
+        return store
+
+    def _counter(self):
+        def count(body: bytes, size: int):
+            self.cache_stats.add(bytes_downloaded=size)
+        return count
+
+    def _cached_response(self, not_modified, entry: Dict) -> requests.Response:
+        """A 200 response for a revalidated entry"""
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = 'OK'
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.raw = _CachedBody(entry['body'])
+        response.url = not_modified.url
+        response.request = not_modified.request
+        response.elapsed = not_modified.elapsed
+        response.connection = not_modified.connection
+        response.history = not_modified.history
+        response.from_cache = True
+        return response
+
+    def stats(self) -> Dict:
+        return self.cache_stats.snapshot()
+
+
+_http_cache_stats = HTTPCacheStats()
+_body_cache = None
+_body_cache_lock = threading.Lock()
+
+
+def get_http_body_cache() -> Optional[HTTPBodyCache]:
+    """Process-wide body cache from SCANNER_HTTP, or None when disabled"""
+    global _body_cache
+    config = getattr(settings, 'SCANNER_HTTP', {})
+    if not config.get('CACHE', True):
+        return None
+    if _body_cache is None:
+        with _body_cache_lock:
+            if _body_cache is None:
+                _body_cache = HTTPBodyCache(
+                    config.get('CACHE_PATH', 'scanner_http_cache.sqlite3'),
+                    max_bytes=config.get('CACHE_MAX_BYTES', 512 * 1024 * 1024),
+                )
+    return _body_cache
+
+
+def build_registry_session() -> RegistrySession:
+    """Registry session configured from the SCANNER_HTTP setting"""
+    config = getattr(settings, 'SCANNER_HTTP', {})
+    return RegistrySession(
+        body_cache=get_http_body_cache(),
+        pool_connections=config.get('POOL_CONNECTIONS', 10),
+        pool_maxsize=config.get('POOL_MAXSIZE', 32),
+        keep_alive=config.get('KEEP_ALIVE', True),
+        stats=_http_cache_stats,
+        rate_limiter=get_rate_limiter(),
+    )
+
+
+def get_http_stats() -> Dict:
+    """Counters shared by every registry session in this process"""
+    return _http_cache_stats.snapshot()
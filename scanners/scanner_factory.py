@@ -1,5 +1,5 @@
 from .npm_scanner import NPMPackageScanner
-from .pypi_scanner import PyPIPackageScanner
+# from .pypi_scanner import PyPIPackageScanner
 
 
 class ScannerFactory:
@@ -10,7 +10,7 @@ class ScannerFactory:
         """Get scanner instance for the given ecosystem"""
         scanners = {
             'npm': NPMPackageScanner,
-            'pypi': PyPIPackageScanner,
+            # 'pypi': PyPIPackageScanner,
             # 'maven': MavenPackageScanner,
             # 'go': GoPackageScanner,
         }
@@ -21,20 +21,30 @@ class ScannerFactory:
         else:
             raise ValueError(f"Unsupported ecosystem: {ecosystem}")
 
+    # Manifest and lockfile names that identify their ecosystem on their own
+    MANIFEST_FILENAMES = {
+        'package.json': 'npm',
+        'package-lock.json': 'npm',
+        'npm-shrinkwrap.json': 'npm',
+        'yarn.lock': 'npm',
+        'requirements.txt': 'pypi',
+        'pom.xml': 'maven',
+        'go.mod': 'go',
+    }
+
     @staticmethod
     def detect_ecosystem(filename: str) -> str:
         """Detect ecosystem from filename"""
         filename_lower = filename.lower()
 
-        if filename_lower == 'package.json':
-            return 'npm'
-        elif filename_lower == 'requirements.txt':
-            return 'pypi'
-        elif filename_lower == 'pom.xml':
-            return 'maven'
-        elif filename_lower == 'go.mod':
-            return 'go'
+        if filename_lower in ScannerFactory.MANIFEST_FILENAMES:
+            return ScannerFactory.MANIFEST_FILENAMES[filename_lower]
         elif filename_lower.endswith('.json'):
             return 'npm'  # Default assumption
         else:
-            return 'unknown'
\ No newline at end of file
+            return 'unknown'
+
+    @staticmethod
+    def is_manifest(filename: str) -> bool:
+        """Whether a file is a known manifest, without the .json fallback of detect_ecosystem"""
+        return filename.lower() in ScannerFactory.MANIFEST_FILENAMES
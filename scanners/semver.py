@@ -0,0 +1,234 @@
+import re
+from functools import lru_cache
+from typing import Iterable, List, Optional, Tuple
+
+
+SEMVER_RE = re.compile(
+    r'^\s*v?=?\s*(\d+)\.(\d+)\.(\d+)'
+    r'(?:-([0-9A-Za-z.-]+))?'
+    r'(?:\+[0-9A-Za-z.-]+)?\s*$'
+)
+PARTIAL_RE = re.compile(
+    r'^v?=?\s*([0-9xX*]+)(?:\.([0-9xX*]+))?(?:\.([0-9xX*]+))?'
+    r'(?:-([0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$'
+)
+COMPARATOR_RE = re.compile(r'^(<=|>=|<|>|=|\^|~>|~)?\s*(.*)$')
+
+# (major, minor, patch, prerelease identifiers)
+Version = Tuple[int, int, int, Tuple]
+# (operator, version)
+Comparator = Tuple[str, Version]
+
+
+def parse_version(version: str) -> Optional[Version]:
+    """Parse an exact semver string, or None if it is not one"""
+    match = SEMVER_RE.match(version or '')
+    if not match:
+        return None
+    major, minor, patch, prerelease = match.groups()
+    return int(major), int(minor), int(patch), _parse_prerelease(prerelease)
+
+
+def _parse_prerelease(prerelease: Optional[str]) -> Tuple:
+    if not prerelease:
+        return ()
+    return tuple(
+        (0, int(part), '') if part.isdigit() else (1, 0, part)
+        for part in prerelease.split('.')
+    )
+
+
+def version_key(version: Version) -> Tuple:
+    """Sort key; a release sorts after its prereleases"""
+    major, minor, patch, prerelease = version
+    return major, minor, patch, (1,) if not prerelease else (0, prerelease)
+
+
+def is_exact(spec: Optional[str]) -> bool:
+    """Whether a dependency spec names one exact version"""
+    return parse_version(spec or '') is not None
+
+
+@lru_cache(maxsize=4096)
+def parse_range(spec: str) -> Optional[List[List[Comparator]]]:
+    """Parse an npm range into OR-ed sets of AND-ed comparators
+
+    Returns None for specs that are not version ranges (tags, URLs, git
+    references, aliases).
+    """
+    spec = (spec or '').strip()
+    if spec in ('', '*', 'x', 'X', 'latest'):
+        return [[('>=', (0, 0, 0, ()))]]
+
+    comparator_sets = []
+    for part in spec.split('||'):
+        part = part.strip()
+        if not part:
+            comparator_sets.append([('>=', (0, 0, 0, ()))])
+            continue
+
+        hyphen = re.match(r'^(\S+)\s+-\s+(\S+)$', part)
+        if hyphen:
+            comparators = _hyphen_range(*hyphen.groups())
+        else:
+            comparators = []
+            # Allow "> 1.2.3" as well as ">1.2.3"
+            tokens = re.sub(r'(<=|>=|<|>|=|\^|~>|~)\s+', r'\1', part).split()
+            for token in tokens:
+                parsed = _comparators(token)
+                if parsed is None:
+                    return None
+                comparators.extend(parsed)
+        if comparators is None:
+            return None
+        comparator_sets.append(comparators)
+
+    return comparator_sets
+
+
+def _partial(text: str):
+    """Parse a possibly partial version into (major, minor, patch, pre) with None for wildcards"""
+    match = PARTIAL_RE.match(text)
+    if not match:
+        return None
+    parts = []
+    for value in match.groups()[:3]:
+        parts.append(None if value is None or value in ('x', 'X', '*') else int(value))
+    # "1.x.3" is treated as "1.x"
+    for i in range(1, 3):
+        if parts[i - 1] is None:
+            parts[i] = None
+    return parts[0], parts[1], parts[2], _parse_prerelease(match.group(4))
+
+
+def _comparators(token: str) -> Optional[List[Comparator]]:
+    operator, text = COMPARATOR_RE.match(token).groups()
+    partial = _partial(text)
+    if partial is None:
+        return None
+    major, minor, patch, pre = partial
+
+    if operator in ('^',):
+        return _caret(major, minor, patch, pre)
+    if operator in ('~', '~>'):
+        return _tilde(major, minor, patch, pre)
+
+    if major is None:
+        if operator in ('<', '>'):
+            # "<*" and ">*" match nothing
+            return [('<', (0, 0, 0, ()))]
+        return [('>=', (0, 0, 0, ()))]
+
+    if operator in (None, '='):
+        if patch is not None:
+            return [('=', (major, minor, patch, pre))]
+        return _x_range(major, minor)
+
+    low = (major, minor or 0, patch or 0, pre)
+    if patch is not None:
+        return [(operator, low)]
+
+    # Partial versions with an operator, e.g. ">1.2" means ">=1.3.0"
+    upper = (major + 1, 0, 0, ()) if minor is None else (major, minor + 1, 0, ())
+    if operator == '>':
+        return [('>=', upper)]
+    if operator == '>=':
+        return [('>=', low)]
+    if operator == '<':
+        return [('<', low)]
+    return [('<', upper)]  # "<="
+
+
+def _x_range(major: int, minor: Optional[int]) -> List[Comparator]:
+    if minor is None:
+        return [('>=', (major, 0, 0, ())), ('<', (major + 1, 0, 0, ()))]
+    return [('>=', (major, minor, 0, ())), ('<', (major, minor + 1, 0, ()))]
+
+
+def _caret(major, minor, patch, pre) -> List[Comparator]:
+    if major is None:
+        return [('>=', (0, 0, 0, ()))]
+    if minor is None:
+        return _x_range(major, None)
+    low = (major, minor, patch or 0, pre)
+    if major > 0:
+        high = (major + 1, 0, 0, ())
+    elif patch is None or minor > 0:
+        high = (0, minor + 1, 0, ())
+    else:
+        high = (0, 0, patch + 1, ())
+    return [('>=', low), ('<', high)]
+
+
+def _tilde(major, minor, patch, pre) -> List[Comparator]:
+    if major is None:
+        return [('>=', (0, 0, 0, ()))]
+    if minor is None:
+        return _x_range(major, None)
+    return [('>=', (major, minor, patch or 0, pre)), ('<', (major, minor + 1, 0, ()))]
+
+
+def _hyphen_range(low_text: str, high_text: str) -> Optional[List[Comparator]]:
+    low, high = _partial(low_text), _partial(high_text)
+    if low is None or high is None:
+        return None
+    comparators = [('>=', (low[0] or 0, low[1] or 0, low[2] or 0, low[3]))]
+    if high[0] is None:
+        return comparators
+    if high[2] is not None:
+        comparators.append(('<=', (high[0], high[1], high[2], high[3])))
+    else:
+        comparators.extend(_x_range(high[0], high[1])[1:])
+    return comparators
+
+
+_OPERATORS = {
+    '=': lambda a, b: a == b,
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _satisfies_set(version: Version, comparators: List[Comparator]) -> bool:
+    key = version_key(version)
+    for operator, bound in comparators:
+        if not _OPERATORS[operator](key, version_key(bound)):
+            return False
+
+    if version[3]:
+        # Prereleases only match when a comparator opts into the same release
+        return any(
+            bound[3] and bound[:3] == version[:3]
+            for _, bound in comparators
+        )
+    return True
+
+
+def satisfies(version: str, spec: str) -> bool:
+    """Whether an exact version matches an npm range"""
+    parsed = parse_version(version)
+    comparator_sets = parse_range(spec)
+    if parsed is None or comparator_sets is None:
+        return False
+    return any(_satisfies_set(parsed, comparators) for comparators in comparator_sets)
+
+
+def max_satisfying(versions: Iterable[str], spec: str) -> Optional[str]:
+    """Highest version in versions that matches spec"""
+    comparator_sets = parse_range(spec)
+    if comparator_sets is None:
+        return None
+
+    best, best_key = None, None
+    for version in versions:
+        parsed = parse_version(version)
+        if parsed is None:
+            continue
+        key = version_key(parsed)
+        if best_key is not None and key <= best_key:
+            continue
+        if any(_satisfies_set(parsed, comparators) for comparators in comparator_sets):
+            best, best_key = version, key
+    return best
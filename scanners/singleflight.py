@@ -0,0 +1,123 @@
+import copy
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+
+class _Call:
+    """One in-flight call and what its followers are waiting for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers share its result
+
+    The first caller for a key runs it; callers arriving while it is in
+    flight wait and get a copy of its value, or its exception.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """fn() for key, or the result of the call already running; returns (value, shared)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            # Callers are free to mutate what they get back
+            return copy.deepcopy(call.value), True
+
+        try:
+            value = fn()
+        except BaseException as exc:
+            self._finish(key, call, error=exc)
+            raise
+        self._finish(key, call, value=value)
+        return value, False
+
+    def _finish(self, key, call: _Call, value=None, error=None):
+        with self._lock:
+            del self._calls[key]
+        # Nobody can join once the call is gone, so waiters is final. The
+        # snapshot is taken before the leader's caller gets to mutate value.
+        if call.waiters:
+            call.value = copy.deepcopy(value)
+            call.error = error
+        call.done.set()
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class LeaseTable:
+    """Short-lived named leases in a SQLite file, shared by the processes of one host
+
+    A lease says "this process is loading that key"; other processes wait
+    for it instead of loading the key too. Leases expire after ttl seconds
+    so a crashed holder never blocks anyone for long.
+    """
+
+    def __init__(self, path: str, ttl: float = 30.0, poll_interval: float = 0.05):
+        self.path = str(path)
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.owner = f'{os.getpid()}-{uuid.uuid4().hex[:12]}'
+        self._local = threading.local()
+
+        conn = self._connection()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS metadata_leases ('
+            ' key TEXT PRIMARY KEY,'
+            ' owner TEXT NOT NULL,'
+            ' expires_at REAL NOT NULL)'
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key: str) -> bool:
+        """Take the lease on key unless another live one holds it"""
+        conn = self._connection()
+        now = time.time()
+        with conn:
+            conn.execute('DELETE FROM metadata_leases WHERE key = ? AND expires_at < ?', (key, now))
+            inserted = conn.execute(
+                'INSERT OR IGNORE INTO metadata_leases (key, owner, expires_at) VALUES (?, ?, ?)',
+                (key, self.owner, now + self.ttl)
+            ).rowcount
+        return inserted == 1
+
+    def release(self, key: str):
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM metadata_leases WHERE key = ? AND owner = ?', (key, self.owner))
+
+    def __len__(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM metadata_leases WHERE expires_at >= ?', (time.time(),)
+        ).fetchone()[0]
@@ -1,3 +1,677 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.test import SimpleTestCase, override_settings
+
+from . import typosquat_index, vulnerability_index
+from .jsonstream import JSONStream
+from .lockfiles import iter_lines
+from .npm_scanner import NPMPackageScanner
+from .semver import max_satisfying, parse_range, parse_version, satisfies
+from .typosquat_index import TyposquatIndex, build_bundled_index, edit_distance, get_typosquat_index
+from .vulnerability_index import VulnerabilityIndex, get_vulnerability_index
+
+
+def chunked(text, size):
+    """text split into size-character pieces"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class SemverTests(SimpleTestCase):
+    def test_parse_version(self):
+        cases = [
+            ('1.2.3', (1, 2, 3, ())),
+            ('v1.2.3', (1, 2, 3, ())),
+            ('=1.2.3', (1, 2, 3, ())),
+            ('1.2.3+build.5', (1, 2, 3, ())),
+            ('1.2.3-beta.2', (1, 2, 3, ((1, 0, 'beta'), (0, 2, '')))),
+            ('1.2', None),
+            ('^1.2.3', None),
+            ('latest', None),
+            ('', None),
+        ]
+        for version, expected in cases:
+            with self.subTest(version=version):
+                self.assertEqual(parse_version(version), expected)
+
+    def test_satisfies(self):
+        cases = [
+            # Exact and primitive comparators
+            ('1.2.3', '1.2.3', True),
+            ('1.2.4', '1.2.3', False),
+            ('1.2.3', '>1.2.2', True),
+            ('1.2.3', '> 1.2.3', False),
+            ('1.2.3', '>=1.2.3 <2.0.0', True),
+            ('2.0.0', '>=1.2.3 <2.0.0', False),
+            ('1.3.0', '>1.2', True),
+            ('1.2.9', '>1.2', False),
+            ('1.2.9', '<=1.2', True),
+            ('1.3.0', '<=1.2', False),
+            # Caret
+            ('1.9.9', '^1.2.3', True),
+            ('2.0.0', '^1.2.3', False),
+            ('1.2.2', '^1.2.3', False),
+            ('0.2.9', '^0.2.3', True),
+            ('0.3.0', '^0.2.3', False),
+            ('0.0.3', '^0.0.3', True),
+            ('0.0.4', '^0.0.3', False),
+            ('0.0.9', '^0.0', True),
+            ('0.1.0', '^0.0', False),
+            ('1.9.0', '^1', True),
+            # Tilde
+            ('1.2.9', '~1.2.3', True),
+            ('1.3.0', '~1.2.3', False),
+            ('1.9.0', '~1', True),
+            ('1.2.9', '~>1.2', True),
+            # X-ranges
+            ('1.9.9', '1.x', True),
+            ('2.0.0', '1.x', False),
+            ('1.2.9', '1.2.*', True),
+            ('1.3.0', '1.2.X', False),
+            ('3.1.4', '*', True),
+            ('3.1.4', '', True),
+            ('3.1.4', 'latest', True),
+            # Hyphen ranges
+            ('1.2.3', '1.2.3 - 2.3.4', True),
+            ('2.3.4', '1.2.3 - 2.3.4', True),
+            ('2.3.5', '1.2.3 - 2.3.4', False),
+            ('2.3.9', '1.2 - 2.3', True),
+            ('2.4.0', '1.2 - 2.3', False),
+            ('1.1.9', '1.2 - 2.3', False),
+            # Unions
+            ('1.0.0', '^1.0.0 || ^3.0.0', True),
+            ('2.0.0', '^1.0.0 || ^3.0.0', False),
+            ('3.5.0', '^1.0.0 || ^3.0.0', True),
+            # Not ranges at all
+            ('1.0.0', 'npm:other@^1.0.0', False),
+            ('1.0.0', 'github:user/repo', False),
+            ('not-a-version', '*', False),
+        ]
+        for version, spec, expected in cases:
+            with self.subTest(version=version, spec=spec):
+                self.assertIs(satisfies(version, spec), expected)
+
+    def test_prereleases(self):
+        cases = [
+            # A prerelease only matches a range naming a prerelease of the same version
+            ('1.2.3-beta.2', '^1.2.3-beta.1', True),
+            ('1.2.3-beta.1', '^1.2.3-beta.2', False),
+            ('1.2.4-beta.1', '^1.2.3-beta.1', False),
+            ('1.2.3-beta.1', '^1.2.0', False),
+            ('1.2.3-beta.1', '*', False),
+            ('1.2.3-beta.1', '1.2.3-beta.1', True),
+            ('1.2.3', '^1.2.3-beta.1', True),
+            # Numeric identifiers compare numerically, and before alphanumeric ones
+            ('1.0.0-rc.10', '>1.0.0-rc.9', True),
+            ('1.0.0-alpha', '>1.0.0-1', True),
+            ('1.0.0-alpha.beta', '>1.0.0-alpha.1', True),
+            ('1.0.0-beta', '<1.0.0', False),
+            ('1.0.0-beta', '>=1.0.0-alpha <1.0.0', True),
+        ]
+        for version, spec, expected in cases:
+            with self.subTest(version=version, spec=spec):
+                self.assertIs(satisfies(version, spec), expected)
+
+    def test_max_satisfying(self):
+        versions = ['1.0.0', '1.2.0', '1.10.0', '2.0.0-beta.1', '2.0.0', '2.1.0', '3.0.0-rc.1', 'junk']
+        cases = [
+            ('^1.0.0', '1.10.0'),
+            ('~1.2.0', '1.2.0'),
+            ('1.x || >=2.0.0 <2.1.0', '2.0.0'),
+            ('>=2.0.0-beta.0 <2.0.0', '2.0.0-beta.1'),
+            ('*', '2.1.0'),
+            ('^3.0.0', None),
+            ('^3.0.0-rc.0', '3.0.0-rc.1'),
+            ('^4.0.0', None),
+            ('file:../local', None),
+        ]
+        for spec, expected in cases:
+            with self.subTest(spec=spec):
+                self.assertEqual(max_satisfying(versions, spec), expected)
+
+    def test_parse_range_rejects_non_ranges(self):
+        for spec in ('npm:react@^18', 'git+https://example.com/repo.git', 'next', '^1.2.3 || beta'):
+            with self.subTest(spec=spec):
+                self.assertIsNone(parse_range(spec))
+
+
+class JSONStreamTests(SimpleTestCase):
+    DOCUMENT = {
+        'name': 'pkg',
+        'escaped': 'quote " backslash \\ tab \t unicode é ☃ \U0001f600',
+        'numbers': [0, -12, 3.25, 1e-7, 12345678901234567890, -0.5e+10],
+        'flags': [True, False, None],
+        'nested': {'a': {'b': [[], {}, [1, [2, [3]]]]}, 'empty': ''},
+        'readme': 'x' * 500 + '"}]{[' + 'y' * 500,
+    }
+
+    def read_all(self, stream):
+        """The document, walked member by member"""
+        result = {}
+        for key in stream.iter_object():
+            if key == 'numbers':
+                result[key] = [stream.read_value() for _ in stream.iter_array()]
+            else:
+                result[key] = stream.read_value()
+        return result
+
+    def test_read_across_chunk_boundaries(self):
+        text = json.dumps(self.DOCUMENT, indent=1)
+        for size in (1, 2, 3, 7, 64, len(text)):
+            with self.subTest(size=size):
+                self.assertEqual(self.read_all(JSONStream(chunked(text, size))), self.DOCUMENT)
+
+    def test_utf8_bytes_split_inside_characters(self):
+        data = json.dumps(self.DOCUMENT, ensure_ascii=False).encode('utf-8')
+        for size in (1, 3, 5):
+            with self.subTest(size=size):
+                stream = JSONStream(data[i:i + size] for i in range(0, len(data), size))
+                self.assertEqual(self.read_all(stream), self.DOCUMENT)
+                self.assertEqual(stream.bytes_read, len(data))
+
+    def test_numbers_cut_by_a_chunk_boundary(self):
+        cases = [
+            (['[12', '34]'], [1234]),
+            (['[1.', '5e', '3]'], [1500.0]),
+            (['[-', '7, 8', '9]'], [-7, 89]),
+            (['[1', '2', '3'], None),
+        ]
+        for chunks, expected in cases:
+            with self.subTest(chunks=chunks):
+                stream = JSONStream(chunks)
+                if expected is None:
+                    with self.assertRaises(ValueError):
+                        [stream.read_value() for _ in stream.iter_array()]
+                else:
+                    self.assertEqual([stream.read_value() for _ in stream.iter_array()], expected)
+
+    def test_skip_value_across_chunk_boundaries(self):
+        text = json.dumps(self.DOCUMENT)
+        for size in (1, 2, 5, 13):
+            with self.subTest(size=size):
+                stream = JSONStream(chunked(text, size))
+                kept = {}
+                for key in stream.iter_object():
+                    if key in ('name', 'flags'):
+                        kept[key] = stream.read_value()
+                    else:
+                        stream.skip_value()
+                self.assertEqual(kept, {'name': 'pkg', 'flags': [True, False, None]})
+
+    def test_skipped_values_are_not_buffered(self):
+        text = json.dumps({'readme': 'z' * 100000, 'name': 'pkg'})
+        stream = JSONStream(chunked(text, 1024))
+        for key in stream.iter_object():
+            if key == 'readme':
+                stream.skip_value()
+            else:
+                self.assertEqual(stream.read_value(), 'pkg')
+        self.assertLess(stream.peak_buffer, 4096)
+
+    def test_empty_containers(self):
+        stream = JSONStream(['{"a":', ' {}, "b": [', ']}'])
+        members = {}
+        for key in stream.iter_object():
+            members[key] = list(stream.iter_object() if key == 'a' else stream.iter_array())
+        self.assertEqual(members, {'a': [], 'b': []})
+
+    def test_malformed_input(self):
+        cases = [
+            ['{"a": 1'],
+            ['{"a" 1}'],
+            ['{"a": 1 "b": 2}'],
+            ['{1: 2}'],
+            ['{"a": "unterminated'],
+            ['[1, 2'],
+        ]
+        for chunks in cases:
+            with self.subTest(chunks=chunks):
+                stream = JSONStream(chunks)
+                with self.assertRaises(ValueError):
+                    for key in stream.iter_object() if chunks[0][0] == '{' else stream.iter_array():
+                        stream.skip_value()
+
+
+PACKAGE_JSON = {
+    'name': 'app',
+    'dependencies': {'react': '^18.2.0', 'lodash': '4.17.21'},
+    'devDependencies': {'jest': '^29.0.0', 'lodash': '^4.0.0'},
+}
+
+PACKAGE_LOCK_V1 = {
+    'name': 'app',
+    'lockfileVersion': 1,
+    'dependencies': {
+        'react': {
+            'version': '18.2.0',
+            'dependencies': {'loose-envify': {'version': '1.4.0'}},
+        },
+        'loose-envify': {'version': '1.4.0'},
+        'jest': {'version': '29.7.0', 'dev': True},
+        'string-width-cjs': {'version': 'npm:string-width@4.2.3'},
+        'local': {'version': 'file:../local'},
+        'forked': {'version': 'github:user/forked#abc123'},
+    },
+}
+
+PACKAGE_LOCK_V2 = {
+    'name': 'app',
+    'lockfileVersion': 2,
+    'packages': {
+        '': {'name': 'app', 'dependencies': {'react': '^18.2.0'}},
+        'node_modules/react': {'version': '18.2.0'},
+        'node_modules/jest': {'version': '29.7.0', 'dev': True},
+        'node_modules/string-width-cjs': {'name': 'string-width', 'version': '4.2.3'},
+        'node_modules/a': {'version': '1.0.0'},
+        'node_modules/b/node_modules/a': {'version': '2.0.0'},
+        'node_modules/c/node_modules/a': {'version': '2.0.0'},
+        'node_modules/@scope/pkg': {'version': '3.1.0'},
+        'node_modules/linked': {'resolved': 'packages/linked', 'link': True},
+        'packages/linked': {'name': 'linked', 'version': '0.1.0'},
+    },
+    # v2 lockfiles keep the v1 tree too; it must not be read twice
+    'dependencies': {
+        'react': {'version': '18.2.0'},
+        'stale-v1-only': {'version': '9.9.9'},
+    },
+}
+
+PACKAGE_LOCK_V2_EXPECTED = [
+    ('react', '18.2.0', 'dependency'),
+    ('jest', '29.7.0', 'devDependency'),
+    ('string-width', '4.2.3', 'dependency'),
+    ('a', '1.0.0', 'dependency'),
+    ('a', '2.0.0', 'dependency'),
+    ('@scope/pkg', '3.1.0', 'dependency'),
+]
+
+YARN_CLASSIC = """\
+# THIS IS AN AUTOGENERATED FILE. DO NOT EDIT THIS FILE DIRECTLY.
+# yarn lockfile v1
+
+
+"@babel/core@^7.0.0", "@babel/core@^7.12.3":
+  version "7.23.0"
+  resolved "https://registry.yarnpkg.com/@babel/core/-/core-7.23.0.tgz"
+  dependencies:
+    debug "^4.1.0"
+
+debug@^4.1.0:
+  version "4.3.4"
+
+debug@^3.2.7:
+  version "3.2.7"
+
+debug@~4.3.1:
+  version "4.3.4"
+
+string-width-cjs@npm:string-width@^4.2.0:
+  version "4.2.3"
+
+forked@github:user/forked:
+  version "1.0.0"
+"""
+
+YARN_BERRY = """\
+# This file is generated by running "yarn install" inside your project.
+
+__metadata:
+  version: 6
+  cacheKey: 8
+
+"@babel/core@npm:^7.0.0, @babel/core@npm:^7.12.3":
+  version: 7.23.0
+  resolution: "@babel/core@npm:7.23.0"
+  dependencies:
+    debug: ^4.1.0
+
+"app@workspace:.":
+  version: 0.0.0-use.local
+  resolution: "app@workspace:."
+
+"debug@npm:^4.1.0, debug@npm:~4.3.1":
+  version: 4.3.4
+  resolution: "debug@npm:4.3.4"
+
+"string-width-cjs@npm:string-width@^4.2.0":
+  version: 4.2.3
+  resolution: "string-width@npm:4.2.3"
+
+"patched@patch:patched@npm%3A1.0.0#./patches/patched.patch::locator=app%40workspace%3A.":
+  version: 1.0.0
+"""
+
+YARN_EXPECTED = [
+    ('@babel/core', '7.23.0'),
+    ('debug', '4.3.4'),
+    ('string-width', '4.2.3'),
+]
+
+
+@override_settings(SCANNER_HTTP={'CACHE': False})
+class LockfileParserTests(SimpleTestCase):
+    def setUp(self):
+        self.scanner = NPMPackageScanner()
+
+    def records(self, source):
+        return [(dep['name'], dep['version'], dep['type']) for dep in self.scanner.iter_dependencies(source)]
+
+    def assertParsesInChunks(self, text, expected, sizes=(1, 3, 17, 4096)):
+        """Parse text whole, as bytes and in chunks of each size, always getting expected"""
+        sources = [text, text.encode('utf-8')]
+        sources += [chunked(text, size) for size in sizes]
+        sources += [chunked(text.encode('utf-8'), size) for size in sizes]
+        for source in sources:
+            with self.subTest(source=type(source).__name__, chunks=len(source)):
+                self.assertEqual(self.records(source), expected)
+
+    def test_package_json(self):
+        self.assertParsesInChunks(json.dumps(PACKAGE_JSON), [
+            ('react', '^18.2.0', 'dependency'),
+            ('lodash', '^4.0.0', 'dependency'),
+            ('jest', '^29.0.0', 'devDependency'),
+        ])
+
+    def test_package_lock_v1(self):
+        self.assertParsesInChunks(json.dumps(PACKAGE_LOCK_V1, indent=2), [
+            ('react', '18.2.0', 'dependency'),
+            ('loose-envify', '1.4.0', 'dependency'),
+            ('jest', '29.7.0', 'devDependency'),
+            ('string-width', '4.2.3', 'dependency'),
+        ])
+
+    def test_package_lock_v2(self):
+        self.assertParsesInChunks(json.dumps(PACKAGE_LOCK_V2, indent=2), PACKAGE_LOCK_V2_EXPECTED)
+
+    def test_package_lock_v3(self):
+        lock = {key: value for key, value in PACKAGE_LOCK_V2.items() if key != 'dependencies'}
+        lock['lockfileVersion'] = 3
+        self.assertParsesInChunks(json.dumps(lock), PACKAGE_LOCK_V2_EXPECTED)
+
+    def test_lockfile_entries_are_marked_locked(self):
+        deps = list(self.scanner.iter_dependencies(json.dumps(PACKAGE_LOCK_V2)))
+        self.assertTrue(all(dep['locked'] for dep in deps))
+        deps = list(self.scanner.iter_dependencies(json.dumps(PACKAGE_JSON)))
+        self.assertFalse(any(dep.get('locked') for dep in deps))
+
+    def test_yarn_classic(self):
+        expected = [(name, version, 'dependency') for name, version in YARN_EXPECTED]
+        expected.insert(2, ('debug', '3.2.7', 'dependency'))
+        self.assertParsesInChunks(YARN_CLASSIC, expected)
+
+    def test_yarn_berry(self):
+        expected = [(name, version, 'dependency') for name, version in YARN_EXPECTED]
+        self.assertParsesInChunks(YARN_BERRY, expected)
+
+    def test_yarn_crlf_and_bom(self):
+        text = '\ufeff' + YARN_CLASSIC.replace('\n', '\r\n')
+        self.assertEqual(self.records(chunked(text, 5))[:2], [
+            ('@babel/core', '7.23.0', 'dependency'),
+            ('debug', '4.3.4', 'dependency'),
+        ])
+
+    def test_iter_lines_across_chunks(self):
+        text = 'first\r\nsecond \u2603\n\nlast'
+        for size in (1, 2, 4, 100):
+            with self.subTest(size=size):
+                self.assertEqual(list(iter_lines(chunked(text.encode('utf-8'), size))),
+                                 ['first', 'second \u2603', '', 'last'])
+
+    def test_empty_and_malformed_files(self):
+        self.assertEqual(self.records(''), [])
+        self.assertEqual(self.records('   \n'), [])
+        self.assertEqual(self.scanner.parse_dependencies('{"dependencies": {"a": '), [])
+        with self.assertRaises(ValueError):
+            self.records('{"dependencies": {"a": ')
+
+
+@override_settings(SCANNER_HTTP={'CACHE': False})
+class DownloadStatsTests(SimpleTestCase):
+    def test_bulk_query(self):
+        scanner = NPMPackageScanner()
+        body = {'a': {'downloads': 5, 'package': 'a'}, 'b': None}
+        cases = [
+            (mock.Mock(status_code=200, json=mock.Mock(return_value=body)),
+             {'a': body['a'], 'b': {'downloads': 0, 'package': 'b'}}),
+            (mock.Mock(status_code=200, json=mock.Mock(return_value=[1, 2])), {'a': None, 'b': None}),
+            (mock.Mock(status_code=200, json=mock.Mock(side_effect=ValueError)), {'a': None, 'b': None}),
+            (mock.Mock(status_code=503), {'a': None, 'b': None}),
+            (requests.ConnectionError(), {'a': None, 'b': None}),
+        ]
+        for response, expected in cases:
+            with self.subTest(response=response), mock.patch.object(scanner.session, 'get', side_effect=[response]):
+                self.assertEqual(scanner._fetch_download_stats_chunk(['a', 'b']), expected)
+
+
+class TyposquatIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = TyposquatIndex()
+        self.index.add('npm', [('lodash', 100), ('chalk', 90), ('react-dom', 80), ('express', 70),
+                               ('lodash.merge', 10), ('@babel/core', 60)])
+
+    def test_edit_distance(self):
+        cases = [
+            ('lodash', 'lodash', 0),
+            ('lodahs', 'lodash', 1),  # Adjacent swap
+            ('lodas', 'lodash', 1),
+            ('lodashh', 'lodash', 1),
+            ('lodesh', 'lodash', 1),
+            ('ldoahs', 'lodash', 2),
+            ('lodash', 'l', 3),  # limit + 1 beyond the limit
+        ]
+        for a, b, expected in cases:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(edit_distance(a, b, 2), expected)
+                self.assertEqual(edit_distance(b, a, 2), expected)
+
+    def test_lookup(self):
+        cases = [
+            ('lodahs', 'lodash'),
+            ('1odash', 'lodash'),
+            ('LODASH-', 'lodash'),
+            ('expres', 'express'),
+            ('react-dmo', 'react-dom'),
+            ('@babel/cor', '@babel/core'),
+            # Indexed names, names too short to judge and names too far off are not flagged
+            ('lodash', None),
+            ('Chalk', None),
+            ('chal', None),
+            ('left-pad', None),
+            ('lodash.mergeall', None),
+            ('', None),
+            (None, None),
+        ]
+        for name, expected in cases:
+            with self.subTest(name=name):
+                self.assertEqual(self.index.lookup('npm', name), expected)
+        self.assertIsNone(self.index.lookup('pypi', 'lodahs'))
+
+    def test_most_popular_match_wins(self):
+        self.index.add('npm', [('chalky', 95), ('chalk', 5)])
+        # chalk kept its higher popularity of 90
+        self.assertEqual(self.index.names['npm']['chalk'], 90)
+        self.assertEqual(self.index.lookup('npm', 'chalkx'), 'chalky')
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'typosquat_index.json.gz')
+            self.index.save(path)
+            loaded = TyposquatIndex.load(path)
+        self.assertEqual(loaded.lookup('npm', 'lodahs'), 'lodash')
+        self.assertEqual(loaded.names, self.index.names)
+        self.assertEqual(loaded.stats(), self.index.stats())
+
+    def test_load_rejects_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'typosquat_index.json.gz')
+            contents = (b'', b'not gzip', gzip.compress(b'{"format": 0}'), gzip.compress(b'{"format": 1}'),
+                        gzip.compress(b'[1, 2'))
+            for content in contents:
+                with self.subTest(content=content[:12]):
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                    with self.assertRaises(ValueError):
+                        TyposquatIndex.load(path)
+
+    def test_unreadable_rebuild_keeps_the_last_good_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'typosquat_index.json.gz')
+            self.index.save(path)
+            with override_settings(TYPOSQUAT_INDEX_PATH=path):
+                self.addCleanup(setattr, typosquat_index, '_typosquat_index', None)
+                self.assertEqual(get_typosquat_index().version, self.index.version)
+
+                with open(path, 'wb') as f:
+                    f.write(b'half a file')
+                os.utime(path, ns=(1, 1))
+                with self.assertLogs(typosquat_index.logger, 'ERROR'):
+                    index = get_typosquat_index()
+                self.assertEqual(index.version, self.index.version)
+                self.assertEqual(index.lookup('npm', 'lodahs'), 'lodash')
+
+    def test_bundled_lists(self):
+        index = build_bundled_index()
+        self.assertEqual(index.lookup('npm', 'expresss'), 'express')
+        self.assertIsNone(index.lookup('npm', 'express'))
+
+    @override_settings(TYPOSQUAT_INDEX_PATH=None, TYPOSQUAT_MAX_DOWNLOADS=100000,
+                       SCANNER_HTTP={'CACHE': False})
+    def test_popular_packages_are_not_flagged(self):
+        scanner = NPMPackageScanner()
+        cases = [
+            (50, 'react'),
+            ({'downloads': 100000}, 'react'),
+            ({'downloads': 100001}, None),
+            (3000000, None),
+        ]
+        for downloads, expected in cases:
+            with self.subTest(downloads=downloads):
+                package_info = {'name': 'preact'}
+                scanner._annotate_typosquat(package_info)
+                scanner.set_download_stats(package_info, downloads)
+                self.assertEqual(package_info['typosquat_of'], expected)
+                self.assertEqual(package_info['downloads'], downloads)
+
+
+def advisory(advisory_id, name, ranges=(), versions=(), **fields):
+    """A minimal OSV advisory for an npm package"""
+    return dict({
+        'id': advisory_id,
+        'affected': [{
+            'package': {'ecosystem': 'npm', 'name': name},
+            'ranges': [{'type': 'SEMVER', 'events': list(events)} for events in ranges],
+            'versions': list(versions),
+        }],
+    }, **fields)
+
+
+class VulnerabilityIndexTests(SimpleTestCase):
+    def setUp(self):
+        self.index = VulnerabilityIndex()
+        self.index.update([
+            ('a.json', (1,), lambda: advisory(
+                'GHSA-1', 'minimist', ranges=[[{'introduced': '0'}, {'fixed': '0.2.1'}],
+                                              [{'introduced': '1.0.0'}, {'fixed': '1.2.6'}]],
+                database_specific={'severity': 'MODERATE'},
+            )),
+            ('b.json', (1,), lambda: advisory(
+                'GHSA-2', 'Minimist', ranges=[[{'introduced': '1.2.0'}, {'last_affected': '1.2.5'}]],
+            )),
+            ('c.json', (1,), lambda: advisory('GHSA-3', 'left-pad', versions=['1.0.0', 'weird-build'])),
+            ('d.json', (1,), lambda: advisory('GHSA-4', 'request', ranges=[[{'introduced': '2.0.0'}]])),
+        ])
+
+    def ids(self, name, version):
+        return [found['id'] for found in self.index.lookup('npm', name, version)]
+
+    def test_lookup(self):
+        cases = [
+            ('minimist', '0.0.8', ['GHSA-1']),
+            ('minimist', '0.2.1', []),
+            ('minimist', '1.1.0', ['GHSA-1']),
+            ('minimist', '1.2.0', ['GHSA-1', 'GHSA-2']),
+            ('minimist', '1.2.5', ['GHSA-1', 'GHSA-2']),
+            ('minimist', '1.2.6', []),
+            ('MINIMIST', '1.2.3', ['GHSA-1', 'GHSA-2']),
+            ('left-pad', '1.0.0', ['GHSA-3']),
+            ('left-pad', '1.0', ['GHSA-3']),
+            ('left-pad', '1.0.1', []),
+            ('left-pad', 'weird-build', ['GHSA-3']),
+            ('request', '1.9.9', []),
+            ('request', '99.0.0', ['GHSA-4']),
+            ('minimist', '', []),
+            ('minimist', None, []),
+            ('lodash', '1.0.0', []),
+        ]
+        for name, version, expected in cases:
+            with self.subTest(name=name, version=version):
+                self.assertEqual(self.ids(name, version), expected)
+
+    def test_advisory_fields(self):
+        found = self.index.lookup('npm', 'minimist', '1.0.0')[0]
+        self.assertEqual(found['id'], 'GHSA-1')
+        self.assertEqual(found['severity'], 'medium')
+
+    def test_incremental_update(self):
+        version = self.index.version
+        counts = self.index.update([
+            ('a.json', (1,), lambda: self.fail('unchanged sources are not read')),
+            ('b.json', (2,), lambda: advisory('GHSA-2', 'minimist', withdrawn='2024-01-01')),
+            ('c.json', (2,), lambda: advisory('GHSA-3', 'left-pad', versions=['1.0.1'])),
+            ('d.json', (1,), lambda: self.fail('unchanged sources are not read')),
+            ('e.json', (1,), lambda: {'summary': 'no id'}),
+        ])
+        self.assertEqual(counts, {'added': 0, 'updated': 2, 'unchanged': 2, 'removed': 0, 'invalid': 1})
+        self.assertNotEqual(self.index.version, version)
+        self.assertEqual(self.ids('minimist', '1.2.3'), ['GHSA-1'])
+        self.assertEqual(self.ids('left-pad', '1.0.0'), [])
+        self.assertEqual(self.ids('left-pad', '1.0.1'), ['GHSA-3'])
+
+        counts = self.index.update([('a.json', (1,), lambda: None)], prune=True)
+        self.assertEqual(counts['removed'], 3)
+        self.assertEqual(self.ids('request', '2.0.0'), [])
+        self.assertEqual(self.index.stats()['advisories'], 1)
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.json.gz')
+            self.index.save(path)
+            loaded = VulnerabilityIndex.load(path)
+        self.assertEqual(loaded.version, self.index.version)
+        self.assertEqual(loaded.stats(), self.index.stats())
+        for name, version in (('minimist', '1.2.3'), ('left-pad', 'weird-build'), ('request', '3.0.0')):
+            with self.subTest(name=name, version=version):
+                self.assertEqual(loaded.lookup('npm', name, version), self.index.lookup('npm', name, version))
+        # A reloaded index keeps updating incrementally
+        counts = loaded.update([('a.json', (1,), lambda: self.fail('unchanged sources are not read'))])
+        self.assertEqual(counts['unchanged'], 1)
+
+    def test_load_rejects_other_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.json.gz')
+            for content in (b'', b'not gzip', gzip.compress(b'{"format": 0}'), gzip.compress(b'[1, 2')):
+                with self.subTest(content=content[:12]):
+                    with open(path, 'wb') as f:
+                        f.write(content)
+                    with self.assertRaises(ValueError):
+                        VulnerabilityIndex.load(path)
+
+    def test_unreadable_rebuild_keeps_the_last_good_index(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'index.json.gz')
+            self.index.save(path)
+            with override_settings(VULN_INDEX_PATH=path):
+                self.addCleanup(setattr, vulnerability_index, '_vulnerability_index', None)
+                self.assertEqual(get_vulnerability_index().version, self.index.version)
+
+                with open(path, 'wb') as f:
+                    f.write(b'half a file')
+                os.utime(path, ns=(1, 1))
+                with self.assertLogs(vulnerability_index.logger, 'ERROR'):
+                    index = get_vulnerability_index()
+                self.assertEqual(index.version, self.index.version)
+                self.assertEqual(len(index.lookup('npm', 'minimist', '1.2.3')), 2)
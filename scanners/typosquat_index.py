@@ -0,0 +1,212 @@
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, Optional, Set, Tuple
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the saved layout changes; older files have to be rebuilt
+FILE_FORMAT = 1
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+# Bundled reference lists, most popular first, one name per line
+BUNDLED_LISTS = {
+    'npm': os.path.join(DATA_DIR, 'popular_npm.txt'),
+}
+
+
+def get_typosquat_max_downloads() -> int:
+    """Weekly downloads above which a package is never flagged as a near miss of another"""
+    return getattr(settings, 'TYPOSQUAT_MAX_DOWNLOADS', 100000)
+
+
+def _deletes(name: str, distance: int) -> Set[str]:
+    """name and every string made by deleting up to distance characters from it"""
+    found = {name}
+    frontier = {name}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance (an adjacent swap is one edit), or limit + 1 beyond limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class TyposquatIndex:
+    """Popular package names per ecosystem, searchable by edit distance
+
+    Symmetric deletion: every name is filed under itself and each string
+    made by deleting up to max_distance of its characters. A lookup probes
+    the same deletions of the queried name, so it costs a few dozen dict
+    lookups however many names are indexed; the candidates found are
+    confirmed with edit_distance.
+    """
+
+    def __init__(self, max_distance: int = 1, min_length: int = 5):
+        self.max_distance = max_distance
+        # Shorter names are a letter apart from too many others to tell anything
+        self.min_length = min_length
+        self.version = ''
+        # {ecosystem: {name: popularity}}
+        self.names: Dict[str, Dict[str, int]] = {}
+        # {ecosystem: {deletion: names filed under it}}
+        self._deletes: Dict[str, Dict[str, Tuple[str, ...]]] = {}
+
+    def add(self, ecosystem: str, names: Iterable[Tuple[str, int]]):
+        """Index (name, popularity) pairs; a name seen twice keeps its higher popularity"""
+        ecosystem = ecosystem.lower()
+        known = self.names.setdefault(ecosystem, {})
+        deletes = self._deletes.setdefault(ecosystem, {})
+        for name, popularity in names:
+            name = name.strip().lower()
+            if not name:
+                continue
+            if name in known:
+                known[name] = max(known[name], popularity)
+                continue
+            known[name] = popularity
+            for deletion in _deletes(name, self.max_distance):
+                deletes[deletion] = deletes.get(deletion, ()) + (name,)
+        self.version = f"{time.time():.6f}"
+
+    def lookup(self, ecosystem: str, name: str) -> Optional[str]:
+        """The most popular indexed name within max_distance edits of name, if name is not indexed itself"""
+        name = str(name or '').lower()
+        known = self.names.get(ecosystem.lower())
+        if not known or len(name) < self.min_length or name in known:
+            return None
+        deletes = self._deletes[ecosystem.lower()]
+
+        candidates = set()
+        for deletion in _deletes(name, self.max_distance):
+            candidates.update(deletes.get(deletion, ()))
+        matches = [
+            candidate for candidate in candidates
+            if edit_distance(name, candidate, self.max_distance) <= self.max_distance
+        ]
+        if not matches:
+            return None
+        return max(matches, key=lambda candidate: (known[candidate], candidate))
+
+    def stats(self) -> Dict:
+        return {
+            'version': self.version,
+            'max_distance': self.max_distance,
+            'names': {ecosystem: len(names) for ecosystem, names in self.names.items()},
+            'deletions': sum(len(deletes) for deletes in self._deletes.values()),
+        }
+
+    def save(self, path: str):
+        """Write the index as gzipped JSON, atomically so running processes never read half a file
+
+        Only the names and their popularity are written; the deletions are
+        recomputed on load.
+        """
+        document = {
+            'format': FILE_FORMAT,
+            'version': self.version,
+            'max_distance': self.max_distance,
+            'min_length': self.min_length,
+            'names': {
+                ecosystem: sorted(names.items(), key=lambda item: (-item[1], item[0]))
+                for ecosystem, names in self.names.items()
+            },
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'TyposquatIndex':
+        """Read an index written by save(); ValueError or OSError for anything else"""
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                document = json.load(f)
+        except (EOFError, gzip.BadGzipFile, zlib.error, UnicodeDecodeError) as e:
+            raise ValueError(f"{path} is not a typosquat index: {e}")
+        if not isinstance(document, dict) or document.get('format') != FILE_FORMAT:
+            raise ValueError(f"{path} is not a typosquat index of format {FILE_FORMAT}")
+
+        try:
+            index = cls(max_distance=int(document['max_distance']), min_length=int(document['min_length']))
+            for ecosystem, names in document['names'].items():
+                index.add(ecosystem, ((str(name), int(popularity)) for name, popularity in names))
+        except (KeyError, TypeError, ValueError, AttributeError) as e:
+            raise ValueError(f"{path} is not a valid typosquat index: {e!r}")
+        index.version = document.get('version', '')
+        return index
+
+
+def iter_name_list(path: str) -> Iterator[Tuple[str, int]]:
+    """(name, popularity) from a file of names, most popular first; # starts a comment"""
+    with open(path, encoding='utf-8') as f:
+        names = [line.split('#', 1)[0].strip() for line in f]
+    names = [name for name in names if name]
+    for rank, name in enumerate(names):
+        yield name, len(names) - rank
+
+
+def build_bundled_index(max_distance: int = 1) -> TyposquatIndex:
+    """An index of the reference lists shipped in scanners/data"""
+    index = TyposquatIndex(max_distance=max_distance)
+    for ecosystem, path in BUNDLED_LISTS.items():
+        if os.path.exists(path):
+            index.add(ecosystem, iter_name_list(path))
+    return index
+
+
+_typosquat_index = None
+_typosquat_index_mtime = None
+_typosquat_index_lock = threading.Lock()
+
+
+def get_typosquat_index() -> TyposquatIndex:
+    """Process-wide index from TYPOSQUAT_INDEX_PATH, reloaded when the file is rebuilt
+
+    Without a built file, the bundled lists are indexed once per process. A
+    file that cannot be read is logged once and the last good index (or the
+    bundled lists) stays in use, so a bad rebuild never fails scans.
+    """
+    global _typosquat_index, _typosquat_index_mtime
+    path = getattr(settings, 'TYPOSQUAT_INDEX_PATH', None)
+    try:
+        mtime = os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        mtime = None
+
+    if _typosquat_index is None or mtime != _typosquat_index_mtime:
+        with _typosquat_index_lock:
+            if _typosquat_index is None or mtime != _typosquat_index_mtime:
+                try:
+                    index = TyposquatIndex.load(path) if mtime else build_bundled_index()
+                except (OSError, ValueError):
+                    logger.exception("Could not load the typosquat index %s; keeping the last good one", path)
+                    index = _typosquat_index or build_bundled_index()
+                _typosquat_index = index
+                _typosquat_index_mtime = mtime
+    return _typosquat_index
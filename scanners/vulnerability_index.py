@@ -0,0 +1,390 @@
+import bisect
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import zipfile
+import zlib
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+
+from .semver import parse_version, version_key
+
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the saved layout changes; older files are rebuilt from scratch
+FILE_FORMAT = 1
+
+# Interval bounds sit between versions: (key, 0) is just below a version and
+# (key, 2) just above it, while the version itself is the point (key, 1)
+MIN_BOUND = ((-1, 0, 0, (1,)), 0)
+MAX_BOUND = ((float('inf'), 0, 0, (1,)), 0)
+
+SEVERITY_ALIASES = {'moderate': 'medium'}
+RANGE_TYPES = ('SEMVER', 'ECOSYSTEM')
+
+Bound = Tuple[Tuple, int]
+Span = Tuple[Bound, Bound]
+
+
+def _version_bound_key(version: str) -> Optional[Tuple]:
+    """Sort key of a version, accepting "1.2" style versions as well as semver"""
+    parsed = parse_version(version)
+    if parsed is None:
+        parts = str(version).split('.')
+        if not 1 <= len(parts) <= 3 or not all(part.isdigit() for part in parts):
+            return None
+        parts = [int(part) for part in parts] + [0] * (3 - len(parts))
+        parsed = (parts[0], parts[1], parts[2], ())
+    return version_key(parsed)
+
+
+def _package_key(ecosystem: str, name: str) -> Tuple[str, str]:
+    return ecosystem.lower(), name.lower()
+
+
+def _range_spans(events: List[Dict]) -> Optional[List[Span]]:
+    """Affected intervals of one OSV range, or None if a version cannot be ordered"""
+    keyed = []
+    for event in events:
+        kind, value = next(iter(event.items()), (None, None))
+        if kind not in ('introduced', 'fixed', 'last_affected'):
+            continue
+        key = MIN_BOUND[0] if kind == 'introduced' and value == '0' else _version_bound_key(value)
+        if key is None:
+            return None
+        keyed.append((key, kind))
+
+    spans = []
+    start = None
+    for key, kind in sorted(keyed, key=lambda item: item[0]):
+        if kind == 'introduced':
+            if start is None:
+                start = (key, 0)
+        elif start is not None:
+            spans.append((start, (key, 0) if kind == 'fixed' else (key, 2)))
+            start = None
+    if start is not None:
+        spans.append((start, MAX_BOUND))
+    return spans
+
+
+def _tuples(value):
+    """JSON lists back into the tuples bounds and signatures are compared as"""
+    if isinstance(value, list):
+        return tuple(_tuples(item) for item in value)
+    return value
+
+
+def _segments(intervals: Dict[str, List[Span]]):
+    """Flatten overlapping advisory intervals into sorted, disjoint segments"""
+    events = {}
+    for advisory_id, spans in intervals.items():
+        for start, end in spans:
+            if start < end:
+                events.setdefault(start, []).append((advisory_id, 1))
+                events.setdefault(end, []).append((advisory_id, -1))
+
+    starts, ends, members = [], [], []
+    active = Counter()
+    bounds = sorted(events)
+    for bound, next_bound in zip(bounds, bounds[1:] + [None]):
+        for advisory_id, delta in events[bound]:
+            active[advisory_id] += delta
+        covering = tuple(sorted(a for a, count in active.items() if count > 0))
+        if not covering or next_bound is None:
+            continue
+        if ends and ends[-1] == bound and members[-1] == covering:
+            ends[-1] = next_bound
+        else:
+            starts.append(bound)
+            ends.append(next_bound)
+            members.append(covering)
+    return starts, ends, members
+
+
+class VulnerabilityIndex:
+    """In-memory index of OSV advisories keyed by (ecosystem, package)
+
+    Each package's affected ranges are flattened into sorted, disjoint
+    version segments, so checking a version is a binary search instead of a
+    scan over every advisory. Versions that cannot be ordered are matched
+    exactly.
+    """
+
+    def __init__(self):
+        self.version = ''
+        self.advisories: Dict[str, Dict] = {}
+        # Source file -> (signature, advisory id), for incremental rebuilds
+        self.sources: Dict[str, Tuple] = {}
+        self._intervals: Dict[Tuple, Dict[str, List[Span]]] = {}
+        self._exact: Dict[Tuple, Dict[str, set]] = {}
+        self._packages: Dict[str, set] = {}
+        self._segments: Dict[Tuple, Tuple] = {}
+        self._dirty = set()
+
+    def lookup(self, ecosystem: str, package_name: str, version: Optional[str]) -> List[Dict]:
+        """Advisories affecting one package version"""
+        if not version or not package_name:
+            return []
+        key = _package_key(ecosystem, package_name)
+        matches = set(self._exact.get(key, {}).get(version, ()))
+
+        segments = self._segments.get(key)
+        version_key_ = _version_bound_key(version) if segments else None
+        if version_key_ is not None:
+            starts, ends, members = segments
+            point = (version_key_, 1)
+            i = bisect.bisect_right(starts, point) - 1
+            if i >= 0 and point < ends[i]:
+                matches.update(members[i])
+
+        return [self.advisories[advisory_id] for advisory_id in sorted(matches)]
+
+    def add_advisory(self, data: Dict) -> Optional[str]:
+        """Index one OSV advisory, replacing any earlier copy; withdrawn ones are removed"""
+        advisory_id = data.get('id')
+        if not advisory_id:
+            return None
+        self.remove_advisory(advisory_id)
+        if data.get('withdrawn'):
+            return advisory_id
+
+        packages = set()
+        for affected in data.get('affected', []):
+            package = affected.get('package') or {}
+            if not package.get('ecosystem') or not package.get('name'):
+                continue
+            key = _package_key(package['ecosystem'], package['name'])
+
+            spans = []
+            for affected_range in affected.get('ranges', []):
+                if affected_range.get('type') in RANGE_TYPES:
+                    spans.extend(_range_spans(affected_range.get('events', [])) or [])
+            for version in affected.get('versions', []):
+                bound_key = _version_bound_key(version)
+                if bound_key is None:
+                    self._exact.setdefault(key, {}).setdefault(version, set()).add(advisory_id)
+                else:
+                    spans.append(((bound_key, 0), (bound_key, 2)))
+
+            if spans:
+                self._intervals.setdefault(key, {}).setdefault(advisory_id, []).extend(spans)
+            packages.add(key)
+
+        severity = str((data.get('database_specific') or {}).get('severity', '')).lower()
+        self.advisories[advisory_id] = {
+            'id': advisory_id,
+            'aliases': data.get('aliases', []),
+            'summary': data.get('summary', ''),
+            'severity': SEVERITY_ALIASES.get(severity, severity),
+            'modified': data.get('modified', ''),
+        }
+        self._packages[advisory_id] = packages
+        self._dirty.update(packages)
+        return advisory_id
+
+    def remove_advisory(self, advisory_id: str):
+        """Drop an advisory from the index"""
+        self.advisories.pop(advisory_id, None)
+        for key in self._packages.pop(advisory_id, ()):
+            self._intervals.get(key, {}).pop(advisory_id, None)
+            for ids in self._exact.get(key, {}).values():
+                ids.discard(advisory_id)
+            self._dirty.add(key)
+
+    def update(self, documents: Iterable[Tuple[str, Tuple, Callable[[], Dict]]],
+               prune: bool = False) -> Dict[str, int]:
+        """Apply (source, signature, loader) documents, parsing only changed sources
+
+        With prune, advisories whose source was not seen are removed.
+        """
+        counts = {'added': 0, 'updated': 0, 'unchanged': 0, 'removed': 0, 'invalid': 0}
+        seen = set()
+
+        for source, signature, load in documents:
+            seen.add(source)
+            previous = self.sources.get(source)
+            if previous is not None and previous[0] == signature:
+                counts['unchanged'] += 1
+                continue
+            try:
+                data = load()
+            except (ValueError, OSError):
+                counts['invalid'] += 1
+                continue
+            if previous is not None and previous[1] != data.get('id'):
+                self.remove_advisory(previous[1])
+            advisory_id = self.add_advisory(data)
+            if advisory_id is None:
+                counts['invalid'] += 1
+                continue
+            self.sources[source] = (signature, advisory_id)
+            counts['updated' if previous is not None else 'added'] += 1
+
+        if prune:
+            for source in set(self.sources) - seen:
+                self.remove_advisory(self.sources.pop(source)[1])
+                counts['removed'] += 1
+
+        self._build()
+        return counts
+
+    def _build(self):
+        """Recompute the segments of every package touched since the last build"""
+        for key in self._dirty:
+            intervals = {a: spans for a, spans in self._intervals.get(key, {}).items() if spans}
+            if intervals:
+                self._intervals[key] = intervals
+                self._segments[key] = _segments(intervals)
+            else:
+                self._intervals.pop(key, None)
+                self._segments.pop(key, None)
+
+            exact = {v: ids for v, ids in self._exact.get(key, {}).items() if ids}
+            if exact:
+                self._exact[key] = exact
+            else:
+                self._exact.pop(key, None)
+        if self._dirty:
+            self.version = f"{time.time():.6f}"
+        self._dirty = set()
+
+    def stats(self) -> Dict:
+        """Index size"""
+        return {
+            'version': self.version,
+            'advisories': len(self.advisories),
+            'packages': len(set(self._segments) | set(self._exact)),
+            'segments': sum(len(starts) for starts, _, _ in self._segments.values()),
+            'sources': len(self.sources),
+        }
+
+    def save(self, path: str):
+        """Write the index as gzipped JSON, atomically so running processes never read half a file
+
+        Only plain data is written; the segments are recomputed on load.
+        """
+        self._build()
+        document = {
+            'format': FILE_FORMAT,
+            'version': self.version,
+            'advisories': self.advisories,
+            'sources': self.sources,
+            'packages': {advisory_id: sorted(keys) for advisory_id, keys in self._packages.items()},
+            'intervals': [[key, intervals] for key, intervals in self._intervals.items()],
+            'exact': [
+                [key, {version: sorted(ids) for version, ids in exact.items()}]
+                for key, exact in self._exact.items()
+            ],
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(document, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'VulnerabilityIndex':
+        """Read an index written by save(); ValueError or OSError for anything else"""
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                document = json.load(f)
+        except (EOFError, gzip.BadGzipFile, zlib.error, UnicodeDecodeError) as e:
+            raise ValueError(f"{path} is not a vulnerability index: {e}")
+        if not isinstance(document, dict) or document.get('format') != FILE_FORMAT:
+            raise ValueError(f"{path} is not a vulnerability index of format {FILE_FORMAT}")
+
+        index = cls()
+        try:
+            index.advisories = document['advisories']
+            index.sources = {source: _tuples(entry) for source, entry in document['sources'].items()}
+            index._packages = {
+                advisory_id: {tuple(key) for key in keys} for advisory_id, keys in document['packages'].items()
+            }
+            index._intervals = {
+                tuple(key): {advisory_id: list(_tuples(spans)) for advisory_id, spans in intervals.items()}
+                for key, intervals in document['intervals']
+            }
+            index._exact = {
+                tuple(key): {version: set(ids) for version, ids in exact.items()}
+                for key, exact in document['exact']
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"{path} is not a valid vulnerability index: {e!r}")
+        index._dirty = set(index._intervals) | set(index._exact)
+        index._build()
+        index.version = document.get('version', '')
+        return index
+
+
+def iter_osv_documents(path: str) -> Iterator[Tuple[str, Tuple, Callable[[], Dict]]]:
+    """OSV advisories from a directory of JSON files or a zip dump such as npm/all.zip"""
+    path = os.path.abspath(str(path))
+
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for member in archive.infolist():
+                if member.filename.endswith('.json'):
+                    yield (
+                        f"{path}:{member.filename}",
+                        (member.CRC, member.file_size),
+                        lambda member=member: json.loads(archive.read(member)),
+                    )
+        return
+
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        yield path, (stat.st_mtime_ns, stat.st_size), lambda: _read_json(path)
+        return
+
+    for root, _, files in os.walk(path):
+        for filename in sorted(files):
+            if filename.endswith('.json'):
+                file_path = os.path.join(root, filename)
+                stat = os.stat(file_path)
+                yield (
+                    file_path,
+                    (stat.st_mtime_ns, stat.st_size),
+                    lambda file_path=file_path: _read_json(file_path),
+                )
+
+
+def _read_json(path: str) -> Dict:
+    with open(path, 'rb') as f:
+        return json.load(f)
+
+
+_vulnerability_index = None
+_vulnerability_index_mtime = None
+_vulnerability_index_lock = threading.Lock()
+
+
+def get_vulnerability_index() -> VulnerabilityIndex:
+    """Process-wide index from VULN_INDEX_PATH, reloaded when the file is rebuilt
+
+    A file that cannot be read is logged once and the last good index (or an
+    empty one) stays in use, so a bad rebuild never fails scans.
+    """
+    global _vulnerability_index, _vulnerability_index_mtime
+    path = getattr(settings, 'VULN_INDEX_PATH', None)
+    try:
+        mtime = os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        mtime = None
+
+    if _vulnerability_index is None or mtime != _vulnerability_index_mtime:
+        with _vulnerability_index_lock:
+            if _vulnerability_index is None or mtime != _vulnerability_index_mtime:
+                try:
+                    index = VulnerabilityIndex.load(path) if mtime else VulnerabilityIndex()
+                except (OSError, ValueError):
+                    logger.exception("Could not load the vulnerability index %s; keeping the last good one", path)
+                    index = _vulnerability_index or VulnerabilityIndex()
+                _vulnerability_index = index
+                _vulnerability_index_mtime = mtime
+    return _vulnerability_index